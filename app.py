@@ -10,26 +10,25 @@ Kaohsiung Air Quality Spatial-Temporal Analysis System
 作者: Urban Innofix Lab
 """
 
+import json
 import os
-import tempfile
+import time
 import warnings
-import zipfile
 from datetime import date, datetime
-from io import BytesIO
-from pathlib import Path
 
-import matplotlib.pyplot as plt
-import numpy as np
-import pandas as pd
 import streamlit as st
-from matplotlib.colors import BoundaryNorm, LinearSegmentedColormap
-from scipy.ndimage import gaussian_filter
 
-warnings.filterwarnings('ignore')
+from kaohsiung_aq.cache import get_stage_cache
+from kaohsiung_aq.config import PLOT_CONFIGS, TIME_AGG_MAPPING, TIME_PERIODS
+from kaohsiung_aq.jobs import get_job_runner
+from kaohsiung_aq.parallel import default_jobs
+from kaohsiung_aq.pipeline import AnalysisError, make_params, memory_summary, run_pipeline
+from kaohsiung_aq.profiling import Profiler
+from kaohsiung_aq.progressive import ProgressiveRun
+from kaohsiung_aq.results import ZIP_MODES, LazyResults, ResultStore
+from kaohsiung_aq.wind import WIND_MODES
 
-# 設定 Matplotlib 字型
-plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'Arial Unicode MS', 'sans-serif']
-plt.rcParams['axes.unicode_minus'] = False
+warnings.filterwarnings('ignore')
 
 # ========================================
 # 頁面配置
@@ -40,18 +39,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ========================================
-# 定義選項映射
-# ========================================
-TIME_AGG_MAPPING = {
-    'hourly': '每小時',
-    'daily': '每日',
-    'weekly': '每週',
-    'monthly': '每月',
-    'seasonal': '每季',
-    'yearly': '每年'
-}
-
 # ========================================
 # CSS 樣式設計
 # ========================================
@@ -265,73 +252,6 @@ st.markdown("""
 st.markdown('<div class="main-header">高雄新市鎮空氣污染分析系統</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-header">Kaohsiung Air Quality Spatial-Temporal Analysis System</div>', unsafe_allow_html=True)
 
-# ========================================
-# 時段定義
-# ========================================
-TIME_PERIODS = {
-    'all': {'name': '全時段 (00:00-23:00)', 'hours': list(range(24))},
-    'dawn': {'name': '清晨 (05:00-07:00)', 'hours': [5, 6]},
-    'morning_peak': {'name': '早上 (07:00-09:00)', 'hours': [7, 8]},
-    'noon': {'name': '午間 (12:00-14:00)', 'hours': [12, 13]},
-    'evening_peak': {'name': '傍晚 (17:00-19:00)', 'hours': [17, 18]},
-    'night': {'name': '夜間 (20:00-22:00)', 'hours': [20, 21]},
-    'midnight': {'name': '深夜 (22:00-05:00)', 'hours': [22, 23, 0, 1, 2, 3, 4]}
-}
-
-# ========================================
-# 圖表配置
-# ========================================
-PLOT_CONFIGS = {
-    'pm25': {
-        'value_col': 'pm25_mean',
-        'title': 'PM2.5 空間分布',
-        'unit': 'μg/m³',
-        'colors': ['#00e400', '#92d050', '#ffff00', '#ff9900', '#ff0000', '#990033'],
-        'levels': [0, 12, 24, 36, 48, 60, 80],
-        'use_wind': True,
-    },
-    'temperature': {
-        'value_col': 'temperature_mean',
-        'title': '溫度空間分布',
-        'unit': '°C',
-        'colors': ['#0000ff', '#00ffff', '#00ff00', '#ffff00', '#ff0000'],
-        'levels': [15, 20, 25, 30, 35, 40],
-        'use_wind': False,
-    },
-    'humidity': {
-        'value_col': 'humidity_mean',
-        'title': '濕度空間分布',
-        'unit': '%',
-        'colors': ['#8B4513', '#D2691E', '#F4A460', '#87CEEB', '#4682B4', '#000080'],
-        'levels': [30, 40, 50, 60, 70, 80, 90],
-        'use_wind': False,
-    },
-    'pm25_variability': {
-        'value_col': 'pm25_cv',
-        'title': 'PM2.5 變異係數',
-        'unit': '%',
-        'colors': ['#00ff00', '#ffff00', '#ff9900', '#ff0000'],
-        'levels': [0, 10, 20, 30, 40, 50],
-        'use_wind': False,
-    },
-    'pm25_exceed': {
-        'value_col': 'pm25_exceeds_35_pct',
-        'title': 'PM2.5 超標比例',
-        'unit': '%',
-        'colors': ['#00ff00', '#ffff00', '#ff9900', '#ff0000', '#990033'],
-        'levels': [0, 10, 25, 50, 75, 100],
-        'use_wind': False,
-    },
-    'wind_field': {
-        'value_col': 'pm25_mean',
-        'title': '風場向量圖',
-        'unit': '',
-        'colors': ['#00e400', '#92d050', '#ffff00', '#ff9900', '#ff0000', '#990033'],
-        'levels': [0, 12, 24, 36, 48, 60, 80],
-        'use_wind': True,
-    }
-}
-
 # ========================================
 # 側邊欄 - 參數設定
 # ========================================
@@ -339,6 +259,11 @@ with st.sidebar:
     st.markdown('<div class="sidebar-header">1. 資料來源</div>', unsafe_allow_html=True)
     data_dir = st.text_input("資料目錄", value="data")
     station_file = st.text_input("測站檔案", value="data/Kaohsiung_iot_station.csv")
+    use_data_cache = st.checkbox("使用資料快取 (Parquet)", value=True)
+    # deviceId 類別、float32 量測值與整數時間區段代碼，多年度逐時資料時明顯減少記憶體
+    compact_schema = st.checkbox("精簡資料型別 (節省記憶體)", value=False)
+    # 每日以上的時間聚合改由每月預先彙總的統計計算 (需啟用資料快取)
+    use_rollups = st.checkbox("使用預先彙總 (每日以上)", value=True)
     
     st.markdown('<div class="sidebar-header">2. 時間範圍</div>', unsafe_allow_html=True)
     
@@ -348,7 +273,6 @@ with st.sidebar:
         horizontal=True
     )
     
-    selected_years_to_load = []
     filter_criteria = {}
     
     if time_filter_mode == "依年份/月份":
@@ -366,7 +290,6 @@ with st.sidebar:
             format_func=lambda x: f"{x}月"
         )
         
-        selected_years_to_load = selected_years
         filter_criteria = {
             'mode': 'year_month',
             'years': selected_years,
@@ -383,7 +306,6 @@ with st.sidebar:
         if start_date > end_date:
             st.error("開始日期不能晚於結束日期")
         
-        selected_years_to_load = list(range(start_date.year, end_date.year + 1))
         filter_criteria = {
             'mode': 'date_range',
             'start': start_date,
@@ -430,451 +352,193 @@ with st.sidebar:
         grid_resolution = st.slider("網格解析度", 100, 500, 300, 50)
         diffusion_radius = st.slider("擴散半徑", 0.01, 0.2, 0.05, 0.01)
         wind_influence = st.slider("風向係數", 0.0, 1.0, 0.3, 0.1)
+        wind_mode = st.selectbox(
+            "風向統計",
+            options=list(WIND_MODES.keys()),
+            format_func=lambda x: WIND_MODES[x]
+        )
         png_dpi = st.slider("圖片 DPI", 72, 300, 150, 10)
-
-# ========================================
-# 擴散模型
-# ========================================
-class DenseDiffusionModel:
-    def __init__(self, radius=0.05, wind_influence=0.3, distance_decay=3.0, sigma=0.5):
-        self.radius = radius
-        self.wind_influence = wind_influence
-        self.distance_decay = distance_decay
-        self.sigma = sigma
-    
-    def interpolate(self, sites_data, grid_lon, grid_lat, value_col='pm25_mean', use_wind=False):
-        grid_values = np.zeros_like(grid_lon)
-        total_weights = np.zeros_like(grid_lon)
-        
-        for _, site in sites_data.iterrows():
-            if pd.isna(site[value_col]):
-                continue
-            
-            dx = grid_lon - site['lon']
-            dy = grid_lat - site['lat']
-            distance = np.sqrt(dx**2 + dy**2)
-            
-            weights = np.where(distance < self.radius,
-                              1 / (distance + 0.0001)**self.distance_decay,
-                              0)
-            
-            if use_wind and 'WindDirection_Mean' in site and 'WindSpeed_Mean' in site:
-                if not np.isnan(site['WindDirection_Mean']) and not np.isnan(site['WindSpeed_Mean']):
-                    angle_to_grid = np.degrees(np.arctan2(dy, dx)) % 360
-                    pollution_direction = (site['WindDirection_Mean'] + 180) % 360
-                    angle_diff = np.abs(angle_to_grid - pollution_direction)
-                    angle_diff = np.minimum(angle_diff, 360 - angle_diff)
-                    
-                    wind_factor = np.cos(np.deg2rad(angle_diff))
-                    wind_factor = (wind_factor + 1) / 2
-                    speed_factor = np.tanh(site['WindSpeed_Mean'] / 5)
-                    wind_influence_matrix = 1 + self.wind_influence * wind_factor * speed_factor
-                    
-                    weights *= wind_influence_matrix
-            
-            grid_values += site[value_col] * weights
-            total_weights += weights
+        zip_mode = st.selectbox(
+            "ZIP 打包方式",
+            options=list(ZIP_MODES.keys()),
+            format_func=lambda x: ZIP_MODES[x]
+        )
+        interp_memory_mb = st.slider("插值記憶體上限 (MB)", 8, 512, 32, 8)
         
-        grid_values = np.where(total_weights > 0, 
-                              grid_values / total_weights, 
-                              np.nan)
+        # 快取上限為伺服器設定 (環境變數 AQ_CACHE_MB)，所有使用者共用
+        if st.button("清除分析快取"):
+            get_stage_cache().clear()
         
-        grid_values = gaussian_filter(grid_values, sigma=self.sigma)
+        enable_parallel_render = st.checkbox("平行繪圖 (多程序)", value=False)
+        if enable_parallel_render:
+            render_jobs = st.slider("繪圖程序數", 2, max(2, os.cpu_count() or 2), max(2, default_jobs()))
+        else:
+            render_jobs = 1
         
-        return grid_values
+        # 只插值並保留網格，預覽或下載時才出圖 (逐時等大量圖表時較快看到結果)
+        lazy_render = st.checkbox("延遲出圖 (預覽/下載時才出圖)", value=False)
+        # 先以粗網格與預覽 DPI 出圖，背景精細化至所選解析度後原地替換 (延遲出圖時不適用)
+        progressive_render = st.checkbox("漸進預覽 (先顯示粗網格結果)", value=False)
+        profile_memory = st.checkbox("記錄各階段記憶體峰值 (分析較慢)", value=False)
+
+# 分層快取各階段的顯示名稱
+CACHE_STAGE_LABELS = {
+    'load': '讀取',
+    'rollup': '預先彙總',
+    'clean': '清理',
+    'merge': '測站合併',
+    'grid': '網格/幾何',
+    'periods': '時間聚合',
+    'sites': '測站統計',
+    'interp': '插值',
+}
 
 # ========================================
-# 時間聚合函數
+# 主要分析流程
 # ========================================
-def aggregate_by_time(df, aggregation='daily'):
-    if aggregation == 'hourly':
-        groups = df.groupby('timestamp')
-        time_periods = sorted(df['timestamp'].unique())
-        label_format = lambda t: t.strftime('%Y-%m-%d %H:00')
-    elif aggregation == 'daily':
-        groups = df.groupby('date')
-        time_periods = sorted(df['date'].unique())
-        label_format = lambda d: d.strftime('%Y-%m-%d')
-    elif aggregation == 'weekly':
-        df['year_week'] = df['year'].astype(str) + '-W' + df['week'].astype(str).str.zfill(2)
-        groups = df.groupby('year_week')
-        time_periods = sorted(df['year_week'].unique())
-        label_format = lambda w: w
-    elif aggregation == 'monthly':
-        df['year_month'] = df['year'].astype(str) + '-' + df['month'].astype(str).str.zfill(2)
-        groups = df.groupby('year_month')
-        time_periods = sorted(df['year_month'].unique())
-        label_format = lambda m: m
-    elif aggregation == 'seasonal':
-        groups = df.groupby('year_season')
-        time_periods = sorted(df['year_season'].unique())
-        label_format = lambda s: s
-    elif aggregation == 'yearly':
-        groups = df.groupby('year')
-        time_periods = sorted(df['year'].unique())
-        label_format = lambda y: str(y)
-    else:
-        raise ValueError(f"Unknown aggregation: {aggregation}")
-    
-    return groups, time_periods, label_format
 
-# ========================================
-# 產生圖表函數
-# ========================================
-def generate_plot(period_data, plot_type, plot_config, period_label, 
-                 time_period_key='all', grid_lon_mesh=None, grid_lat_mesh=None,
-                 lon_min=None, lon_max=None, lat_min=None, lat_max=None,
-                 model=None, dpi=150, basemap_style='Standard', alpha=0.6):
-    
-    value_col = plot_config['value_col']
-    
-    # 聚合測站資料
-    agg_dict = {
-        'lon': 'first',
-        'lat': 'first',
-        value_col: 'mean',
-    }
-    
-    if plot_config['use_wind']:
-        if 'WindDirection_Mean' in period_data.columns:
-            agg_dict['WindDirection_Mean'] = lambda x: x.mode()[0] if len(x.mode()) > 0 else x.mean()
-        if 'WindSpeed_Mean' in period_data.columns:
-            agg_dict['WindSpeed_Mean'] = 'mean'
-    
-    site_avg = period_data.groupby('deviceId').agg(agg_dict).reset_index()
-    site_avg = site_avg.dropna(subset=[value_col])
-    
-    if len(site_avg) == 0:
-        return None
-    
-    # 執行插值
-    grid_values = model.interpolate(site_avg, grid_lon_mesh, grid_lat_mesh, 
-                                   value_col=value_col, 
-                                   use_wind=plot_config['use_wind'])
-    
-    # 建立色階
-    cmap = LinearSegmentedColormap.from_list(plot_type, plot_config['colors'], N=256)
-    norm = BoundaryNorm(plot_config['levels'], cmap.N)
-    
-    # 繪圖
-    fig, ax = plt.subplots(figsize=(14, 12))
-    
-    # 處理風場向量圖
-    if plot_type == 'wind_field':
-        contourf = ax.contourf(grid_lon_mesh, grid_lat_mesh, grid_values,
-                              levels=plot_config['levels'], cmap=cmap, norm=norm, 
-                              extend='both', alpha=alpha, zorder=2)  # 修正：改為 zorder=2
-        
-        u = site_avg['WindSpeed_Mean'] * np.sin(np.deg2rad(site_avg['WindDirection_Mean']))
-        v = site_avg['WindSpeed_Mean'] * np.cos(np.deg2rad(site_avg['WindDirection_Mean']))
-        
-        quiver = ax.quiver(site_avg['lon'], site_avg['lat'], u, v,
-                          site_avg['WindSpeed_Mean'],
-                          cmap='cool',
-                          scale=50,
-                          width=0.003,
-                          headwidth=4,
-                          headlength=5,
-                          alpha=0.8,
-                          zorder=5)
-        
-        cbar1 = plt.colorbar(contourf, ax=ax, fraction=0.046, pad=0.04, shrink=0.4, location='left')
-        cbar1.set_label('PM2.5 (μg/m³)', fontsize=10, fontweight='bold')
-        
-        cbar2 = plt.colorbar(quiver, ax=ax, fraction=0.046, pad=0.04, shrink=0.4)
-        cbar2.set_label('風速 (m/s)', fontsize=10, fontweight='bold')
+def analysis_job(job, params, lazy_render, progressive_render, zip_mode, profile_memory):
+    """
+    在背景分析工作中執行分析 (kaohsiung_aq/jobs.py)，進度與警告經由 job 回報；
+    回傳結果區塊使用的 session state 項目
+    """
+    # 每張圖完成即寫入暫存目錄，記憶體中不保留圖檔；ZIP 於完成後在背景打包。
+    # 延遲出圖時只保留插值網格，不寫入圖檔
+    if lazy_render:
+        result_store = LazyResults(dpi=params['dpi'])
     else:
-        contourf = ax.contourf(grid_lon_mesh, grid_lat_mesh, grid_values,
-                              levels=plot_config['levels'], cmap=cmap, norm=norm, 
-                              extend='both', alpha=alpha, zorder=2)
-        
-        scatter = ax.scatter(site_avg['lon'], site_avg['lat'],
-                            c=site_avg[value_col],
-                            s=80,
-                            cmap=cmap,
-                            norm=norm,
-                            marker='o',
-                            edgecolors='black',
-                            linewidth=0.8,
-                            alpha=0.9,
-                            zorder=5)
+        result_store = ResultStore(zip_mode=zip_mode)
+    # 各階段耗時 (結果區塊的「各階段耗時」)
+    profiler = Profiler(memory=profile_memory)
+    cache = get_stage_cache()
+    progressive_run = None
+    try:
+        if lazy_render:
+            result = run_pipeline(params, cache=cache, progress=job.progress, warn=job.warn, lazy=result_store,
+                                  profiler=profiler)
+        elif progressive_render:
+            progressive_run = ProgressiveRun(params, result_store, cache=cache)
+            result = progressive_run.run_preview(progress=job.progress, warn=job.warn, profiler=profiler)
+        else:
+            result = run_pipeline(params, cache=cache, progress=job.progress, warn=job.warn,
+                                  on_image=result_store.add, keep_images=False, profiler=profiler)
         
-        cbar = plt.colorbar(contourf, ax=ax, fraction=0.046, pad=0.04, shrink=0.8)
-        cbar.set_label(f'{plot_config["title"]} ({plot_config["unit"]})', 
-                      fontsize=12, fontweight='bold')
-        cbar.ax.tick_params(labelsize=10)
-    
-    ax.set_xlim(lon_min, lon_max)
-    ax.set_ylim(lat_min, lat_max)
-    ax.set_aspect('equal', adjustable='box')
-    
-    # 底圖處理
-    if basemap_style != 'None':
-        try:
-            import contextily as ctx
-            
-            source = ctx.providers.OpenStreetMap.Mapnik
-            if basemap_style == 'Light':
-                source = ctx.providers.CartoDB.Positron
-            elif basemap_style == 'Dark':
-                source = ctx.providers.CartoDB.DarkMatter
-            elif basemap_style == 'Satellite':
-                source = ctx.providers.Esri.WorldImagery
-                
-            ctx.add_basemap(ax, crs='EPSG:4326', 
-                           source=source, 
-                           zoom='auto', alpha=0.8, zorder=1)
-        except:
-            ax.set_facecolor('#f0f0f0')
-            ax.grid(True, alpha=0.3, linestyle='--', color='white', linewidth=1.5)
-    else:
-        ax.set_facecolor('#f0f0f0')
-        ax.grid(True, alpha=0.3, linestyle='--', color='white', linewidth=1.5)
-    
-    ax.set_xlabel('經度 (°E)', fontsize=11, fontweight='bold')
-    ax.set_ylabel('緯度 (°N)', fontsize=11, fontweight='bold')
-    
-    # 標題
-    avg_val = site_avg[value_col].mean()
-    time_period_name = TIME_PERIODS[time_period_key]['name']
-    
-    title_text = f'{plot_config["title"]}'
-    if time_period_key != 'all':
-        title_text += f' - {time_period_name}'
-    title_text += f'\n{period_label}\n'
-    
-    if plot_type == 'wind_field':
-        title_text += f'平均風速: {site_avg["WindSpeed_Mean"].mean():.1f} m/s'
-    else:
-        title_text += f'平均: {avg_val:.1f} {plot_config["unit"]} | 測站數: {len(site_avg)}'
-    
-    ax.set_title(title_text, fontsize=14, fontweight='bold', pad=20)
-    
-    plt.tight_layout()
-    
-    # 儲存到記憶體
-    buf = BytesIO()
-    plt.savefig(buf, format='png', dpi=dpi, bbox_inches='tight', 
-               facecolor='white', edgecolor='none')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+        # session state 只保存結果索引 (檔名、大小與暫存路徑)
+        entries = {
+            'result_store': result_store,
+            'progressive': progressive_run,
+            'cache_stats': result['cache_stats'],
+            'memory': result['memory'],
+            'profile': profiler.to_dict(params),
+        }
+        if progressive_run is not None:
+            # 預覽先交給頁面顯示；精細化在本工作中完成 (佔用工作名額，「取消分析」可中止)，完成後才打包 ZIP
+            job.publish(entries)
+            progressive_run.start(background=False, progress=job.progress)
+    except Exception:
+        # 包含取消 (JobCancelled)
+        result_store.cleanup()
+        raise
+    if progressive_run is None and not lazy_render:
+        result_store.finish(order=result['filenames'])
+    return entries
 
-# ========================================
-# 主要分析流程
-# ========================================
+
+job_runner = get_job_runner()
 
 # 按鈕
 if st.button("開始分析"):
     if not selected_plot_types:
         st.markdown('<div class="custom-box box-error">請至少選擇一種圖表類型</div>', unsafe_allow_html=True)
     else:
-        # 進度條
+        # 各階段結果存放在分層快取中，鍵只包含影響該階段的參數；
+        # 只改變出圖設定時各階段皆命中，直接進入出圖
+        params = make_params(
+            data_dir=data_dir, station_file=station_file, use_data_cache=use_data_cache,
+            compact_schema=compact_schema, use_rollups=use_rollups, years=filter_criteria.get('years', []), months=filter_criteria.get('months', []),
+            start=filter_criteria.get('start'), end=filter_criteria.get('end'),
+            time_aggregation=time_aggregation, time_periods=selected_periods,
+            plot_types=selected_plot_types, basemap_style=basemap_style, alpha=layer_alpha,
+            grid_resolution=grid_resolution, radius=diffusion_radius, wind_influence=wind_influence,
+            wind_mode=wind_mode, dpi=png_dpi, interp_memory_mb=interp_memory_mb, jobs=render_jobs)
+        
+        # 上一次的分析工作 (含精細化) 與暫存圖檔不再需要
+        previous_id = st.session_state.pop('job_id', None)
+        previous_job = job_runner.get(previous_id) if previous_id else None
+        if previous_job is not None:
+            job_runner.remove(previous_id)
+        st.session_state.pop('progressive', None)
+        for state_key in ('result_store', 'lazy_zip_store'):
+            previous_store = st.session_state.pop(state_key, None)
+            # 精細化中的工作仍在寫入圖檔，取消後由工作自行清除
+            if state_key == 'result_store' and previous_job is not None and not previous_job.finished:
+                continue
+            if previous_store is not None:
+                previous_store.cleanup()
+        
+        # 分析在背景工作中執行，不佔用本次腳本執行；工作編號同時記在網址中，重新整理頁面後仍可取回結果
+        st.session_state['job_id'] = job_runner.submit(
+            analysis_job, params, lazy_render, progressive_render, zip_mode, profile_memory,
+            label=f"{TIME_AGG_MAPPING[time_aggregation]} · {len(selected_plot_types)} 種圖表")
+        st.query_params['job'] = st.session_state['job_id']
+
+# ========================================
+# 背景分析工作狀態
+# ========================================
+# 頁面重新整理後 session state 會清空，改由網址中的工作編號取回
+job_id = st.session_state.get('job_id') or st.query_params.get('job')
+job = job_runner.get(job_id) if job_id else None
+# 漸進預覽的工作在預覽完成後仍繼續精細化，「取消分析」按鈕保留到工作結束
+job_controls = st.empty()
+if job is not None and st.session_state.get('collected_job') != job.id:
+    st.session_state['job_id'] = job.id
+    if not job.finished:
+        # 按下後 Streamlit 重新執行腳本，於此取消工作，下方等待工作中止
+        if job_controls.button("取消分析"):
+            job_runner.cancel(job.id)
         progress_bar = st.progress(0)
         status_text = st.empty()
-        
-        try:
-            # 步驟 1: 讀取資料
-            status_text.text("讀取資料中...")
-            progress_bar.progress(10)
-            
-            data_path = Path(data_dir)
-            all_dataframes = []
-            
-            # 讀取所有符合 kaohsiung_airbox_hourly_with_wind*.csv 的檔案
-            target_files = list(data_path.glob("kaohsiung_airbox_hourly_with_wind*.csv"))
-            
-            if not target_files:
-                st.markdown(f'<div class="custom-box box-error">找不到符合 kaohsiung_airbox_hourly_with_wind*.csv 的資料檔案</div>', unsafe_allow_html=True)
-                st.stop()
-                
-            for file_path in target_files:
-                try:
-                    df_temp = pd.read_csv(file_path)
-                    all_dataframes.append(df_temp)
-                except Exception as e:
-                    st.warning(f"無法讀取檔案 {file_path.name}: {e}")
-            
-            if not all_dataframes:
-                st.markdown(f'<div class="custom-box box-error">無法從檔案中讀取有效資料</div>', unsafe_allow_html=True)
-                st.stop()
-            
-            df = pd.concat(all_dataframes, ignore_index=True)
-            progress_bar.progress(25)
-            
-            # 步驟 2: 資料清理與篩選
-            status_text.text("資料清理與篩選...")
-            
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
-            df = df.dropna(subset=['timestamp'])
-            
-            df['date'] = df['timestamp'].dt.date
-            df['hour'] = df['timestamp'].dt.hour
-            df['year'] = df['timestamp'].dt.year
-            df['month'] = df['timestamp'].dt.month
-            df['week'] = df['timestamp'].dt.isocalendar().week
-            
-            # 執行時間篩選
-            if filter_criteria['mode'] == 'year_month':
-                target_years = filter_criteria['years']
-                target_months = filter_criteria['months']
-                df = df[df['year'].isin(target_years) & df['month'].isin(target_months)]
-                
-            elif filter_criteria['mode'] == 'date_range':
-                start = filter_criteria['start']
-                end = filter_criteria['end']
-                df = df[(df['date'] >= start) & (df['date'] <= end)]
-            
-            if len(df) == 0:
-                st.markdown('<div class="custom-box box-error">篩選後的資料為空，請檢查時間條件</div>', unsafe_allow_html=True)
-                st.stop()
-            
-            def get_season(month):
-                if month in [3, 4, 5]:
-                    return 'Spring'
-                elif month in [6, 7, 8]:
-                    return 'Summer'
-                elif month in [9, 10, 11]:
-                    return 'Autumn'
-                else:
-                    return 'Winter'
-            
-            df['season'] = df['month'].apply(get_season)
-            df['year_season'] = df['year'].astype(str) + '-' + df['season']
-            
-            numeric_cols = ['pm25_mean', 'pm25_std', 'pm25_cv', 'pm25_exceeds_35_pct', 
-                           'temperature_mean', 'humidity_mean', 'discomfort_index_mean',
-                           'WindSpeed_Mean', 'WindDirection_Mean']
-            
-            for col in numeric_cols:
-                if col in df.columns:
-                    df[col] = pd.to_numeric(df[col], errors='coerce')
-            
-            df['deviceId'] = df['deviceId'].astype(str)
-            
-            # 過濾異常值
-            if 'pm25_mean' in df.columns:
-                df = df[(df['pm25_mean'].isna()) | 
-                       ((df['pm25_mean'] >= 0) & (df['pm25_mean'] <= 500))]
-            
-            progress_bar.progress(40)
-            
-            # 步驟 3: 建立測站座標
-            status_text.text("建立空間座標系統...")
-            
-            df_stations = pd.read_csv(station_file)
-            station_coords = df_stations[['deviceId', 'lat', 'lon']].copy()
-            station_coords['deviceId'] = station_coords['deviceId'].astype(str)
-            df = df.merge(station_coords, on='deviceId', how='left', suffixes=('', '_station'))
-            
-            if 'lat_station' in df.columns:
-                df['lat'] = df['lat_station'].fillna(df.get('lat', np.nan))
-                df['lon'] = df['lon_station'].fillna(df.get('lon', np.nan))
-                df = df.drop(columns=['lat_station', 'lon_station'], errors='ignore')
-            
-            df = df.dropna(subset=['lat', 'lon'])
-            
-            progress_bar.progress(50)
-            
-            # 步驟 4: 產生圖表
-            status_text.text("正在繪製圖表...")
-            
-            # 建立網格
-            lat_min, lat_max = df['lat'].min() - 0.02, df['lat'].max() + 0.02
-            lon_min, lon_max = df['lon'].min() - 0.02, df['lon'].max() + 0.02
-            
-            grid_lat = np.linspace(lat_min, lat_max, grid_resolution)
-            grid_lon = np.linspace(lon_min, lon_max, grid_resolution)
-            grid_lon_mesh, grid_lat_mesh = np.meshgrid(grid_lon, grid_lat)
-            
-            # 建立模型
-            model = DenseDiffusionModel(
-                radius=diffusion_radius,
-                wind_influence=wind_influence,
-                distance_decay=3.0,
-                sigma=0.5
-            )
-            
-            # 時間聚合
-            groups, time_periods_list, label_format = aggregate_by_time(df, time_aggregation)
-            
-            # 產生圖表
-            generated_images = {}
-            total_tasks = len(time_periods_list) * len(selected_plot_types) * len(selected_periods)
-            current_task = 0
-            
-            for period in time_periods_list:
-                period_data = groups.get_group(period)
-                period_label = label_format(period)
-                
-                for plot_type in selected_plot_types:
-                    plot_config = PLOT_CONFIGS[plot_type]
-                    value_col = plot_config['value_col']
-                    
-                    if value_col not in df.columns:
-                        continue
-                    
-                    for period_key in selected_periods:
-                        if period_key == 'all':
-                            filtered_data = period_data
-                        else:
-                            target_hours = TIME_PERIODS[period_key]['hours']
-                            filtered_data = period_data[period_data['hour'].isin(target_hours)]
-                        
-                        if len(filtered_data) == 0:
-                            current_task += 1
-                            continue
-                        
-                        # 產生圖表
-                        img_buf = generate_plot(
-                            filtered_data, plot_type, plot_config, period_label,
-                            time_period_key=period_key,
-                            grid_lon_mesh=grid_lon_mesh,
-                            grid_lat_mesh=grid_lat_mesh,
-                            lon_min=lon_min, lon_max=lon_max,
-                            lat_min=lat_min, lat_max=lat_max,
-                            model=model,
-                            dpi=png_dpi,
-                            basemap_style=basemap_style,
-                            alpha=layer_alpha
-                        )
-                        
-                        if img_buf:
-                            time_period_suffix = '' if period_key == 'all' else f'_{period_key}'
-                            filename = f"kaohsiung_{plot_type}_{period_label.replace(':', '-').replace(' ', '_')}{time_period_suffix}.png"
-                            generated_images[filename] = img_buf
-                        
-                        current_task += 1
-                        progress = 50 + int((current_task / total_tasks) * 50)
-                        progress_bar.progress(progress)
-            
-            progress_bar.progress(100)
-            status_text.empty()
-            
-            # 預先產生 ZIP 檔案
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                for filename, img_buf in generated_images.items():
-                    zip_file.writestr(filename, img_buf.getvalue())
-            zip_buffer.seek(0)
-            
-            # 儲存到 session state
-            st.session_state['generated_images'] = generated_images
-            st.session_state['zip_buffer'] = zip_buffer
-            
-            # 強制刷新頁面以更新 UI
-            st.rerun()
-            
-        except Exception as e:
-            st.markdown(f'<div class="custom-box box-error">分析過程發生錯誤: {str(e)}</div>', unsafe_allow_html=True)
-            import traceback
-            st.code(traceback.format_exc())
+        # 等待期間使用者操作時 Streamlit 會中斷並重新執行，背景工作不受影響；
+        # 預覽已提供時改由結果區塊顯示精細化進度
+        while not job.finished and (job.result is None or job.cancelled):
+            job_status = job.status()
+            progress_bar.progress(job_status['percent'])
+            if job_status['state'] == 'queued':
+                status_text.text(f"排隊中 (第 {job_status['position']} 位，同時最多執行 {job_runner.max_jobs} 個分析)")
+            else:
+                status_text.text(f"{job_status['message'] or '分析中...'} ({job_status['seconds']:.0f}s)")
+            time.sleep(0.2)
+        progress_bar.empty()
+        status_text.empty()
+    
+    job_status = job.status()
+    for message in job_status['warnings']:
+        st.warning(message)
+    collected = {key: value for key, value in (job.result or {}).items() if value is not None}
+    if job_status['state'] == 'running':
+        # 漸進預覽: 預覽已完成，精細化仍在工作中進行
+        st.session_state.update(collected)
+    else:
+        st.session_state['collected_job'] = job.id
+        job_controls.empty()
+        if job_status['state'] == 'done':
+            st.session_state.update(collected)
+        else:
+            # 精細化中取消時，預覽的暫存圖檔已由工作清除
+            st.session_state.pop('progressive', None)
+            st.session_state.pop('result_store', None)
+            if job_status['state'] == 'cancelled':
+                st.markdown('<div class="custom-box box-error">分析已取消</div>', unsafe_allow_html=True)
+            elif isinstance(job.exception, AnalysisError):
+                st.markdown(f'<div class="custom-box box-error">{job.exception}</div>', unsafe_allow_html=True)
+            else:
+                st.markdown(f'<div class="custom-box box-error">分析過程發生錯誤: {job_status["error"]}</div>', unsafe_allow_html=True)
+                st.code(job.traceback)
 
 # ========================================
 # 模型解釋區塊 (只有在未產生圖表時顯示)
 # ========================================
-if 'generated_images' not in st.session_state:
+if 'result_store' not in st.session_state:
     st.markdown("""<div class="model-explanation">
     <h4>模型原理與風場處理說明</h4>
     <p>本系統採用 <strong>Dense Diffusion Model (密集擴散模型)</strong> 進行空氣污染時空分布推估，核心技術如下：</p>
@@ -900,22 +564,63 @@ if 'generated_images' not in st.session_state:
 # ========================================
 # 顯示和下載結果
 # ========================================
-if 'generated_images' in st.session_state:
+if 'result_store' in st.session_state:
     st.markdown("---")
     st.markdown("### 分析結果")
     
-    generated_images = st.session_state['generated_images']
+    result_store = st.session_state['result_store']
+    lazy_results = isinstance(result_store, LazyResults)
     
     # 統計資訊
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("總圖表數", len(generated_images))
+        st.metric("總圖表數", len(result_store))
     with col2:
-        total_size = sum(len(img.getvalue()) for img in generated_images.values()) / (1024 * 1024)
-        st.metric("總檔案大小", f"{total_size:.2f} MB")
+        if lazy_results:
+            st.metric("插值網格大小", f"{result_store.grid_bytes / (1024 * 1024):.2f} MB")
+        else:
+            total_size = result_store.total_bytes / (1024 * 1024)
+            st.metric("總檔案大小", f"{total_size:.2f} MB")
     with col3:
         st.metric("格式", "PNG / ZIP")
     
+    # 分層快取命中情況
+    if 'cache_stats' in st.session_state:
+        cache_parts = []
+        for stage, label in CACHE_STAGE_LABELS.items():
+            if stage not in st.session_state['cache_stats']:
+                continue
+            hits, misses = st.session_state['cache_stats'][stage]
+            if hits + misses == 1:
+                cache_parts.append(f"{label} {'命中' if hits else '未命中'}")
+            else:
+                cache_parts.append(f"{label} {hits}/{hits + misses} 命中")
+        st.caption("快取: " + " · ".join(cache_parts))
+    
+    # 資料表記憶體用量 (讀取 / 清理合併後)
+    if 'memory' in st.session_state:
+        st.caption(memory_summary(st.session_state['memory']))
+    
+    # 各階段耗時 (巢狀階段以 / 連接，例如 interp/gaussian_filter)
+    if 'profile' in st.session_state:
+        profile = st.session_state['profile']
+        with st.expander(f"各階段耗時 (共 {profile['wall_s']:.1f} 秒)"):
+            st.dataframe([{
+                '階段': row['stage'],
+                '次數': row['calls'],
+                '經過時間 (s)': round(row['wall_s'], 3),
+                'CPU 時間 (s)': round(row['cpu_s'], 3),
+                '記憶體峰值 (MB)': None if row['peak_mb'] is None else round(row['peak_mb'], 1),
+            } for row in profile['stages']], use_container_width=True)
+            if profile.get('memory_shared'):
+                st.caption("分析期間有其他工作同時記錄記憶體 (tracemalloc 為整個程序共用)，記憶體峰值不予顯示")
+            st.download_button(
+                label="下載耗時紀錄 (JSON)",
+                data=json.dumps(profile, ensure_ascii=False, indent=1),
+                file_name=f"kaohsiung_aq_profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json"
+            )
+    
     st.markdown("---")
     
     # 圖表預覽和下載
@@ -924,36 +629,126 @@ if 'generated_images' in st.session_state:
     # 選擇顯示的圖表
     selected_image = st.selectbox(
         "選擇要預覽的圖表",
-        options=list(generated_images.keys())
+        options=result_store.filenames
     )
     
     if selected_image:
+        # 圖檔由暫存目錄讀取，只載入目前選擇的一張；延遲出圖時以預覽解析度出圖
+        if lazy_results:
+            image_bytes = result_store.preview(selected_image)
+        else:
+            image_bytes = result_store.read(selected_image)
+        
         # 顯示圖片
+        image_placeholder = st.empty()
         try:
-            st.image(generated_images[selected_image], use_container_width=True)
+            image_placeholder.image(image_bytes, use_container_width=True)
         except:
-            st.image(generated_images[selected_image], width=800)
+            image_placeholder.image(image_bytes, width=800)
         
-        # 單張下載
-        st.download_button(
-            label="下載此圖表",
-            data=generated_images[selected_image],
-            file_name=selected_image,
-            mime="image/png"
-        )
+        # 漸進預覽: 背景精細化期間持續更新狀態，目前選擇的圖替換完成時立即重新顯示
+        progressive_run = st.session_state.get('progressive')
+        if progressive_run is not None and not lazy_results:
+            refine_placeholder = st.empty()
+            shown_refined = progressive_run.is_refined(selected_image)
+            refine_status = progressive_run.status()
+            while refine_status['state'] == 'refining':
+                refine_placeholder.caption(f"預覽為 {progressive_run.preview_params['grid_resolution']} 網格 · "
+                                           f"精細化至 {progressive_run.params['grid_resolution']} 網格中... "
+                                           f"{refine_status['done']}/{refine_status['total']} "
+                                           f"({refine_status['seconds']:.1f}s)")
+                if not shown_refined and progressive_run.is_refined(selected_image):
+                    image_bytes = result_store.read(selected_image)
+                    image_placeholder.image(image_bytes, use_container_width=True)
+                    shown_refined = True
+                time.sleep(0.2)
+                refine_status = progressive_run.status()
+            # 精細化結束後工作隨即完成，不再需要「取消分析」
+            job_controls.empty()
+            
+            if not shown_refined and progressive_run.is_refined(selected_image):
+                image_bytes = result_store.read(selected_image)
+                image_placeholder.image(image_bytes, use_container_width=True)
+            if refine_status['state'] == 'done':
+                refine_placeholder.caption(f"已精細化至 {progressive_run.params['grid_resolution']} 網格 "
+                                           f"({refine_status['seconds']:.1f}s)")
+            elif refine_status['state'] == 'failed':
+                refine_placeholder.markdown(f'<div class="custom-box box-error">精細化失敗，顯示預覽結果: '
+                                            f'{refine_status["error"]}</div>', unsafe_allow_html=True)
+        
+        # 單張下載 (延遲出圖時按下後才以完整 DPI 出圖)
+        if lazy_results:
+            st.caption(f"預覽 {result_store.preview_dpi} DPI，下載為 {result_store.dpi} DPI")
+            if st.button("產生完整解析度圖檔"):
+                st.session_state['lazy_download'] = selected_image
+            if st.session_state.get('lazy_download') == selected_image:
+                st.download_button(
+                    label="下載此圖表",
+                    data=result_store.read(selected_image),
+                    file_name=selected_image,
+                    mime="image/png"
+                )
+        else:
+            st.download_button(
+                label="下載此圖表",
+                data=image_bytes,
+                file_name=selected_image,
+                mime="image/png"
+            )
     
     st.markdown("---")
     
     # 批次下載 (直接下載)
     st.markdown("#### 批次下載")
     
-    if 'zip_buffer' in st.session_state:
-        st.download_button(
-            label="下載所有圖表 (ZIP)",
-            data=st.session_state['zip_buffer'],
-            file_name=f"kaohsiung_air_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-            mime="application/zip"
-        )
+    # 延遲出圖時，按下後才將全部圖表以完整 DPI 出圖寫入暫存目錄，再打包 ZIP
+    zip_store = result_store
+    if lazy_results:
+        zip_store = st.session_state.get('lazy_zip_store')
+        if zip_store is None and st.button("產生所有圖表 (完整解析度)"):
+            export_bar = st.progress(0)
+            zip_store = ResultStore(zip_mode=zip_mode)
+            try:
+                result_store.export(zip_store.add, jobs=render_jobs,
+                                    progress=lambda done, total: export_bar.progress(int(done / total * 100)))
+            except Exception:
+                zip_store.cleanup()
+                raise
+            zip_store.finish(order=result_store.filenames)
+            export_bar.empty()
+            st.session_state['lazy_zip_store'] = zip_store
+    
+    if zip_store is not None:
+        # ZIP 在背景由磁碟上的圖檔建立；上方預覽已可使用，這裡等待完成後提供下載
+        # (等待期間持續更新狀態，使用者操作時 Streamlit 會中斷並重新執行)
+        zip_placeholder = st.empty()
+        zip_status = zip_store.zip_status()
+        while zip_status['state'] == 'building':
+            zip_placeholder.caption(f"ZIP 打包中... {zip_status['done']}/{zip_status['total']} "
+                                    f"({zip_status['seconds']:.1f}s)")
+            time.sleep(0.2)
+            zip_status = zip_store.zip_status()
+        
+        if zip_status['state'] == 'done':
+            zip_placeholder.caption(f"ZIP {zip_status['bytes'] / (1024 * 1024):.2f} MB · "
+                                    f"{ZIP_MODES[zip_store.zip_mode]} · 打包 {zip_status['seconds']:.1f}s")
+            # st.download_button 會將整個 ZIP 讀入 Streamlit 的記憶體 (每次重新執行都會重新登記)，
+            # 因此按下「準備下載」後才建立下載按鈕，下載後即移除；ZIP 只在這段期間佔用該工作階段的記憶體
+            zip_key = str(zip_store.zip_path)
+            if st.session_state.get('zip_download') != zip_key and st.button("準備下載 ZIP"):
+                st.session_state['zip_download'] = zip_key
+            if st.session_state.get('zip_download') == zip_key:
+                with open(zip_store.zip_path, 'rb') as zip_file:
+                    st.download_button(
+                        label="下載所有圖表 (ZIP)",
+                        data=zip_file,
+                        file_name=f"kaohsiung_air_quality_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                        mime="application/zip",
+                        on_click=lambda: st.session_state.pop('zip_download', None)
+                    )
+        else:
+            zip_placeholder.markdown(f'<div class="custom-box box-error">ZIP 打包失敗: {zip_status["error"]}</div>',
+                                     unsafe_allow_html=True)
 
 # ========================================
 # 頁尾
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+測站聚合效能比較: 逐 (時間區段, 時段, 圖表) groupby vs 單次 build_site_table
+
+以真實測站座標產生逐時資料 (含缺值與離散風向)，在不同的圖表類型數與時段數下比較:
+- legacy: 原本的流程，每個 (時間區段, 時段, 圖表) 各做一次 get_group、時段篩選與 aggregate_sites
+- table:  一次 build_site_table，之後每個組合只以 site_averages 查表
+並確認兩者結果一致 (平均值 rtol=1e-9，缺值位置與風向眾數完全相同)，不一致時回傳 1。
+
+用法:
+    python benchmarks/bench_aggregate.py [--days 60] [--aggregation daily]
+                                         [--plots 1 3 6] [--slots 1 3 7]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from kaohsiung_aq.aggregation import (PERIOD_COLUMNS, aggregate_by_time, aggregate_sites,  # noqa: E402
+                                      build_site_table, calendar_features, site_averages)
+from kaohsiung_aq.config import PLOT_CONFIGS, TIME_PERIODS  # noqa: E402
+
+
+def make_hourly(station_file, days, seed=0):
+    rng = np.random.default_rng(seed)
+    stations = pd.read_csv(station_file)[['deviceId', 'lat', 'lon']]
+    stations['deviceId'] = stations['deviceId'].astype(str)
+    timestamps = pd.date_range('2024-01-01', periods=days * 24, freq='h')
+
+    df = pd.DataFrame({
+        'deviceId': np.repeat(stations['deviceId'].to_numpy(), len(timestamps)),
+        'lat': np.repeat(stations['lat'].to_numpy(), len(timestamps)),
+        'lon': np.repeat(stations['lon'].to_numpy(), len(timestamps)),
+        'timestamp': np.tile(timestamps, len(stations)),
+    })
+    n = len(df)
+    df['pm25_mean'] = rng.gamma(4.0, 5.0, n)
+    df['temperature_mean'] = rng.normal(26, 4, n)
+    df['humidity_mean'] = rng.uniform(40, 95, n)
+    df['pm25_cv'] = rng.uniform(0, 60, n)
+    df['pm25_exceeds_35_pct'] = rng.uniform(0, 100, n)
+    # 風向為 16 方位，使眾數有意義
+    df['WindDirection_Mean'] = rng.integers(0, 16, n) * 22.5
+    df['WindSpeed_Mean'] = rng.gamma(2.0, 1.2, n)
+    for col in ['pm25_mean', 'WindDirection_Mean', 'WindSpeed_Mean']:
+        df.loc[rng.random(n) < 0.05, col] = np.nan
+
+    for col, values in calendar_features(df['timestamp']).items():
+        df[col] = values
+    return df
+
+
+def run_legacy(groups, periods, slot_keys, plot_configs):
+    results = {}
+    for period in periods:
+        period_data = groups.get_group(period)
+        for slot_key in slot_keys:
+            if slot_key == 'all':
+                filtered = period_data
+            else:
+                filtered = period_data[period_data['hour'].isin(TIME_PERIODS[slot_key]['hours'])]
+            for name, plot_config in plot_configs.items():
+                results[(period, slot_key, name)] = aggregate_sites(filtered, plot_config) if len(filtered) else None
+    return results
+
+
+def run_table(groups, period_col, periods, slot_keys, plot_configs):
+    table = build_site_table(groups.obj, period_col, slot_keys, list(plot_configs.values()))
+    results = {}
+    for period in periods:
+        for slot_key in slot_keys:
+            for name, plot_config in plot_configs.items():
+                results[(period, slot_key, name)] = site_averages(table, period, slot_key, plot_config)
+    return results
+
+
+def same_result(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    a = a.reset_index(drop=True)
+    if list(a.columns) != list(b.columns) or list(a['deviceId']) != list(b['deviceId']):
+        return False
+    for col in a.columns[1:]:
+        x = a[col].to_numpy(dtype=np.float64)
+        y = b[col].to_numpy(dtype=np.float64)
+        mask = np.isnan(x)
+        if not np.array_equal(mask, np.isnan(y)) or not np.allclose(x[~mask], y[~mask], rtol=1e-9):
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--station-file', default=str(ROOT / 'data' / 'Kaohsiung_iot_station.csv'))
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--aggregation', choices=list(PERIOD_COLUMNS), default='daily')
+    parser.add_argument('--plots', type=int, nargs='+', default=[1, 3, 6])
+    parser.add_argument('--slots', type=int, nargs='+', default=[1, 3, 7])
+    args = parser.parse_args(argv)
+
+    df = make_hourly(args.station_file, args.days)
+    groups, periods, _ = aggregate_by_time(df, args.aggregation)
+    period_col = PERIOD_COLUMNS[args.aggregation]
+    print(f"rows={len(df)} stations={df['deviceId'].nunique()} aggregation={args.aggregation} periods={len(periods)}")
+    print(f"{'plots':>5} {'slots':>5} {'maps':>6} {'legacy(s)':>10} {'table(s)':>9} {'speedup':>8}  match")
+
+    ok = True
+    for n_plots in args.plots:
+        plot_configs = dict(list(PLOT_CONFIGS.items())[:n_plots])
+        for n_slots in args.slots:
+            slot_keys = list(TIME_PERIODS)[:n_slots]
+
+            t0 = time.perf_counter()
+            legacy = run_legacy(groups, periods, slot_keys, plot_configs)
+            t_legacy = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            table = run_table(groups, period_col, periods, slot_keys, plot_configs)
+            t_table = time.perf_counter() - t0
+
+            match = all(same_result(legacy[key], table[key]) for key in legacy)
+            ok = ok and match
+            print(f"{n_plots:>5} {n_slots:>5} {len(legacy):>6} {t_legacy:>10.3f} {t_table:>9.3f} "
+                  f"{t_legacy / t_table:>7.1f}x  {'ok' if match else 'MISMATCH'}")
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
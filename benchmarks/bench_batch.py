@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多時間區段批次插值效能比較: 逐區段 interpolate(geometry=...) vs interpolate_batch
+
+以真實測站座標產生 (時間區段 x 測站) 的隨機 PM2.5 與風場矩陣，比較兩種方式的總耗時，
+並確認批次結果與逐區段結果在容許誤差內一致。
+
+用法:
+    python benchmarks/bench_batch.py [--periods 24] [--resolution 300] [--max-chunk-mb 256]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_interpolate import make_grid  # noqa: E402
+from kaohsiung_aq.diffusion import ENGINE_ATOL, ENGINE_RTOL, DenseDiffusionModel  # noqa: E402
+from kaohsiung_aq.geometry import GridGeometry  # noqa: E402
+
+
+def make_matrices(station_ids, n_periods, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (n_periods, len(station_ids))
+    values = pd.DataFrame(rng.gamma(4.0, 5.0, shape), columns=station_ids)
+    wind_dir = pd.DataFrame(rng.uniform(0, 360, shape), columns=station_ids)
+    wind_speed = pd.DataFrame(rng.gamma(2.0, 1.2, shape), columns=station_ids)
+    values = values.mask(rng.random(shape) < 0.05)
+    wind_speed = wind_speed.mask(rng.random(shape) < 0.05)
+    return values, wind_dir, wind_speed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--station-file', default=str(ROOT / 'data' / 'Kaohsiung_iot_station.csv'))
+    parser.add_argument('--periods', type=int, default=24)
+    parser.add_argument('--resolution', type=int, default=300)
+    parser.add_argument('--radius', type=float, default=0.05)
+    parser.add_argument('--max-chunk-mb', type=int, default=256)
+    args = parser.parse_args(argv)
+
+    stations = pd.read_csv(args.station_file)[['deviceId', 'lat', 'lon']]
+    stations['deviceId'] = stations['deviceId'].astype(str)
+    grid_lon_mesh, grid_lat_mesh = make_grid(stations, args.resolution)
+
+    model = DenseDiffusionModel(radius=args.radius)
+    geometry = GridGeometry.from_frame(stations, grid_lon_mesh, grid_lat_mesh, model.radius, model.distance_decay)
+    values, wind_dir, wind_speed = make_matrices(geometry.station_ids, args.periods)
+
+    t0 = time.perf_counter()
+    per_period = []
+    for p in range(args.periods):
+        sites = stations.assign(pm25_mean=values.iloc[p].to_numpy(),
+                                WindDirection_Mean=wind_dir.iloc[p].to_numpy(),
+                                WindSpeed_Mean=wind_speed.iloc[p].to_numpy())
+        per_period.append(model.interpolate(sites, grid_lon_mesh, grid_lat_mesh,
+                                            use_wind=True, geometry=geometry))
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    stack = model.interpolate_batch(values, geometry, wind_dir, wind_speed, max_chunk_mb=args.max_chunk_mb)
+    t_batch = time.perf_counter() - t0
+
+    match = np.allclose(np.stack(per_period), stack, rtol=ENGINE_RTOL, atol=ENGINE_ATOL, equal_nan=True)
+    print(f"periods={args.periods} resolution={args.resolution} max_chunk_mb={args.max_chunk_mb}")
+    print(f"per-period: {t_loop:.3f}s  batch: {t_batch:.3f}s  speedup: {t_loop / t_batch:.2f}x  match: {match}")
+    return 0 if match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+出圖效能比較: 每張重建圖框 vs 沿用 RenderTemplate
+
+以真實測站座標與隨機 PM2.5/風場產生多個時間區段的插值網格，
+分別以 reuse_template=False/True 出圖並比較每張圖的平均耗時
+(第一張圖為暖機，不計時；模板建立成本即包含在其中)。
+
+用法:
+    python benchmarks/bench_render.py [--frames 10] [--plot-type pm25] [--dpi 150] [--basemap None]
+"""
+
+import argparse
+import sys
+import time
+import warnings
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_interpolate import make_grid, make_sites  # noqa: E402
+from kaohsiung_aq.config import PLOT_CONFIGS  # noqa: E402
+from kaohsiung_aq.diffusion import DenseDiffusionModel  # noqa: E402
+from kaohsiung_aq.plotting import prepare_plot, render_plot  # noqa: E402
+
+warnings.filterwarnings('ignore')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--station-file', default=str(ROOT / 'data' / 'Kaohsiung_iot_station.csv'))
+    parser.add_argument('--frames', type=int, default=10, help='至少 2')
+    parser.add_argument('--plot-type', choices=list(PLOT_CONFIGS), default='pm25')
+    parser.add_argument('--resolution', type=int, default=300)
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--basemap', default='None')
+    args = parser.parse_args(argv)
+
+    if args.frames < 2:
+        parser.error('--frames 至少為 2')
+    plot_config = PLOT_CONFIGS[args.plot_type]
+    model = DenseDiffusionModel()
+    frames = []
+    for seed in range(args.frames):
+        sites = make_sites(args.station_file, seed=seed).rename(columns={'pm25_mean': plot_config['value_col']})
+        sites['deviceId'] = sites['deviceId'].astype(str)
+        grid_lon_mesh, grid_lat_mesh = make_grid(sites, args.resolution)
+        frames.append(prepare_plot(sites, plot_config, grid_lon_mesh, grid_lat_mesh, model=model))
+
+    bounds = dict(lon_min=grid_lon_mesh.min(), lon_max=grid_lon_mesh.max(),
+                  lat_min=grid_lat_mesh.min(), lat_max=grid_lat_mesh.max())
+
+    results = {}
+    for reuse in (False, True):
+        for i, (site_avg, grid_values) in enumerate(frames):
+            if i == 1:
+                t0 = time.perf_counter()
+            render_plot(site_avg, grid_values, args.plot_type, plot_config, f'frame {i}',
+                        grid_lon_mesh=grid_lon_mesh, grid_lat_mesh=grid_lat_mesh,
+                        dpi=args.dpi, basemap_style=args.basemap, reuse_template=reuse, **bounds)
+        results[reuse] = (time.perf_counter() - t0) / (len(frames) - 1)
+
+    print(f"plot_type={args.plot_type} frames={args.frames} dpi={args.dpi} basemap={args.basemap}")
+    print(f"rebuild: {results[False]:.3f}s/frame  template: {results[True]:.3f}s/frame  "
+          f"speedup: {results[False] / results[True]:.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+端到端效能測試套件
+
+以 make_data.py 的合成資料 (或 --data-dir 指定的資料目錄) 依序量測分析流程各階段:
+- ingest/store_sync:   CSV 解析、清理並轉存欄式快取 (每次重建快取目錄)
+- ingest/store_load:   由欄式快取讀取
+- ingest/read_csv:     不使用快取，分塊直接解析 CSV
+- clean、merge:        pipeline 的清理與測站合併
+- aggregate/<方式>:    TIME_AGG_MAPPING 各時間聚合方式的 aggregate_by_time + build_site_table
+- rollup/refresh:      建立每個月份的預先彙總 (每次重建)
+- rollup/<方式>:       由預先彙總讀取並計算測站統計表 (每日以上的時間聚合)
+- geometry/<解析度>:   網格與 GridGeometry 建立
+- interpolate/<引擎>/<解析度>: 每張圖的插值時間 (geometry 為 pipeline 使用的預先計算幾何路徑)
+- render/<解析度>:     每張圖的出圖時間 (沿用出圖模板，含第一張建立模板)
+各項取 --repeat 次中最快者。結果以 JSON 輸出 (--json)，含 Python/套件版本、CPU 數與 git commit；
+指定 --baseline 時與先前的 JSON 比較，任一項比基準慢超過 --tolerance 時回傳 1。
+
+用法:
+    python benchmarks/bench_suite.py [--days 31] [--resolutions 100 300] [--engines geometry sparse vectorized]
+                                     [--json results.json] [--baseline previous.json --tolerance 0.2]
+    python benchmarks/bench_suite.py --data-dir data --years 2020 --months 1 2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from make_data import generate  # noqa: E402
+from kaohsiung_aq.aggregation import PERIOD_COLUMNS, aggregate_by_time, build_site_table, site_averages  # noqa: E402
+from kaohsiung_aq.config import PLOT_CONFIGS, TIME_AGG_MAPPING  # noqa: E402
+from kaohsiung_aq.datastore import ColumnarStore, load_hourly, required_columns  # noqa: E402
+from kaohsiung_aq.diffusion import ENGINES, DenseDiffusionModel  # noqa: E402
+from kaohsiung_aq.pipeline import clean_stage, grid_stage, merge_stage, rollup_prepare  # noqa: E402
+from kaohsiung_aq.plotting import render_plot  # noqa: E402
+from kaohsiung_aq.rollup import ROLLUP_AGGREGATIONS, RollupStore  # noqa: E402
+
+
+def best_time(func, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+
+def environment():
+    import matplotlib
+    import pandas as pd
+    import scipy
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scipy': scipy.__version__,
+        'matplotlib': matplotlib.__version__,
+        'commit': commit,
+    }
+
+
+class Suite:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, func, per=1, **params):
+        """量測 func；per 為一次呼叫處理的項目數 (例如圖數)，seconds 為每項耗時"""
+        times, result = best_time(func, self.repeat)
+        record = {'name': name, 'params': params, 'seconds': min(times) / per,
+                  'runs': [t / per for t in times], 'per': per}
+        self.results.append(record)
+        print(f"{name:<32} {record['seconds']:>10.4f}s" + (f"  (每項, {per} 項)" if per > 1 else ''))
+        return result
+
+
+def compare(results, baseline, tolerance):
+    """回傳比基準慢超過 tolerance 的項目 [(名稱, 本次, 基準)]"""
+    previous = {record['name']: record['seconds'] for record in baseline['results']}
+    slower = []
+    print(f"\n{'name':<32} {'now(s)':>10} {'base(s)':>10} {'ratio':>7}")
+    for record in results:
+        base = previous.get(record['name'])
+        if base is None or base <= 0:
+            continue
+        ratio = record['seconds'] / base
+        flag = ''
+        if ratio > 1 + tolerance:
+            slower.append((record['name'], record['seconds'], base))
+            flag = '  SLOWER'
+        print(f"{record['name']:<32} {record['seconds']:>10.4f} {base:>10.4f} {ratio:>6.2f}x{flag}")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', help='使用既有資料目錄 (預設產生合成資料於暫存目錄)')
+    parser.add_argument('--years', type=int, nargs='+', default=[2020])
+    parser.add_argument('--months', type=int, nargs='+', help='只使用這些月份 (預設全部)')
+    parser.add_argument('--days', type=int, default=31, help='合成資料每年的天數')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--aggregations', choices=list(TIME_AGG_MAPPING), nargs='+', default=list(TIME_AGG_MAPPING))
+    parser.add_argument('--resolutions', type=int, nargs='+', default=[100, 300])
+    parser.add_argument('--engines', choices=('geometry',) + ENGINES, nargs='+', default=['geometry', 'sparse'])
+    parser.add_argument('--frames', type=int, default=5, help='插值與出圖的圖數')
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help='結果輸出的 JSON 檔')
+    parser.add_argument('--baseline', help='比較用的先前結果 JSON')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='容許變慢比例')
+    args = parser.parse_args(argv)
+
+    warnings.filterwarnings('ignore')
+    tmp_dir = Path(tempfile.mkdtemp(prefix='aq_bench_'))
+    try:
+        if args.data_dir:
+            data_dir = Path(args.data_dir)
+        else:
+            data_dir = tmp_dir / 'data'
+            t0 = time.perf_counter()
+            written = generate(data_dir, args.years, days=args.days, seed=args.seed)
+            print(f"合成資料: {sum(written.values())} 列 ({time.perf_counter() - t0:.1f}s)")
+        station_file = data_dir / 'Kaohsiung_iot_station.csv'
+        months = args.months or list(range(1, 13))
+        criteria = {'mode': 'year_month', 'years': args.years, 'months': months}
+        plot_config = PLOT_CONFIGS['pm25']
+        columns = required_columns(list(PLOT_CONFIGS))
+
+        suite = Suite(args.repeat)
+
+        # 讀取
+        def store_sync():
+            shutil.rmtree(tmp_dir / 'store', ignore_errors=True)
+            return ColumnarStore(data_dir, tmp_dir / 'store').sync(years=args.years)
+
+        suite.run('ingest/store_sync', store_sync, years=args.years)
+        store = ColumnarStore(data_dir, tmp_dir / 'store')
+        raw = suite.run('ingest/store_load', lambda: store.load(args.years, months, columns=columns),
+                        years=args.years, months=months)
+        suite.run('ingest/read_csv', lambda: load_hourly(data_dir, args.years, months, columns=columns,
+                                                         use_cache=False)[0],
+                  years=args.years, months=months)
+
+        # 清理與測站合併
+        df = suite.run('clean', lambda: clean_stage(raw, criteria), rows=len(raw))
+        df = suite.run('merge', lambda: merge_stage(df, station_file), rows=len(df))
+
+        # 時間聚合 + 測站統計表
+        tables = {}
+        for aggregation in args.aggregations:
+            def aggregate():
+                groups, periods, _ = aggregate_by_time(df, aggregation)
+                table = build_site_table(groups.obj, PERIOD_COLUMNS[aggregation], ['all'], [plot_config])
+                return periods, table
+            tables[aggregation] = suite.run(f'aggregate/{aggregation}', aggregate, rows=len(df))
+
+        # 預先彙總
+        rollups = RollupStore(store, station_file, rollup_prepare(station_file))
+
+        def rollup_refresh():
+            shutil.rmtree(rollups.rollup_dir, ignore_errors=True)
+            return rollups.refresh(years=args.years, months=months)
+
+        suite.run('rollup/refresh', rollup_refresh, years=args.years, months=months)
+        for aggregation in args.aggregations:
+            if aggregation not in ROLLUP_AGGREGATIONS:
+                continue
+
+            def rollup_aggregate():
+                rollup = rollups.load(['all'], [plot_config], years=args.years, months=months)
+                return rollup.periods(aggregation)[0], rollup.site_table(aggregation, ['all'], [plot_config])
+            suite.run(f'rollup/{aggregation}', rollup_aggregate, rows=len(df))
+
+        # 插值與出圖使用每日的測站平均
+        if 'daily' not in tables:
+            groups, periods, _ = aggregate_by_time(df, 'daily')
+            tables['daily'] = periods, build_site_table(groups.obj, PERIOD_COLUMNS['daily'], ['all'], [plot_config])
+        periods, table = tables['daily']
+        frames = [site_averages(table, period, 'all', plot_config) for period in periods[:args.frames]]
+        frames = [site_avg for site_avg in frames if site_avg is not None]
+
+        for resolution in args.resolutions:
+            model = DenseDiffusionModel(radius=0.05, wind_influence=0.3)
+            bounds, grid_lon_mesh, grid_lat_mesh, geometry = suite.run(
+                f'geometry/{resolution}', lambda: grid_stage(df, resolution, model), resolution=resolution)
+
+            grids = None
+            for engine in args.engines:
+                engine_model = DenseDiffusionModel(radius=0.05, wind_influence=0.3,
+                                                   engine='sparse' if engine == 'geometry' else engine)
+                engine_geometry = geometry if engine == 'geometry' else None
+
+                def interpolate():
+                    return [engine_model.interpolate(site_avg, grid_lon_mesh, grid_lat_mesh,
+                                                     value_col=plot_config['value_col'],
+                                                     use_wind=plot_config['use_wind'], geometry=engine_geometry)
+                            for site_avg in frames]
+                result = suite.run(f'interpolate/{engine}/{resolution}', interpolate, per=len(frames),
+                                   engine=engine, resolution=resolution)
+                grids = grids or result
+
+            if grids is None:
+                continue
+
+            def render():
+                # 以全新的解析度/DPI 組合計入模板建立 (第一張)
+                return [render_plot(site_avg, grid_values, 'pm25', plot_config, f'frame {i}',
+                                    grid_lon_mesh=grid_lon_mesh, grid_lat_mesh=grid_lat_mesh,
+                                    lon_min=bounds[0], lon_max=bounds[1], lat_min=bounds[2], lat_max=bounds[3],
+                                    dpi=args.dpi, basemap_style='None')
+                        for i, (site_avg, grid_values) in enumerate(zip(frames, grids))]
+            suite.run(f'render/{resolution}', render, per=len(frames), resolution=resolution, dpi=args.dpi)
+
+        output = {
+            'environment': environment(),
+            'args': vars(args),
+            'data': {'rows': len(raw), 'stations': int(raw['deviceId'].nunique()),
+                     'synthetic': not args.data_dir},
+            'results': suite.results,
+        }
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(output, f, ensure_ascii=False, indent=1)
+            print(f"\n結果已寫入 {args.json}")
+
+        if args.baseline:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            slower = compare(suite.results, baseline, args.tolerance)
+            if slower:
+                print(f"\n{len(slower)} 項比基準慢超過 {args.tolerance:.0%}")
+                return 1
+        return 0
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+風向統計效能比較: groupby.agg 逐組 mode() lambda vs kaohsiung_aq.wind 向量化統計
+
+以 bench_aggregate 的合成逐時資料，對 (時間區段, 測站) 分組計算代表風向:
+- lambda: 原本 aggregate_sites 的 x.mode()[0] if len(x.mode()) > 0 else x.mean()
+- mode:   wind_stats(..., 'mode')，出現次數一次計算後取眾數 (結果須與 lambda 完全相同)
+- vector: wind_stats(..., 'vector')，風速加權圓形平均、平均 u/v 與合成向量長度
+mode 與 lambda 不一致時回傳 1。
+
+用法:
+    python benchmarks/bench_wind.py [--days 60] [--aggregation hourly daily] [--repeat 3]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bench_aggregate import make_hourly  # noqa: E402
+from kaohsiung_aq.aggregation import PERIOD_COLUMNS, aggregate_by_time  # noqa: E402
+from kaohsiung_aq.wind import wind_stats  # noqa: E402
+
+
+def lambda_mode(df, keys):
+    return df.groupby(keys)['WindDirection_Mean'].agg(lambda x: x.mode()[0] if len(x.mode()) > 0 else x.mean())
+
+
+def best_time(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--station-file', default=str(ROOT / 'data' / 'Kaohsiung_iot_station.csv'))
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--aggregation', choices=list(PERIOD_COLUMNS), nargs='+', default=['hourly', 'daily'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    df = make_hourly(args.station_file, args.days)
+    print(f"rows={len(df)} stations={df['deviceId'].nunique()}")
+    print(f"{'aggregation':>11} {'groups':>8} {'lambda(s)':>10} {'mode(s)':>8} {'vector(s)':>10} "
+          f"{'mode x':>7} {'vector x':>9}  match")
+
+    ok = True
+    for aggregation in args.aggregation:
+        groups, _, _ = aggregate_by_time(df, aggregation)
+        data = groups.obj
+        keys = [PERIOD_COLUMNS[aggregation], 'deviceId']
+
+        # 逐組 lambda 很慢，只量一次
+        t_lambda, expected = best_time(lambda: lambda_mode(data, keys), 1)
+        t_mode, modes = best_time(lambda: wind_stats(data, keys, 'mode'), args.repeat)
+        t_vector, _ = best_time(lambda: wind_stats(data, keys, 'vector'), args.repeat)
+
+        got = modes['WindDirection_Mean'].reindex(expected.index).to_numpy(dtype=np.float64)
+        want = expected.to_numpy(dtype=np.float64)
+        match = np.array_equal(got, want, equal_nan=True)
+        ok = ok and match
+        print(f"{aggregation:>11} {len(expected):>8} {t_lambda:>10.3f} {t_mode:>8.3f} {t_vector:>10.3f} "
+              f"{t_lambda / t_mode:>6.1f}x {t_lambda / t_vector:>8.1f}x  {'ok' if match else 'MISMATCH'}")
+
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合成年度逐時資料產生器
+
+以 data/Kaohsiung_iot_station.csv 的真實測站 (167 站) 產生 kaohsiung_airbox_hourly_with_wind_<年>.csv，
+欄位與正式資料相同，供效能測試與沒有原始資料時試用系統:
+- PM2.5: 測站基準值 (工業區較高) x 季節 (冬高夏低) x 日變化 (早晚尖峰) x 區域共同變動，
+  再加上各站的 AR(1) 雜訊
+- 風向: 季節盛行風 (冬季東北、夏季西南) 加上隨機偏移；風速白天較大
+- 溫度、濕度與不適指數隨季節與時間變化
+- 約 missing 比例的量測值為缺值；同一 seed 產生的檔案完全相同
+
+用法:
+    python benchmarks/make_data.py --out bench_data [--years 2020] [--days 31] [--seed 0]
+"""
+
+import argparse
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+STATION_FILE = ROOT / 'data' / 'Kaohsiung_iot_station.csv'
+
+# 每次產生的時數上限，限制單次配置的記憶體
+HOURS_PER_CHUNK = 24 * 31
+
+
+def load_stations(station_file=STATION_FILE):
+    stations = pd.read_csv(station_file)
+    stations['deviceId'] = stations['deviceId'].astype(str)
+    return stations
+
+
+def station_baseline(stations, rng):
+    """各測站的 PM2.5 基準值 (μg/m³)；工業區較高"""
+    base = rng.normal(18.0, 3.0, len(stations))
+    if 'areatype' in stations.columns:
+        base += np.where(stations['areatype'].astype(str).str.contains('工業'), 8.0, 0.0)
+    return np.clip(base, 8.0, None)
+
+
+def make_frame(stations, timestamps, rng, baseline, state=None, missing=0.03):
+    """
+    產生 timestamps (DatetimeIndex) 內所有測站的逐時資料，依 (時間, 測站) 排序。
+    state 為上一小時的 (區域變動, 各站雜訊) AR(1) 狀態 (分段產生時延續)，回傳 (資料表, 新的 state)。
+    """
+    n_hours, n_sites = len(timestamps), len(stations)
+    hour = timestamps.hour.to_numpy()[:, None]
+    doy = timestamps.dayofyear.to_numpy()[:, None]
+
+    # 冬季 (1 月) 最高，夏季 (7 月) 最低
+    season = 1.0 + 0.45 * np.cos(2 * np.pi * (doy - 15) / 365.25)
+    # 早上 8 時與晚上 20 時的尖峰，午後較低
+    diurnal = (1.0 + 0.25 * np.exp(-((hour - 8) ** 2) / 4.0) + 0.35 * np.exp(-((hour - 20) ** 2) / 6.0)
+               - 0.15 * np.exp(-((hour - 14) ** 2) / 6.0))
+    # 全區共同的天氣變動 (數日尺度) 與各站的短時變動，皆為對數尺度的 AR(1)
+    regional, noise = (0.0, np.zeros(n_sites)) if state is None else state
+    regional_shocks = rng.normal(0, 0.04, n_hours)
+    shocks = rng.normal(0, 0.18, (n_hours, n_sites))
+    log_factor = np.empty((n_hours, n_sites))
+    for i in range(n_hours):
+        regional = 0.98 * regional + regional_shocks[i]
+        noise = 0.85 * noise + shocks[i]
+        log_factor[i] = regional + noise
+
+    pm25 = np.clip(baseline[None, :] * season * diurnal * np.exp(log_factor), 0.5, 300.0)
+    pm25_std = pm25 * rng.uniform(0.05, 0.3, pm25.shape)
+
+    # 冬季東北季風 (約 20 度)、夏季西南風 (約 220 度)
+    summer = 0.5 - 0.5 * np.cos(2 * np.pi * (doy - 15) / 365.25)
+    prevailing = 20.0 + 200.0 * summer
+    direction = np.mod(prevailing + rng.normal(0, 45, (n_hours, n_sites)), 360.0)
+    speed = rng.gamma(2.0, 0.8, (n_hours, n_sites)) * (1.0 + 0.5 * np.exp(-((hour - 14) ** 2) / 10.0))
+
+    temperature = (19.0 + 11.0 * summer + 3.0 * np.sin(2 * np.pi * (hour - 9) / 24)
+                   + rng.normal(0, 1.0, (n_hours, n_sites)))
+    humidity = np.clip(75 + 10 * summer - 12 * np.sin(2 * np.pi * (hour - 9) / 24)
+                       + rng.normal(0, 5, (n_hours, n_sites)), 20, 100)
+    discomfort = temperature - 0.55 * (1 - 0.01 * humidity) * (temperature - 14.5)
+
+    df = pd.DataFrame({
+        'deviceId': np.tile(stations['deviceId'].to_numpy(), n_hours),
+        'timestamp': np.repeat(timestamps.strftime('%Y-%m-%d %H:%M:%S').to_numpy(), n_sites),
+        'pm25_mean': pm25.ravel().round(2),
+        'pm25_std': pm25_std.ravel().round(3),
+        'pm25_cv': (pm25_std / pm25 * 100).ravel().round(2),
+        'pm25_exceeds_35_pct': np.where(pm25 > 35.0, 100.0, 0.0).ravel(),
+        'temperature_mean': temperature.ravel().round(2),
+        'humidity_mean': humidity.ravel().round(1),
+        'discomfort_index_mean': discomfort.ravel().round(2),
+        'WindSpeed_Mean': speed.ravel().round(2),
+        'WindDirection_Mean': direction.ravel().round(1),
+    })
+
+    if missing > 0:
+        for col in ['pm25_mean', 'temperature_mean', 'humidity_mean', 'WindSpeed_Mean', 'WindDirection_Mean']:
+            df.loc[rng.random(len(df)) < missing, col] = np.nan
+    return df, (regional, noise)
+
+
+def write_year(path, stations, year, rng, baseline, days=None, missing=0.03):
+    """寫入一個年度檔，回傳列數；days 指定時只產生該年前 days 天"""
+    start = pd.Timestamp(year=year, month=1, day=1)
+    end = pd.Timestamp(year=year + 1, month=1, day=1)
+    if days is not None:
+        end = min(end, start + pd.Timedelta(days=days))
+    timestamps = pd.date_range(start, end, freq='h', inclusive='left')
+
+    rows = 0
+    state = None
+    tmp_path = path.with_name(path.name + '.tmp')
+    for offset in range(0, len(timestamps), HOURS_PER_CHUNK):
+        chunk, state = make_frame(stations, timestamps[offset:offset + HOURS_PER_CHUNK], rng, baseline,
+                                  state, missing)
+        chunk.to_csv(tmp_path, mode='w' if offset == 0 else 'a', header=offset == 0, index=False)
+        rows += len(chunk)
+    tmp_path.replace(path)
+    return rows
+
+
+def generate(out_dir, years, days=None, seed=0, station_file=STATION_FILE, missing=0.03):
+    """
+    在 out_dir 產生各年度檔與測站檔 (Kaohsiung_iot_station.csv)，回傳 {檔名: 列數}。
+    同一 (years, days, seed) 產生的內容相同。
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stations = load_stations(station_file)
+    shutil.copyfile(station_file, out_dir / 'Kaohsiung_iot_station.csv')
+
+    rng = np.random.default_rng(seed)
+    baseline = station_baseline(stations, rng)
+    written = {}
+    for year in years:
+        path = out_dir / f'kaohsiung_airbox_hourly_with_wind_{year}.csv'
+        written[path.name] = write_year(path, stations, year, np.random.default_rng([seed, year]),
+                                        baseline, days, missing)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--out', required=True, help='輸出資料目錄')
+    parser.add_argument('--years', type=int, nargs='+', default=[2020])
+    parser.add_argument('--days', type=int, help='每年只產生前 N 天 (預設整年)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--missing', type=float, default=0.03, help='量測值缺值比例')
+    parser.add_argument('--station-file', default=str(STATION_FILE))
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    written = generate(args.out, args.years, args.days, args.seed, args.station_file, args.missing)
+    for name, rows in written.items():
+        print(f"{name}: {rows} 列")
+    print(f"完成 ({time.perf_counter() - t0:.1f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
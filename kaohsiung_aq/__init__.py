@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""
+高雄新市鎮空氣污染時空分布分析系統 - 核心模組
+Kaohsiung Air Quality Spatial-Temporal Analysis System - core package
+
+不依賴 Streamlit，可供 app.py、批次腳本與效能測試共用。
+"""
+
+from kaohsiung_aq.diffusion import DenseDiffusionModel
+
+__all__ = ['DenseDiffusionModel']
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""
+時間聚合與測站聚合
+
+aggregate_sites 為原本的逐 (時間區段, 時段) 聚合；build_site_table 則一次產生所有
+(時間區段 x 時段 x 測站) 的統計表，供所有圖表類型共用:
+
+1. 對原始資料只做一次 groupby (時間區段, 小時, 測站)，得到各數值欄位的總和與筆數、
+   每組第一筆的列位置與座標，以及風向眾數所需的 (風向值) 出現次數。
+2. 各時段再由這張 (遠小於原始資料的) 小時層級表加總而得：平均 = 總和 / 筆數，
+   座標取列位置最早者 (等同 'first')。
+3. 風向依 wind_mode 統計 (見 kaohsiung_aq/wind.py)：'mode' 取出現次數最多者
+   (同次數取最小值，等同 mode()[0])，'vector' 由風速加權的分量總和計算向量平均。
+
+時間區段欄位 (calendar_features，於 pipeline.clean_stage 一次產生) 為整數代碼，
+排序與原本的字串標籤相同；標籤只在出圖時對用到的時間區段產生 (PERIOD_LABELS):
+- date       : YYYYMMDD         -> '2020-01-05'
+- year_week  : YYYY * 100 + 週  -> '2020-W01'
+- year_month : YYYY * 100 + 月  -> '2020-01'
+- year_season: YYYY * 10 + 季節代碼 (SEASON_NAMES 的索引) -> '2020-Winter'
+"""
+
+import numpy as np
+import pandas as pd
+
+from kaohsiung_aq.config import TIME_PERIODS
+from kaohsiung_aq.wind import (DEFAULT_WIND_MODE, VECTOR_COLS, counts_to_mode, direction_counts,
+                               finalize_vector, vector_sums, wind_stats)
+
+# 時間聚合方式 -> 分組欄位
+PERIOD_COLUMNS = {
+    'hourly': 'timestamp',
+    'daily': 'date',
+    'weekly': 'year_week',
+    'monthly': 'year_month',
+    'seasonal': 'year_season',
+    'yearly': 'year',
+}
+
+WIND_COLS = ['WindDirection_Mean', 'WindSpeed_Mean']
+
+# 季節代碼依名稱的字母順序，整數代碼的排序與原本的 'YYYY-季節' 字串相同
+SEASON_NAMES = ['Autumn', 'Spring', 'Summer', 'Winter']
+
+# 月份 (1-12) -> 季節代碼
+MONTH_SEASON = np.array([3, 3, 1, 1, 1, 2, 2, 2, 0, 0, 0, 3], dtype=np.int8)
+
+# 時間聚合方式 -> 時間區段標籤 (圖檔名稱與標題)
+PERIOD_LABELS = {
+    'hourly': lambda t: t.strftime('%Y-%m-%d %H:00'),
+    'daily': lambda c: f"{c // 10000}-{c // 100 % 100:02d}-{c % 100:02d}",
+    'weekly': lambda c: f"{c // 100}-W{c % 100:02d}",
+    'monthly': lambda c: f"{c // 100}-{c % 100:02d}",
+    'seasonal': lambda c: f"{c // 10}-{SEASON_NAMES[c % 10]}",
+    'yearly': lambda y: str(y),
+}
+
+
+# ========================================
+# 曆法欄位
+# ========================================
+def calendar_features(timestamps):
+    """
+    由 datetime64 欄位產生曆法欄位與各時間聚合方式的整數代碼 ({欄位: 陣列})。
+    年/月/日/ISO 週只對資料涵蓋的每一天計算一次，再以天數索引 (整數運算) 展開到各列；
+    季節以 MONTH_SEASON 查表，不逐列呼叫 Python 函式或串接字串。
+    週數為 ISO 週、年份為西元年 (與原本 'YYYY-Www' 標籤的組合方式相同)。
+    """
+    values = timestamps.to_numpy(dtype='datetime64[ns]')
+    days = values.astype('datetime64[D]').astype(np.int64)
+    first = days.min()
+    day_index = days - first
+    calendar = pd.DatetimeIndex(np.arange(first, days.max() + 1).astype('datetime64[D]'))
+
+    year = calendar.year.to_numpy().astype(np.int16)[day_index]
+    month = calendar.month.to_numpy().astype(np.int8)[day_index]
+    week = calendar.isocalendar().week.to_numpy().astype(np.int8)[day_index]
+    day = calendar.day.to_numpy().astype(np.int32)[day_index]
+    year32 = year.astype(np.int32)
+    return {
+        'date': year32 * 10000 + month.astype(np.int32) * 100 + day,
+        'hour': (values.astype('datetime64[h]').astype(np.int64) % 24).astype(np.int8),
+        'year': year,
+        'month': month,
+        'week': week,
+        'year_week': year32 * 100 + week,
+        'year_month': year32 * 100 + month,
+        'year_season': year * 10 + MONTH_SEASON[month - 1],
+    }
+
+
+# ========================================
+# 時間聚合函數
+# ========================================
+def aggregate_by_time(df, aggregation='daily'):
+    """
+    依時間聚合方式分組；df 需含 calendar_features 的欄位，不會新增或改動欄位。
+    回傳 (groups, 排序後的時間區段, label_format)
+    """
+    if aggregation not in PERIOD_COLUMNS:
+        raise ValueError(f"Unknown aggregation: {aggregation}")
+
+    period_col = PERIOD_COLUMNS[aggregation]
+    groups = df.groupby(period_col)
+    if aggregation == 'hourly':
+        time_periods = sorted(df[period_col].unique())
+    else:
+        time_periods = np.unique(df[period_col].to_numpy()).tolist()
+    return groups, time_periods, PERIOD_LABELS[aggregation]
+
+
+def period_codes(dates, aggregation):
+    """由 YYYYMMDD 日期代碼計算 aggregation (hourly 以外) 的時間區段代碼；曆法欄位只對不重複的日期計算"""
+    unique, inverse = np.unique(np.asarray(dates), return_inverse=True)
+    if len(unique) == 0:
+        return np.empty(0, dtype=np.int32)
+    days = pd.Series(pd.to_datetime(unique.astype(str), format='%Y%m%d'))
+    return calendar_features(days)[PERIOD_COLUMNS[aggregation]][inverse.ravel()]
+
+
+# ========================================
+# 測站聚合
+# ========================================
+def aggregate_sites(period_data, plot_config, wind_mode=DEFAULT_WIND_MODE):
+    value_col = plot_config['value_col']
+
+    # 聚合測站資料
+    agg_dict = {
+        'lon': 'first',
+        'lat': 'first',
+        value_col: 'mean',
+    }
+
+    wind_mode = site_wind_mode(plot_config, period_data.columns, wind_mode)
+    if plot_config['use_wind'] and 'WindSpeed_Mean' in period_data.columns:
+        agg_dict['WindSpeed_Mean'] = 'mean'
+
+    site_avg = period_data.groupby('deviceId').agg(agg_dict)
+    if wind_mode is not None:
+        # 風向以向量化統計取代逐組的 mode() lambda
+        site_avg = site_avg.join(wind_stats(period_data, ['deviceId'], wind_mode))
+    site_avg = site_avg.reset_index()[site_columns(plot_config, site_avg.columns)]
+    site_avg = site_avg.dropna(subset=[value_col])
+
+    if len(site_avg) == 0:
+        return None
+
+    return site_avg
+
+
+def site_wind_mode(plot_config, columns, wind_mode=DEFAULT_WIND_MODE):
+    """實際使用的風向統計方式；不需風向時為 None。缺少風速時 'vector' 退回 'mode'"""
+    if not plot_config['use_wind'] or 'WindDirection_Mean' not in columns:
+        return None
+    if wind_mode == 'vector' and 'WindSpeed_Mean' not in columns:
+        return 'mode'
+    return wind_mode
+
+
+def site_columns(plot_config, columns):
+    """測站資料的欄位順序 (與原本 aggregate_sites 相同，向量統計欄位接在最後)"""
+    result = ['deviceId', 'lon', 'lat', plot_config['value_col']]
+    if plot_config['use_wind']:
+        result += [col for col in WIND_COLS + VECTOR_COLS if col in columns and col not in result]
+    return result
+
+
+def table_columns(plot_configs, columns, wind_mode=DEFAULT_WIND_MODE):
+    """所選圖表需要的 (平均值欄位, 風向統計方式或 None)，只保留資料中存在的欄位"""
+    mean_cols = []
+    direction_mode = None
+    for plot_config in plot_configs:
+        wanted = [plot_config['value_col']]
+        if plot_config['use_wind']:
+            wanted.append('WindSpeed_Mean')
+            direction_mode = direction_mode or site_wind_mode(plot_config, columns, wind_mode)
+        mean_cols += [col for col in wanted if col in columns and col not in mean_cols]
+    return mean_cols, direction_mode
+
+
+def build_site_table(df, period_col, slot_keys, plot_configs, wind_mode=DEFAULT_WIND_MODE):
+    """
+    一次計算所有 (時間區段, 時段, 測站) 的座標、平均值與風向統計。
+    回傳以 (period, slot, deviceId) 排序的資料表；欄位為 lon, lat, 各平均值欄位
+    與 WindDirection_Mean (若需要；'vector' 模式另含 wind_u, wind_v, wind_resultant)。
+    """
+    mean_cols, direction_mode = table_columns(plot_configs, df.columns, wind_mode)
+    keys = [period_col, 'hour', 'deviceId']
+
+    work = df[keys + ['lon', 'lat']].copy()
+    work['_pos'] = np.arange(len(work))
+    for col in mean_cols:
+        # 以 float64 累加 (資料可能為 float32)
+        work[f'{col}__sum'] = df[col].astype(np.float64)
+        work[f'{col}__count'] = df[col].notna().astype(np.int64)
+    if direction_mode == 'vector':
+        # 風向分量與其他平均值一起逐層加總
+        sums = vector_sums(df['WindDirection_Mean'], df['WindSpeed_Mean'])
+        for col in sums.columns:
+            work[col] = sums[col].to_numpy()
+
+    # 唯一一次對原始資料的 groupby
+    grouped = work.groupby(keys, sort=False, observed=True)
+    hourly = grouped[[c for c in work.columns if c.endswith('__sum') or c.endswith('__count')]].sum()
+    hourly['_pos'] = grouped['_pos'].min()
+    hourly[['lon', 'lat']] = grouped[['lon', 'lat']].first()
+    hourly = hourly.reset_index()
+
+    counts = None
+    if direction_mode == 'mode':
+        counts = direction_counts(df, keys)
+
+    tables = []
+    for slot_key in slot_keys:
+        hours = TIME_PERIODS[slot_key]['hours']
+        part = hourly if slot_key == 'all' else hourly[hourly['hour'].isin(hours)]
+        if len(part) == 0:
+            continue
+
+        slot_counts = None
+        if counts is not None:
+            slot_counts = counts if slot_key == 'all' else counts[counts['hour'].isin(hours)]
+        table = sum_site_table(part, [period_col, 'deviceId'], mean_cols, direction_mode, slot_counts)
+        table['slot'] = slot_key
+        tables.append(table.reset_index())
+
+    return concat_site_tables(tables, period_col, mean_cols, direction_mode)
+
+
+def sum_site_table(part, group_keys, mean_cols, direction_mode, counts=None):
+    """
+    將可加總的列 (<欄位>__sum、<欄位>__count、風向分量、_pos、lon、lat) 依 group_keys 加總，
+    計算平均值、座標與風向統計；counts 為 direction_counts 格式的風向出現次數 ('mode' 時使用)
+    """
+    grouped = part.groupby(group_keys, sort=False, observed=True)
+    table = grouped[[c for c in part.columns if '__' in c]].sum()
+    for col in mean_cols:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table[col] = table[f'{col}__sum'] / table[f'{col}__count'].where(table[f'{col}__count'] > 0)
+
+    # 座標取最早出現的一筆 (與 groupby 'first' 相同)
+    first = part.sort_values('_pos').drop_duplicates(group_keys).set_index(group_keys)[['lon', 'lat']]
+    vector = finalize_vector(table) if direction_mode == 'vector' else None
+    table = table[mean_cols].join(first)
+
+    if vector is not None:
+        table = table.join(vector)
+    elif counts is not None:
+        modes = counts_to_mode(counts, group_keys)
+        # 全為缺值的測站沒有眾數，與原本 x.mean() 的結果相同 (NaN)
+        table['WindDirection_Mean'] = modes.reindex(table.index).to_numpy(dtype=np.float64)
+    return table
+
+
+def concat_site_tables(tables, period_col, mean_cols, direction_mode):
+    """合併各時段的 sum_site_table 結果 (已加入 slot 欄位)，依 (period, slot, deviceId) 排序"""
+    columns = [period_col, 'slot', 'deviceId', 'lon', 'lat'] + mean_cols
+    if direction_mode is not None:
+        columns.append('WindDirection_Mean')
+    if direction_mode == 'vector':
+        columns += VECTOR_COLS
+    if not tables:
+        return pd.DataFrame(columns=columns).set_index([period_col, 'slot'])
+
+    table = pd.concat(tables, ignore_index=True)[columns]
+    table = table.sort_values([period_col, 'slot', 'deviceId'], kind='stable')
+    return table.set_index([period_col, 'slot'])
+
+
+def site_averages(site_table, period, slot_key, plot_config):
+    """由 build_site_table 的結果取出單一 (時間區段, 時段, 圖表) 的測站資料，格式同 aggregate_sites"""
+    value_col = plot_config['value_col']
+    if value_col not in site_table.columns:
+        return None
+    try:
+        # 資料表已依 (period, slot) 排序，get_loc 回傳連續的列範圍
+        rows = site_table.index.get_loc((period, slot_key))
+    except KeyError:
+        return None
+
+    columns = site_columns(plot_config, site_table.columns)
+    if isinstance(rows, (int, np.integer)):
+        rows = slice(rows, rows + 1)
+    rows = site_table.iloc[rows]
+    site_avg = rows.loc[rows[value_col].notna().to_numpy(), columns]
+    if len(site_avg) == 0:
+        return None
+    return site_avg.reset_index(drop=True)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+離線底圖 (Offline Basemap)
+
+出圖時只使用本機圖磚庫，不連線網路：圖磚以 {tile_dir}/{style}/{z}/{x}/{y}.{ext}
+存放，依範圍與 DPI 選擇縮放層級，拼接後由 Web Mercator 轉為經緯度 (EPSG:4326)
+網格。同一 (範圍, 底圖風格, 縮放層級) 的底圖影像只產生一次，之後每張圖共用。
+圖磚不存在時 add_basemap 立即回傳 False，由呼叫端改用無底圖的樣式。
+
+圖磚庫由預先下載指令建立 (預設為測站範圍，縮放層級 11-15)：
+
+    python -m kaohsiung_aq.basemap --styles Standard Light Dark Satellite
+
+圖磚庫位置預設為 data/basemap_tiles，可用環境變數 AQ_TILE_DIR 或 --tile-dir 指定。
+"""
+
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+TILE_DIR = os.environ.get('AQ_TILE_DIR', str(Path('data') / 'basemap_tiles'))
+
+# 側邊欄的底圖風格 -> 圖磚來源
+PROVIDERS = {
+    'Standard': {
+        'url': 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+        'ext': 'png',
+        'attribution': '(C) OpenStreetMap contributors',
+    },
+    'Light': {
+        'url': 'https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png',
+        'ext': 'png',
+        'attribution': '(C) OpenStreetMap contributors (C) CARTO',
+    },
+    'Dark': {
+        'url': 'https://a.basemaps.cartocdn.com/dark_all/{z}/{x}/{y}.png',
+        'ext': 'png',
+        'attribution': '(C) OpenStreetMap contributors (C) CARTO',
+    },
+    'Satellite': {
+        'url': 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}',
+        'ext': 'jpg',
+        'attribution': 'Tiles (C) Esri',
+    },
+}
+
+TILE_SIZE = 256
+MAX_ZOOM = 19
+
+# 預先下載的預設縮放層級 (150-300 DPI 出圖約需 14-15 級)
+PREFETCH_ZOOMS = (11, 15)
+
+# 每個程序保留的底圖影像數量
+RASTER_CACHE_SIZE = 8
+
+USER_AGENT = 'kaohsiung-air-quality/12.0 (basemap prefetch)'
+
+_rasters = OrderedDict()
+_rasters_lock = threading.Lock()
+
+
+# ========================================
+# 圖磚座標
+# ========================================
+def lonlat_to_tile(lon, lat, zoom):
+    """經緯度 -> Web Mercator 圖磚座標 (浮點數)"""
+    n = 2.0 ** zoom
+    lat_rad = np.radians(lat)
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0 * n
+    return x, y
+
+
+def tile_range(bbox, zoom):
+    """bbox = (lon_min, lon_max, lat_min, lat_max) 涵蓋的圖磚範圍 (x0, x1, y0, y1)，含端點"""
+    lon_min, lon_max, lat_min, lat_max = bbox
+    x0, y0 = lonlat_to_tile(lon_min, lat_max, zoom)
+    x1, y1 = lonlat_to_tile(lon_max, lat_min, zoom)
+    last = 2 ** zoom - 1
+    return (max(int(math.floor(x0)), 0), min(int(math.floor(x1)), last),
+            max(int(math.floor(y0)), 0), min(int(math.floor(y1)), last))
+
+
+def tile_path(tile_dir, style, zoom, x, y):
+    return Path(tile_dir) / style / str(zoom) / str(x) / f"{y}.{PROVIDERS[style]['ext']}"
+
+
+def iter_tiles(bbox, zoom):
+    x0, x1, y0, y1 = tile_range(bbox, zoom)
+    for x in range(x0, x1 + 1):
+        for y in range(y0, y1 + 1):
+            yield x, y
+
+
+def auto_zoom(bbox, pixel_width):
+    """使圖磚解析度不低於輸出解析度的縮放層級"""
+    lon_span = bbox[1] - bbox[0]
+    zoom = math.ceil(math.log2(max(pixel_width, 1) * 360.0 / (TILE_SIZE * lon_span)))
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+# ========================================
+# 本機圖磚庫
+# ========================================
+def has_tiles(style, tile_dir=None):
+    style_dir = Path(tile_dir or TILE_DIR) / style
+    return style in PROVIDERS and style_dir.is_dir() and any(style_dir.iterdir())
+
+
+def available_zoom(style, bbox, desired, tile_dir=None):
+    """
+    完整涵蓋 bbox 的縮放層級：優先取 >= desired 的最小層級，否則取 < desired 的最大層級；
+    都沒有時回傳 None
+    """
+    tile_dir = tile_dir or TILE_DIR
+    style_dir = Path(tile_dir) / style
+    if not style_dir.is_dir():
+        return None
+
+    zooms = sorted(int(p.name) for p in style_dir.iterdir() if p.name.isdigit())
+    candidates = [z for z in zooms if z >= desired] + [z for z in reversed(zooms) if z < desired]
+    for zoom in candidates:
+        if all(tile_path(tile_dir, style, zoom, x, y).exists() for x, y in iter_tiles(bbox, zoom)):
+            return zoom
+    return None
+
+
+def stitch(style, bbox, zoom, tile_dir=None):
+    """拼接 bbox 涵蓋的圖磚，回傳 (RGB 影像, 左上角圖磚 x, y)"""
+    from PIL import Image
+
+    tile_dir = tile_dir or TILE_DIR
+    x0, x1, y0, y1 = tile_range(bbox, zoom)
+    mosaic = np.empty(((y1 - y0 + 1) * TILE_SIZE, (x1 - x0 + 1) * TILE_SIZE, 3), dtype=np.uint8)
+    for x, y in iter_tiles(bbox, zoom):
+        with Image.open(tile_path(tile_dir, style, zoom, x, y)) as tile:
+            tile = tile.convert('RGB')
+            if tile.size != (TILE_SIZE, TILE_SIZE):
+                tile = tile.resize((TILE_SIZE, TILE_SIZE))
+            row, col = (y - y0) * TILE_SIZE, (x - x0) * TILE_SIZE
+            mosaic[row:row + TILE_SIZE, col:col + TILE_SIZE] = np.asarray(tile)
+    return mosaic, x0, y0
+
+
+def warp_to_lonlat(mosaic, x0, y0, zoom, bbox):
+    """
+    將 Web Mercator 拼接影像重新取樣為經緯度等間距網格 (上方為北)。
+    經度方向兩種投影皆為線性，只有緯度方向需要非線性對應。
+    """
+    from scipy.ndimage import map_coordinates
+
+    lon_min, lon_max, lat_min, lat_max = bbox
+    left, top = lonlat_to_tile(lon_min, lat_max, zoom)
+    right, bottom = lonlat_to_tile(lon_max, lat_min, zoom)
+    nx = max(int(round((right - left) * TILE_SIZE)), 1)
+    ny = max(int(round((bottom - top) * TILE_SIZE)), 1)
+
+    # 輸出像素中心的經緯度 -> 拼接影像中的像素座標
+    lons = lon_min + (np.arange(nx) + 0.5) / nx * (lon_max - lon_min)
+    lats = lat_max - (np.arange(ny) + 0.5) / ny * (lat_max - lat_min)
+    cols = (lonlat_to_tile(lons, lat_max, zoom)[0] - x0) * TILE_SIZE - 0.5
+    rows = (lonlat_to_tile(lon_min, lats, zoom)[1] - y0) * TILE_SIZE - 0.5
+
+    raster = np.empty((ny, nx, 3), dtype=np.uint8)
+    grid_rows, grid_cols = np.meshgrid(rows, cols, indexing='ij')
+    for channel in range(3):
+        raster[..., channel] = map_coordinates(mosaic[..., channel], [grid_rows, grid_cols],
+                                               order=1, mode='nearest')
+    return raster
+
+
+def get_raster(style, bbox, zoom, tile_dir=None):
+    """取得 (或產生並快取) 經緯度底圖影像；圖磚不完整時回傳 None"""
+    tile_dir = tile_dir or TILE_DIR
+    key = (str(tile_dir), style, tuple(float(v) for v in bbox), zoom)
+    with _rasters_lock:
+        raster = _rasters.get(key)
+        if raster is not None:
+            _rasters.move_to_end(key)
+            return raster
+
+    try:
+        mosaic, x0, y0 = stitch(style, bbox, zoom, tile_dir)
+    except (OSError, ValueError):
+        return None
+    raster = warp_to_lonlat(mosaic, x0, y0, zoom, bbox)
+
+    with _rasters_lock:
+        _rasters[key] = raster
+        while len(_rasters) > RASTER_CACHE_SIZE:
+            _rasters.popitem(last=False)
+    return raster
+
+
+def add_basemap(ax, bbox, style, dpi, alpha=0.8, zorder=1, tile_dir=None):
+    """
+    於 ax 加上本機圖磚底圖與來源標示；找不到完整圖磚時不連線，直接回傳 False。
+    bbox = (lon_min, lon_max, lat_min, lat_max)
+    """
+    if style not in PROVIDERS or not has_tiles(style, tile_dir):
+        return False
+
+    fig = ax.figure
+    pixel_width = ax.get_position().width * fig.get_figwidth() * dpi
+    zoom = available_zoom(style, bbox, auto_zoom(bbox, pixel_width), tile_dir)
+    if zoom is None:
+        return False
+
+    raster = get_raster(style, bbox, zoom, tile_dir)
+    if raster is None:
+        return False
+
+    lon_min, lon_max, lat_min, lat_max = bbox
+    ax.imshow(raster, extent=(lon_min, lon_max, lat_min, lat_max), origin='upper',
+              interpolation='bilinear', alpha=alpha, zorder=zorder)
+    ax.text(0.005, 0.005, PROVIDERS[style]['attribution'], transform=ax.transAxes,
+            ha='left', va='bottom', fontsize=8, color='#333333', zorder=zorder + 10,
+            bbox=dict(facecolor='white', edgecolor='none', alpha=0.6, pad=1))
+    return True
+
+
+# ========================================
+# 預先下載
+# ========================================
+def prefetch(styles, bbox, zooms=PREFETCH_ZOOMS, tile_dir=None, timeout=10, delay=0.05, progress=None):
+    """
+    下載 bbox 在 zooms (最小, 最大) 範圍內的圖磚；已存在的圖磚略過。
+    回傳 {style: (下載數, 略過數, 失敗數)}
+    """
+    tile_dir = tile_dir or TILE_DIR
+    results = {}
+    for style in styles:
+        provider = PROVIDERS[style]
+        fetched = skipped = failed = 0
+        for zoom in range(zooms[0], zooms[1] + 1):
+            for x, y in iter_tiles(bbox, zoom):
+                path = tile_path(tile_dir, style, zoom, x, y)
+                if path.exists():
+                    skipped += 1
+                    continue
+
+                request = urllib.request.Request(provider['url'].format(z=zoom, x=x, y=y),
+                                                 headers={'User-Agent': USER_AGENT})
+                try:
+                    with urllib.request.urlopen(request, timeout=timeout) as response:
+                        content = response.read()
+                except OSError as e:
+                    failed += 1
+                    if progress is not None:
+                        progress(f"{style} z{zoom} {x}/{y}: {e}")
+                    continue
+
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(path.suffix + '.tmp')
+                tmp_path.write_bytes(content)
+                os.replace(tmp_path, path)
+                fetched += 1
+                time.sleep(delay)
+
+            if progress is not None:
+                progress(f"{style} z{zoom}: 下載 {fetched} / 略過 {skipped} / 失敗 {failed}")
+        results[style] = (fetched, skipped, failed)
+    return results
+
+
+def station_bbox(station_file, margin=0.02):
+    """與分析流程相同：測站範圍外擴 margin 度"""
+    import pandas as pd
+
+    stations = pd.read_csv(station_file)
+    return (stations['lon'].min() - margin, stations['lon'].max() + margin,
+            stations['lat'].min() - margin, stations['lat'].max() + margin)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='預先下載離線底圖圖磚')
+    parser.add_argument('--styles', nargs='+', choices=list(PROVIDERS), default=list(PROVIDERS))
+    parser.add_argument('--station-file', default=str(Path('data') / 'Kaohsiung_iot_station.csv'),
+                        help='未指定 --bbox 時以測站範圍 (外擴 0.02 度) 為下載範圍')
+    parser.add_argument('--bbox', type=float, nargs=4, metavar=('LON_MIN', 'LON_MAX', 'LAT_MIN', 'LAT_MAX'))
+    parser.add_argument('--zooms', type=int, nargs=2, default=list(PREFETCH_ZOOMS), metavar=('MIN', 'MAX'))
+    parser.add_argument('--tile-dir', default=TILE_DIR)
+    args = parser.parse_args(argv)
+
+    bbox = tuple(args.bbox) if args.bbox else station_bbox(args.station_file)
+    print(f"範圍: {bbox}  縮放層級: {args.zooms[0]}-{args.zooms[1]}  圖磚庫: {args.tile_dir}")
+    results = prefetch(args.styles, bbox, tuple(args.zooms), args.tile_dir, progress=print)
+    return 0 if all(failed == 0 for _, _, failed in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
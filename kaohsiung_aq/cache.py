@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+分析流程的分層快取 (Stage Cache)
+
+分析流程的每個階段 (讀取、清理、測站合併、網格/幾何、時間聚合、插值) 以只包含
+影響該階段結果的參數為鍵，存放在同一個依記憶體大小限制的 LRU 快取中。
+只改變出圖設定 (透明度、DPI、底圖) 時，所有階段都會命中，直接進入出圖。
+
+快取存在程序內 (Streamlit 各工作階段共用)，快取值應視為唯讀。記憶體上限為伺服器設定
+(環境變數 AQ_CACHE_MB，程序啟動時讀取一次)，各工作階段不能調整。
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 程序共用快取的記憶體上限 (MB)
+CACHE_MAX_MB = int(os.environ.get('AQ_CACHE_MB') or 1024)
+
+_MISSING = object()
+
+
+class StageCache:
+    def __init__(self, max_mb=CACHE_MAX_MB):
+        self.max_mb = max_mb
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, stage, key, default=None, stats=None):
+        """
+        取得 (stage, key) 的快取值，未命中時回傳 default。
+        stats 為 dict 時累計 stats[stage] = [命中數, 未命中數]。
+        """
+        full_key = (stage, key)
+        with self._lock:
+            value = self._entries.get(full_key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(full_key)
+                value = value[0]
+
+        if stats is not None:
+            counts = stats.setdefault(stage, [0, 0])
+            counts[0 if value is not _MISSING else 1] += 1
+        return default if value is _MISSING else value
+
+    def get_or_compute(self, stage, key, compute, stats=None):
+        """取得 (stage, key) 的快取值，未命中時呼叫 compute() 並存入 (stats 同 get)"""
+        value = self.get(stage, key, _MISSING, stats)
+        if value is not _MISSING:
+            return value
+
+        value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def put(self, stage, key, value):
+        # 上限為 0 時不保留任何結果 (例如單次執行的命令列)
+        if self.max_mb <= 0:
+            return
+        nbytes = estimate_nbytes(value)
+        full_key = (stage, key)
+        with self._lock:
+            if full_key in self._entries:
+                self._nbytes -= self._entries.pop(full_key)[1]
+            # 單一項目超過上限時不快取
+            if nbytes > self.max_mb * 1024 * 1024:
+                return
+            self._entries[full_key] = (value, nbytes)
+            self._nbytes += nbytes
+            while self._nbytes > self.max_mb * 1024 * 1024:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._nbytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+_stage_cache = StageCache()
+
+
+def get_stage_cache():
+    """程序共用的 StageCache (上限為 CACHE_MAX_MB)"""
+    return _stage_cache
+
+
+def estimate_nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_nbytes(v) for v in value.values())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def freeze(value):
+    """將 list/dict/set 轉為可雜湊的 tuple，用於組成快取鍵"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(v) for v in value))
+    return value
+
+
+def file_signature(path):
+    """(絕對路徑, mtime, 大小)；檔案不存在時大小為 -1"""
+    path = Path(path)
+    try:
+        stat = path.stat()
+    except OSError:
+        return (str(path.resolve()), None, -1)
+    return (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+選項與圖表配置 (資料欄位、時間聚合方式、時段定義、圖表類型)
+"""
+
+# ========================================
+# 資料欄位
+# ========================================
+# 年度逐時資料檔名 (位於資料目錄)
+SOURCE_PATTERN = 'kaohsiung_airbox_hourly_with_wind*.csv'
+
+NUMERIC_COLS = ['pm25_mean', 'pm25_std', 'pm25_cv', 'pm25_exceeds_35_pct', 
+                'temperature_mean', 'humidity_mean', 'discomfort_index_mean',
+                'WindSpeed_Mean', 'WindDirection_Mean']
+
+# PM2.5 合理範圍，超出視為異常值 (缺值保留)
+PM25_RANGE = (0, 500)
+
+# ========================================
+# 定義選項映射
+# ========================================
+TIME_AGG_MAPPING = {
+    'hourly': '每小時',
+    'daily': '每日',
+    'weekly': '每週',
+    'monthly': '每月',
+    'seasonal': '每季',
+    'yearly': '每年'
+}
+
+# ========================================
+# 時段定義
+# ========================================
+TIME_PERIODS = {
+    'all': {'name': '全時段 (00:00-23:00)', 'hours': list(range(24))},
+    'dawn': {'name': '清晨 (05:00-07:00)', 'hours': [5, 6]},
+    'morning_peak': {'name': '早上 (07:00-09:00)', 'hours': [7, 8]},
+    'noon': {'name': '午間 (12:00-14:00)', 'hours': [12, 13]},
+    'evening_peak': {'name': '傍晚 (17:00-19:00)', 'hours': [17, 18]},
+    'night': {'name': '夜間 (20:00-22:00)', 'hours': [20, 21]},
+    'midnight': {'name': '深夜 (22:00-05:00)', 'hours': [22, 23, 0, 1, 2, 3, 4]}
+}
+
+# ========================================
+# 圖表配置
+# ========================================
+PLOT_CONFIGS = {
+    'pm25': {
+        'value_col': 'pm25_mean',
+        'title': 'PM2.5 空間分布',
+        'unit': 'μg/m³',
+        'colors': ['#00e400', '#92d050', '#ffff00', '#ff9900', '#ff0000', '#990033'],
+        'levels': [0, 12, 24, 36, 48, 60, 80],
+        'use_wind': True,
+    },
+    'temperature': {
+        'value_col': 'temperature_mean',
+        'title': '溫度空間分布',
+        'unit': '°C',
+        'colors': ['#0000ff', '#00ffff', '#00ff00', '#ffff00', '#ff0000'],
+        'levels': [15, 20, 25, 30, 35, 40],
+        'use_wind': False,
+    },
+    'humidity': {
+        'value_col': 'humidity_mean',
+        'title': '濕度空間分布',
+        'unit': '%',
+        'colors': ['#8B4513', '#D2691E', '#F4A460', '#87CEEB', '#4682B4', '#000080'],
+        'levels': [30, 40, 50, 60, 70, 80, 90],
+        'use_wind': False,
+    },
+    'pm25_variability': {
+        'value_col': 'pm25_cv',
+        'title': 'PM2.5 變異係數',
+        'unit': '%',
+        'colors': ['#00ff00', '#ffff00', '#ff9900', '#ff0000'],
+        'levels': [0, 10, 20, 30, 40, 50],
+        'use_wind': False,
+    },
+    'pm25_exceed': {
+        'value_col': 'pm25_exceeds_35_pct',
+        'title': 'PM2.5 超標比例',
+        'unit': '%',
+        'colors': ['#00ff00', '#ffff00', '#ff9900', '#ff0000', '#990033'],
+        'levels': [0, 10, 25, 50, 75, 100],
+        'use_wind': False,
+    },
+    'wind_field': {
+        'value_col': 'pm25_mean',
+        'title': '風場向量圖',
+        'unit': '',
+        'colors': ['#00e400', '#92d050', '#ffff00', '#ff9900', '#ff0000', '#990033'],
+        'levels': [0, 12, 24, 36, 48, 60, 80],
+        'use_wind': True,
+    }
+}
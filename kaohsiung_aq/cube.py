@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+插值網格匯出 (時間 x 緯度 x 經度 資料立方體)
+
+每個 (圖表類型, 時段) 寫成一個記憶體映射的 NumPy 陣列檔 (.npy，float32) 與同名的 .json 說明檔:
+
+    kaohsiung_pm25.npy / kaohsiung_pm25.json
+    kaohsiung_pm25_night.npy / kaohsiung_pm25_night.json
+
+.json 內容仿 NetCDF 的座標與屬性: dims、shape、座標軸 (time 標籤、lat、lon)、
+模型參數 (radius、wind_influence、sigma、distance_decay、grid_resolution) 與分析條件。
+沒有有效測站的時間區段為 NaN。
+
+陣列在建立時即配置完整大小 (稀疏檔)，每個時間區段插值完成後直接寫入對應切片，
+程序中途結束時 .json 的 complete 為 false。讀取時以 open_cube 取得唯讀的記憶體映射，
+不需一次載入:
+
+    data, meta = open_cube('cubes/kaohsiung_pm25')
+    data[meta['time'].index('2020-01')]  # 只讀取該時間區段
+"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+CUBE_DTYPE = np.float32
+
+# 已寫入的時間區段數達此值時 flush 一次，限制尚未寫回磁碟的頁面
+FLUSH_EVERY = 64
+
+
+def cube_name(plot_type, time_period_key='all'):
+    suffix = '' if time_period_key == 'all' else f'_{time_period_key}'
+    return f"kaohsiung_{plot_type}{suffix}"
+
+
+class CubeWriter:
+    """
+    依時間區段逐步寫入資料立方體。periods 為時間軸標籤 (順序即 time 索引)，
+    lon_axis/lat_axis 為網格座標，attrs 為所有立方體共用的屬性 (模型參數等)。
+    """
+
+    def __init__(self, out_dir, periods, lon_axis, lat_axis, attrs=None):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.periods = [str(period) for period in periods]
+        self.lon_axis = np.asarray(lon_axis, dtype=np.float64)
+        self.lat_axis = np.asarray(lat_axis, dtype=np.float64)
+        self.attrs = dict(attrs or {})
+        self._cubes = {}
+
+    @property
+    def paths(self):
+        return [cube['path'] for cube in self._cubes.values()]
+
+    def write(self, plot_type, time_period_key, index, grid_values, plot_config=None):
+        """寫入第 index 個時間區段；grid_values 為 None 時寫入 NaN"""
+        cube = self._cubes.get((plot_type, time_period_key))
+        if cube is None:
+            cube = self._create(plot_type, time_period_key, plot_config or {})
+        if grid_values is None:
+            cube['data'][index] = np.nan
+        else:
+            cube['data'][index] = grid_values
+            cube['written'] += 1
+        cube['pending'] += 1
+        if cube['pending'] >= FLUSH_EVERY:
+            cube['data'].flush()
+            cube['pending'] = 0
+
+    def _create(self, plot_type, time_period_key, plot_config):
+        name = cube_name(plot_type, time_period_key)
+        path = self.out_dir / f"{name}.npy"
+        shape = (len(self.periods), len(self.lat_axis), len(self.lon_axis))
+        data = np.lib.format.open_memmap(path, mode='w+', dtype=CUBE_DTYPE, shape=shape)
+        meta = {
+            'dims': ['time', 'lat', 'lon'],
+            'shape': list(shape),
+            'dtype': np.dtype(CUBE_DTYPE).name,
+            'plot_type': plot_type,
+            'time_period': time_period_key,
+            'value_col': plot_config.get('value_col'),
+            'title': plot_config.get('title'),
+            'unit': plot_config.get('unit'),
+            'time': self.periods,
+            'lat': self.lat_axis.tolist(),
+            'lon': self.lon_axis.tolist(),
+            'attrs': self.attrs,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'complete': False,
+            'written': 0,
+        }
+        cube = {'path': path, 'data': data, 'meta': meta, 'written': 0, 'pending': 0}
+        self._write_meta(cube)
+        self._cubes[(plot_type, time_period_key)] = cube
+        return cube
+
+    def _write_meta(self, cube):
+        meta_path = cube['path'].with_suffix('.json')
+        tmp_path = meta_path.with_name(meta_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(cube['meta'], ensure_ascii=False, indent=1), encoding='utf-8')
+        os.replace(tmp_path, meta_path)
+
+    def close(self, complete=True):
+        for cube in self._cubes.values():
+            if cube['data'] is None:
+                continue
+            cube['data'].flush()
+            cube['meta'].update(complete=complete, written=cube['written'])
+            self._write_meta(cube)
+            # 釋放記憶體映射
+            cube['data'] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+        return False
+
+
+def open_cube(path):
+    """
+    開啟資料立方體 (path 可為 .npy、.json 或不含副檔名)，回傳 (唯讀記憶體映射陣列, 說明 dict)；
+    說明中的 lat/lon 轉為 NumPy 陣列。
+    """
+    path = Path(path)
+    if path.suffix in ('.npy', '.json'):
+        path = path.with_suffix('')
+    meta = json.loads(path.with_suffix('.json').read_text(encoding='utf-8'))
+    meta['lat'] = np.asarray(meta['lat'])
+    meta['lon'] = np.asarray(meta['lon'])
+    data = np.load(path.with_suffix('.npy'), mmap_mode='r')
+    return data, meta
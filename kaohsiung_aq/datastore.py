@@ -0,0 +1,649 @@
+# -*- coding: utf-8 -*-
+"""
+欄式分區資料快取 (Columnar Store)
+
+年度逐時 CSV 只在第一次 (或來源檔變動時) 解析與清理一次，轉存為依 年/月 分區的
+Parquet 檔 (需要 pyarrow)，欄位型別已轉換完成:
+- timestamp : datetime64
+- 量測欄位  : float32
+- deviceId  : categorical
+
+目錄結構 (預設位於資料目錄下的 .aq_cache):
+
+    .aq_cache/
+        manifest.json
+        year=2020/month=01/kaohsiung_airbox_hourly_with_wind_2020.parquet
+        ...
+
+manifest.json 記錄每個來源 CSV 的 mtime/大小/sha1 與其產生的分區。sync() 時
+mtime 與大小皆相同視為未變動；大小相同但 mtime 不同時再比對 sha1。來源變動時
+重新解析該檔，但只改寫內容摘要有變的分區，已刪除的來源則移除其分區。
+load() 只讀取所需年月的分區與欄位。
+
+增量資料 (ingest) 不經過資料目錄的 CSV：已清理的差異檔直接寫成獨立分區
+(year=YYYY/month=MM/ingest-00001-<檔名>.parquet)，記錄在 manifest 的 'ingested'，
+sync() 不會移除。讀取的月份含增量分區時，同一 (deviceId, timestamp) 以最後匯入者為準
+(來源 CSV 本身的重複列維持原樣)。
+ingest_revision() 回傳所選範圍內增量分區的摘要，可作為上層快取鍵，只有增量觸及的月份會失效。
+
+sync / ingest / remove_ingested 可能同時在 Streamlit 與命令列 (python -m kaohsiung_aq.ingest) 的不同程序中執行:
+manifest 的讀取-修改-寫入皆在快取目錄 .lock 的檔案鎖 (store_lock) 內進行，
+分區與 manifest 先寫入不重複的暫存檔再原子替換 (atomic_write)。
+讀取端也在鎖內取得 manifest 快照；讀取分區期間不持有鎖，分區檔若已被刪除則重新挑選並讀取。
+
+未使用快取時，load_hourly 依檔名中的年份挑選來源檔，以 usecols 只解析需要的欄位，
+並分塊 (CSV_CHUNK_ROWS 列) 讀取、逐塊清理與篩選日期，記憶體用量與所選時間範圍成正比。
+
+compact=True 時讀取結果維持分區檔的精簡型別 (deviceId 為各分區類別的聯集、量測欄位 float32)；
+預設與原流程相同，deviceId 轉回字串、量測欄位轉回 float64 (數值為 float32 精度)。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kaohsiung_aq.config import NUMERIC_COLS, PLOT_CONFIGS, PM25_RANGE, SOURCE_PATTERN
+from kaohsiung_aq.profiling import stage
+
+# manifest 格式版本；清理規則或欄位型別改變時遞增，舊快取會整個重建
+STORE_VERSION = 1
+
+CACHE_DIRNAME = '.aq_cache'
+
+# 直接讀取 CSV 時每塊的列數
+CSV_CHUNK_ROWS = 200000
+
+# 讀取分區時遇到分區檔被同時進行的 sync/移除刪除，重新挑選分區的次數
+LOAD_RETRIES = 3
+
+_HASH_CHUNK = 1024 * 1024
+
+# Streamlit 各工作階段共用同一程序，同一時間只允許一個 sync；其他程序另以 store_lock 的檔案鎖互斥
+_sync_lock = threading.Lock()
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+def find_sources(data_dir):
+    return sorted(Path(data_dir).glob(SOURCE_PATTERN))
+
+
+def source_year(path):
+    """檔名中的年份 (例如 ..._2020.csv)；沒有年份時回傳 None"""
+    years = re.findall(r'(?<!\d)(\d{4})(?!\d)', Path(path).stem)
+    return int(years[-1]) if years else None
+
+
+def select_sources(data_dir, years=None):
+    """依檔名年份挑選來源檔；檔名沒有年份的檔案一律保留 (讀取時再逐列篩選)"""
+    sources = find_sources(data_dir)
+    if years is None:
+        return sources
+    years = set(years)
+    return [path for path in sources if source_year(path) is None or source_year(path) in years]
+
+
+def required_columns(plot_types):
+    """所選圖表需要的欄位；pm25_mean 供異常值過濾，lat/lon 為資料檔自帶的座標 (若有)"""
+    columns = ['deviceId', 'timestamp', 'lat', 'lon', 'pm25_mean']
+    for plot_type in plot_types:
+        plot_config = PLOT_CONFIGS[plot_type]
+        columns.append(plot_config['value_col'])
+        if plot_config['use_wind']:
+            columns += ['WindDirection_Mean', 'WindSpeed_Mean']
+    return list(dict.fromkeys(columns))
+
+
+def clean_hourly(df):
+    """時間轉換、數值欄位轉型與 PM2.5 異常值過濾 (與原分析流程相同的規則)"""
+    df = df.copy()
+    with stage('to_datetime'):
+        df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    df = df.dropna(subset=['timestamp'])
+
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    df['deviceId'] = df['deviceId'].astype(str)
+
+    # 過濾異常值
+    if 'pm25_mean' in df.columns:
+        low, high = PM25_RANGE
+        df = df[(df['pm25_mean'].isna()) |
+               ((df['pm25_mean'] >= low) & (df['pm25_mean'] <= high))]
+
+    return df
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def frame_digest(df):
+    digest = hashlib.sha1()
+    digest.update('\n'.join(f'{col}:{dtype}' for col, dtype in df.dtypes.items()).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+@contextmanager
+def store_lock(lock_path, thread_lock):
+    """
+    同時持有程序內的 thread_lock 與 lock_path 的檔案鎖 (程序間互斥，程序結束時由作業系統釋放)；
+    用於包住 manifest 的讀取-修改-寫入
+    """
+    lock_path = Path(lock_path)
+    with thread_lock:
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                f.seek(0)
+                while True:
+                    # LK_LOCK 重試約 10 秒後拋出 OSError，持續等待直到取得
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        continue
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(target, write):
+    """
+    以 write(暫存路徑) 寫入 target 同目錄下不重複的暫存檔，再原子替換 target；
+    多個寫入者不會共用暫存檔，失敗時移除暫存檔
+    """
+    target = Path(target)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=target.parent, prefix=f'{target.name}.', suffix='.tmp',
+                                     delete=False) as f:
+        tmp_path = Path(f.name)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def write_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+    atomic_write(path, write)
+
+
+def months_between(start, end):
+    """start 到 end (含) 涵蓋的 (年, 月)"""
+    months = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class ColumnarStore:
+    def __init__(self, data_dir, cache_dir=None):
+        self.data_dir = Path(data_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else self.data_dir / CACHE_DIRNAME
+        self.manifest_path = self.cache_dir / 'manifest.json'
+        self.lock_path = self.cache_dir / '.lock'
+
+    # ========================================
+    # manifest
+    # ========================================
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+
+        if manifest is None or manifest.get('version') != STORE_VERSION:
+            return {'version': STORE_VERSION, 'sources': {}, 'ingested': []}
+        manifest.setdefault('ingested', [])
+        return manifest
+
+    def write_manifest(self, manifest):
+        """寫入 manifest；呼叫端應持有 lock() 並在鎖內讀取 manifest"""
+        write_json(self.manifest_path, manifest)
+
+    def lock(self):
+        """manifest 讀取-修改-寫入的鎖 (程序內各執行緒與其他程序皆互斥)"""
+        return store_lock(self.lock_path, _sync_lock)
+
+    # ========================================
+    # 同步來源 CSV
+    # ========================================
+    def sync(self, years=None, progress=None):
+        """
+        將新增或變動的來源 CSV 轉為分區檔，並移除已刪除來源的分區。
+        years 不為 None 時只檢查檔名年份 (或既有分區) 屬於這些年份的來源。
+        progress(檔名) 會在每個需要重新解析的檔案開始前呼叫。回傳摘要 dict:
+        converted/unchanged/removed/skipped 為檔名清單，failed 為 [(檔名, 錯誤)]，
+        written/kept 為改寫與沿用的分區數。
+        """
+        with self.lock():
+            return self._sync(years, progress)
+
+    def _sync(self, years, progress):
+        manifest = self.read_manifest()
+        if not manifest['sources'] and not manifest['ingested'] and self.cache_dir.exists():
+            # 無 manifest (或版本不符) 的舊分區一律清除
+            for child in self.cache_dir.glob('year=*'):
+                shutil.rmtree(child, ignore_errors=True)
+
+        summary = {'converted': [], 'unchanged': [], 'removed': [], 'skipped': [], 'failed': [],
+                   'written': 0, 'kept': 0}
+        sources = {path.name: path for path in find_sources(self.data_dir)}
+        dirty = not self.manifest_path.exists()
+
+        for name in sorted(set(manifest['sources']) - set(sources)):
+            self._remove_partitions(manifest['sources'].pop(name)['partitions'].values())
+            summary['removed'].append(name)
+            dirty = True
+
+        for name, path in sources.items():
+            entry = manifest['sources'].get(name)
+            if not source_in_years(path, entry, years):
+                summary['skipped'].append(name)
+                continue
+
+            stat = path.stat()
+            if entry is not None and entry['size'] == stat.st_size:
+                if entry['mtime_ns'] == stat.st_mtime_ns:
+                    summary['unchanged'].append(name)
+                    continue
+                if entry['sha1'] == file_sha1(path):
+                    entry['mtime_ns'] = stat.st_mtime_ns
+                    summary['unchanged'].append(name)
+                    dirty = True
+                    continue
+
+            if progress is not None:
+                progress(name)
+            try:
+                manifest['sources'][name] = self._convert(path, stat, entry, summary)
+            except Exception as e:
+                # 與直接讀檔相同: 無法讀取的檔案略過，也不沿用其舊分區
+                summary['failed'].append((name, e))
+                if manifest['sources'].pop(name, None) is not None:
+                    self._remove_partitions(entry['partitions'].values())
+                    dirty = True
+                continue
+            summary['converted'].append(name)
+            # 每個來源完成後即寫入 manifest，中斷時已完成的檔案不需重做
+            self.write_manifest(manifest)
+            dirty = False
+
+        if dirty:
+            self.write_manifest(manifest)
+        return summary
+
+    def _convert(self, path, stat, entry, summary):
+        old_partitions = entry['partitions'] if entry is not None else {}
+        with stage('read_csv'):
+            raw = pd.read_csv(path)
+        df = to_store_schema(clean_hourly(raw))
+
+        partitions = {}
+        timestamps = df['timestamp']
+        for (year, month), part in df.groupby([timestamps.dt.year, timestamps.dt.month], sort=True):
+            key = f'{year:04d}-{month:02d}'
+            part = part.reset_index(drop=True)
+            digest = frame_digest(part)
+            relpath = f'year={year:04d}/month={month:02d}/{path.stem}.parquet'
+
+            old = old_partitions.get(key)
+            if old is not None and old['digest'] == digest and (self.cache_dir / relpath).exists():
+                summary['kept'] += 1
+            else:
+                self._write_partition(part, relpath)
+                summary['written'] += 1
+            partitions[key] = {'path': relpath, 'rows': len(part), 'digest': digest}
+
+        self._remove_partitions(p for key, p in old_partitions.items() if key not in partitions)
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': file_sha1(path),
+                'columns': list(df.columns), 'partitions': partitions}
+
+    def _write_partition(self, part, relpath):
+        atomic_write(self.cache_dir / relpath, lambda tmp_path: part.to_parquet(tmp_path, index=False))
+
+    def _remove_partitions(self, partitions):
+        for partition in partitions:
+            target = self.cache_dir / partition['path']
+            if target.exists():
+                target.unlink()
+            # 移除空的 年/月 目錄
+            for parent in (target.parent, target.parent.parent):
+                if parent.exists() and not any(parent.iterdir()):
+                    parent.rmdir()
+
+    # ========================================
+    # 增量匯入
+    # ========================================
+    def ingest(self, df, name, sha1=None, force=True):
+        """
+        將已清理的資料表 (同 clean_hourly 的結果) 依年月寫成增量分區；
+        sha1 為差異檔的雜湊，記錄於 manifest 供判斷是否重複匯入。
+        回傳 (寫入列數, 觸及的 'YYYY-MM' 清單, 匯入序號)；空資料表不寫入 (序號為 None)。
+        force=False 且已有相同 sha1 的增量時不寫入，回傳 None (在鎖內判斷，同時匯入同一檔案只會寫入一次)。
+        """
+        with self.lock():
+            manifest = self.read_manifest()
+            if not force and sha1 is not None and any(entry['sha1'] == sha1 for entry in manifest['ingested']):
+                return None
+            seq = max((entry['seq'] for entry in manifest['ingested']), default=0) + 1
+            stem = re.sub(r'[^0-9A-Za-z_.-]', '_', Path(name).stem)
+
+            df = to_store_schema(df)
+            partitions = {}
+            timestamps = df['timestamp']
+            for (year, month), part in df.groupby([timestamps.dt.year, timestamps.dt.month], sort=True):
+                key = f'{year:04d}-{month:02d}'
+                part = part.reset_index(drop=True)
+                relpath = f'year={year:04d}/month={month:02d}/ingest-{seq:05d}-{stem}.parquet'
+                self._write_partition(part, relpath)
+                partitions[key] = {'path': relpath, 'rows': len(part), 'digest': frame_digest(part)}
+
+            if partitions:
+                manifest['ingested'].append({'seq': seq, 'name': Path(name).name, 'sha1': sha1,
+                                             'partitions': partitions})
+                self.write_manifest(manifest)
+            return len(df), sorted(partitions), seq if partitions else None
+
+    def ingested(self):
+        """已匯入的增量清單 (依匯入順序)"""
+        with self.lock():
+            return self.read_manifest()['ingested']
+
+    def remove_ingested(self, seqs):
+        """移除指定序號的增量分區；回傳移除的增量清單"""
+        with self.lock():
+            manifest = self.read_manifest()
+            removed = [entry for entry in manifest['ingested'] if entry['seq'] in set(seqs)]
+            for entry in removed:
+                self._remove_partitions(entry['partitions'].values())
+            manifest['ingested'] = [entry for entry in manifest['ingested'] if entry['seq'] not in set(seqs)]
+            if removed:
+                self.write_manifest(manifest)
+            return removed
+
+    # ========================================
+    # 讀取
+    # ========================================
+    def _select(self, years=None, months=None, start=None, end=None):
+        """
+        符合條件的 (年月, 順序, 分區資訊, 是否為增量)，依年月排序；
+        同一月份中來源 CSV 的分區在前，增量依匯入順序在後。
+        """
+        wanted = None
+        if start is not None or end is not None:
+            wanted = set(months_between(start or date(1900, 1, 1), end or date(2100, 12, 31)))
+
+        # manifest 在鎖內讀取，不會讀到 sync/匯入/移除寫到一半的狀態
+        with self.lock():
+            manifest = self.read_manifest()
+        entries = [(0, entry) for _, entry in sorted(manifest['sources'].items())]
+        entries += [(entry['seq'], entry) for entry in manifest['ingested']]
+
+        selected = []
+        for order, entry in entries:
+            for key, partition in entry['partitions'].items():
+                year, month = int(key[:4]), int(key[5:])
+                if years is not None and year not in years:
+                    continue
+                if months is not None and month not in months:
+                    continue
+                if wanted is not None and (year, month) not in wanted:
+                    continue
+                selected.append((key, order, partition['path'], partition, order > 0))
+        selected.sort(key=lambda item: item[:3])
+        return selected
+
+    def partitions(self, years=None, months=None, start=None, end=None):
+        """符合條件的分區檔路徑 (依年月排序，增量分區在同月份的來源分區之後)"""
+        return [self.cache_dir / relpath for _, _, relpath, _, _ in self._select(years, months, start, end)]
+
+    def ingest_revision(self, years=None, months=None, start=None, end=None):
+        """
+        所選範圍內增量分區的 (年月, 路徑, 摘要)；來源 CSV 的變動另以檔案簽章判斷。
+        作為快取鍵時，只有範圍與增量月份重疊的分析會失效。
+        """
+        return tuple((key, relpath, partition['digest'])
+                     for key, _, relpath, partition, is_ingested in self._select(years, months, start, end)
+                     if is_ingested)
+
+    def month_partitions(self, years=None, months=None, start=None, end=None):
+        """所選範圍內各月份的分區 {'YYYY-MM': [(路徑, 摘要), ...]}，同月份內的順序與 load 相同"""
+        result = {}
+        for key, _, relpath, partition, _ in self._select(years, months, start, end):
+            result.setdefault(key, []).append((relpath, partition['digest']))
+        return result
+
+    def load(self, years=None, months=None, start=None, end=None, columns=None, compact=False):
+        """
+        讀取分區資料；years/months 與 start/end (date，含端點) 用於挑選分區，
+        start/end 另外依 timestamp 逐列篩選。columns 為 None 時讀取所有欄位。
+        含增量分區時，被較晚匯入的增量覆蓋的 (deviceId, timestamp) 列會被移除。
+        compact=True 時 deviceId 維持類別型別 (見 concat_frames)。
+
+        讀取分區時不持有鎖；同時進行的 sync 或移除增量可能刪除剛選到的分區檔，
+        此時以新的 manifest 重新挑選並讀取 (最多 LOAD_RETRIES 次)。
+        """
+        for attempt in range(LOAD_RETRIES):
+            try:
+                return self._load(years, months, start, end, columns, compact)
+            except FileNotFoundError:
+                if attempt == LOAD_RETRIES - 1:
+                    raise
+
+    def _load(self, years, months, start, end, columns, compact):
+        import pyarrow.parquet as pq
+
+        selected = self._select(years, months, start, end)
+        has_ingested = any(is_ingested for *_, is_ingested in selected)
+        wanted = None
+        if columns is not None:
+            wanted = set(columns) | ({'deviceId', 'timestamp'} if has_ingested else set())
+
+        frames, orders = [], []
+        for _, order, relpath, _, _ in selected:
+            path = self.cache_dir / relpath
+            names = pq.read_schema(path).names
+            read_columns = None if wanted is None else [c for c in names if c in wanted]
+            frames.append(pq.read_table(path, columns=read_columns).to_pandas())
+            orders.append(np.full(len(frames[-1]), order))
+
+        if not frames:
+            return empty_frame(columns)
+
+        df = concat_frames(frames, compact)
+        if has_ingested:
+            # 只移除被較晚匯入覆蓋的列 (順序 0 為來源 CSV)
+            order = pd.Series(np.concatenate(orders), index=df.index)
+            latest = order.groupby([df['deviceId'], df['timestamp']], sort=False, observed=True).transform('max')
+            df = df[(order >= latest).to_numpy()].reset_index(drop=True)
+            if columns is not None:
+                df = df[[c for c in df.columns if c in set(columns)]]
+
+        # 年月已由分區決定，只需再篩選日期區間
+        return filter_period(df, start=start, end=end)
+
+
+def source_in_years(path, entry, years):
+    if years is None:
+        return True
+    year = source_year(path)
+    if year is None or year in years:
+        return True
+    # 檔名年份以外的資料 (例如跨年的最後幾小時) 也可能落在所選年份的分區
+    return entry is not None and any(int(key[:4]) in years for key in entry['partitions'])
+
+
+def read_csv_filtered(path, columns=None, years=None, months=None, start=None, end=None,
+                      chunksize=CSV_CHUNK_ROWS, compact=False):
+    """分塊讀取單一 CSV，逐塊清理並篩選時間，只保留 columns 中存在的欄位；compact=True 時逐塊轉為精簡型別"""
+    if columns is not None:
+        # 清理需要 timestamp/deviceId；pm25_mean 供異常值過濾
+        wanted = set(columns) | {'deviceId', 'timestamp', 'pm25_mean'}
+        usecols = lambda col: col in wanted
+    else:
+        usecols = None
+
+    chunks = []
+    with stage('read_csv'):
+        for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+            chunk = filter_period(clean_hourly(chunk), years, months, start, end)
+            if columns is not None:
+                chunk = chunk[[c for c in chunk.columns if c in set(columns)]]
+            if len(chunk):
+                chunks.append(to_store_schema(chunk) if compact else chunk)
+
+    if not chunks:
+        return None
+    return concat_frames(chunks, compact)
+
+
+def filter_period(df, years=None, months=None, start=None, end=None):
+    """依年份、月份與日期區間 (date，含端點) 篩選列"""
+    if 'timestamp' not in df.columns or all(v is None for v in (years, months, start, end)):
+        return df
+
+    timestamps = df['timestamp']
+    mask = np.ones(len(df), dtype=bool)
+    if years is not None:
+        mask &= timestamps.dt.year.isin(list(years)).to_numpy()
+    if months is not None:
+        mask &= timestamps.dt.month.isin(list(months)).to_numpy()
+    if start is not None:
+        mask &= (timestamps >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (timestamps < pd.Timestamp(end) + pd.Timedelta(days=1)).to_numpy()
+    return df[mask].reset_index(drop=True)
+
+
+def empty_frame(columns=None):
+    """無資料時的空資料表 (timestamp 仍為 datetime64，供後續 .dt 存取)"""
+    df = pd.DataFrame(columns=list(columns) if columns is not None else ['deviceId', 'timestamp'])
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+def to_store_schema(df):
+    """分區檔的欄位型別: 量測欄位 float32、deviceId 類別"""
+    df = df.copy()
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    df['deviceId'] = df['deviceId'].astype('category')
+    return df
+
+
+def concat_frames(frames, compact=False):
+    """
+    串接分區或分塊。各分區的 deviceId 類別不同，直接串接會退回 object；
+    compact=True 時先統一為排序後的類別聯集 (維持類別型別)，否則轉回字串，
+    float32 量測欄位也轉回 float64 (型別與直接解析 CSV 相同；數值仍為分區檔的 float32 精度)
+    """
+    if not compact:
+        for frame in frames:
+            for col in NUMERIC_COLS:
+                if col in frame.columns and frame[col].dtype == np.float32:
+                    frame[col] = frame[col].astype(np.float64)
+    if 'deviceId' in frames[0].columns:
+        if compact:
+            categories = set()
+            for frame in frames:
+                categories.update(frame['deviceId'].astype('category').cat.categories)
+            dtype = pd.CategoricalDtype(sorted(categories))
+            for frame in frames:
+                frame['deviceId'] = frame['deviceId'].astype(dtype)
+        else:
+            for frame in frames:
+                if isinstance(frame['deviceId'].dtype, pd.CategoricalDtype):
+                    frame['deviceId'] = frame['deviceId'].astype(str)
+    return pd.concat(frames, ignore_index=True)
+
+
+def frame_memory_mb(df):
+    """資料表的記憶體用量 (MB，含 object 欄位內的 Python 物件)"""
+    return float(df.memory_usage(index=True, deep=True).sum()) / (1024 * 1024)
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def load_hourly(data_dir, years=None, months=None, start=None, end=None, columns=None,
+                use_cache=True, progress=None, compact=False):
+    """
+    讀取資料目錄下的年度逐時資料 (已清理)，只包含所選年月/日期區間與 columns 欄位。
+    回傳 (資料表, 讀取失敗的 [(檔名, 錯誤)])。use_cache=True 且已安裝 pyarrow 時
+    經由 ColumnarStore；否則分塊直接解析 CSV。compact=True 時維持精簡型別
+    (deviceId 類別、量測欄位 float32)。
+    """
+    use_cache = use_cache and has_pyarrow()
+
+    source_years = years
+    if source_years is None and start is not None and end is not None:
+        source_years = list(range(start.year, end.year + 1))
+
+    if use_cache:
+        store = ColumnarStore(data_dir)
+        with stage('sync'):
+            summary = store.sync(years=source_years, progress=progress)
+        with stage('read_parquet'):
+            df = store.load(years, months, start, end, columns, compact=compact)
+        return df, summary['failed']
+
+    frames, failed = [], []
+    for path in select_sources(data_dir, source_years):
+        try:
+            df = read_csv_filtered(path, columns, years, months, start, end, compact=compact)
+        except Exception as e:
+            failed.append((path.name, e))
+            continue
+        if df is not None:
+            frames.append(df)
+
+    if not frames:
+        return empty_frame(columns), failed
+    return concat_frames(frames, compact), failed
@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+擴散模型 (Dense Diffusion Model)
+
+提供三種計算引擎:
+- 'loop'       : 原始逐測站迴圈實作，作為數值參考
+- 'vectorized' : 一次取出測站欄位為 NumPy 陣列，以 (測站 x 網格) 區塊計算權重，
+                 區塊大小受 max_block_mb 限制 (預設 32MB，區塊能留在 CPU 快取時最快)
+- 'sparse'     : 每個測站只計算擴散半徑外接方框內的網格 (由一維經緯度軸以
+                 searchsorted 求得視窗切片)，成本與涵蓋格數成正比；
+                 網格不是規則 meshgrid 時自動改用 'vectorized'
+
+傳入 geometry (kaohsiung_aq.geometry.GridGeometry) 時，改用其預先計算的稀疏權重矩陣，
+每張圖只需三次稀疏矩陣乘法 (加權總和與風向修正項)；測站或網格與幾何物件不符時退回上述引擎。
+
+多時間區段可用 interpolate_batch / iter_interpolate_batch 一次計算：輸入
+(時間區段 x 測站) 的數值與風場矩陣，輸出 (時間區段 x ny x nx) 網格堆疊，
+高斯平滑只沿空間軸進行；iter_interpolate_batch 依 max_chunk_mb 分段產出，
+可在不保留全部網格的情況下處理整年的逐時資料。
+
+各引擎的結果在 rtol=ENGINE_RTOL、atol=ENGINE_ATOL 內一致，且 NaN 位置完全相同
+(差異僅來自浮點加總順序)。
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import gaussian_filter
+
+from kaohsiung_aq.profiling import stage
+
+ENGINES = ('loop', 'vectorized', 'sparse')
+
+# 向量化引擎與原始迴圈的容許誤差
+ENGINE_RTOL = 1e-9
+ENGINE_ATOL = 1e-9
+
+# 批次插值每個時間區段同時存在的 float64 網格數量 (稀疏乘積的分子/分母、轉置、結果與平滑輸出)
+_BATCH_TEMPORARIES = 6
+
+# 每個 (測站 x 網格) 區塊的 float64 暫存陣列數量 (dx, dy, 距離, 權重, 兩個計算暫存)
+_BLOCK_TEMPORARIES = 6
+
+
+class DenseDiffusionModel:
+    def __init__(self, radius=0.05, wind_influence=0.3, distance_decay=3.0, sigma=0.5,
+                 engine='sparse', max_block_mb=32):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine: {engine}")
+
+        self.radius = radius
+        self.wind_influence = wind_influence
+        self.distance_decay = distance_decay
+        self.sigma = sigma
+        self.engine = engine
+        self.max_block_mb = max_block_mb
+
+    def interpolate(self, sites_data, grid_lon, grid_lat, value_col='pm25_mean', use_wind=False,
+                    geometry=None):
+        with stage('idw'):
+            grid_values = None
+            if geometry is not None and self.engine != 'loop' \
+                    and geometry.matches(grid_lon, grid_lat, self.radius, self.distance_decay):
+                grid_values = self._interpolate_geometry(sites_data, geometry, value_col, use_wind)
+
+            if grid_values is None:
+                axes = regular_grid_axes(grid_lon, grid_lat) if self.engine == 'sparse' else None
+
+                if self.engine == 'loop':
+                    grid_values = self._interpolate_loop(sites_data, grid_lon, grid_lat, value_col, use_wind)
+                elif axes is not None:
+                    grid_values = self._interpolate_sparse(sites_data, axes[0], axes[1], value_col, use_wind)
+                else:
+                    grid_values = self._interpolate_vectorized(sites_data, grid_lon, grid_lat, value_col,
+                                                               use_wind)
+
+        with stage('gaussian_filter'):
+            return gaussian_filter(grid_values, sigma=self.sigma)
+
+    # ========================================
+    # 多時間區段批次插值
+    # ========================================
+    def interpolate_batch(self, values, geometry, wind_dir=None, wind_speed=None, max_chunk_mb=None):
+        """
+        一次插值多個時間區段，回傳 (時間區段, ny, nx) 陣列。
+
+        values 為 (時間區段 x 測站) 矩陣：ndarray 時欄位順序同 geometry.station_ids；
+        DataFrame 時欄位為 deviceId，缺少的測站視為缺值。wind_dir/wind_speed 形狀相同，
+        給定時套用風向修正。max_chunk_mb 為每段的記憶體上限 (None 表示不分段)。
+        """
+        chunks = [stack for _, stack in self.iter_interpolate_batch(values, geometry, wind_dir, wind_speed,
+                                                                    max_chunk_mb=max_chunk_mb)]
+        if not chunks:
+            return np.empty((0,) + geometry.shape)
+        return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+    def interpolate_periods(self, sites_list, grid_lon, grid_lat, value_col='pm25_mean', use_wind=False,
+                            geometry=None):
+        """
+        多個時間區段的 interpolate：sites_list 為各區段的測站資料 (格式同 interpolate 的 sites_data)，
+        能以 geometry 計算的區段合併為一次 interpolate_batch (每段上限 max_block_mb)。
+        回傳與 sites_list 對應的網格清單；無法使用 geometry 的區段 (未提供、engine='loop'、
+        網格不符或含未知測站) 為 None，由呼叫端改用 interpolate 逐張計算。
+        """
+        grids = [None] * len(sites_list)
+        if geometry is None or self.engine == 'loop' \
+                or not geometry.matches(grid_lon, grid_lat, self.radius, self.distance_decay):
+            return grids
+
+        rows, positions = [], []
+        for index, sites_data in enumerate(sites_list):
+            station_positions = geometry.indexer(sites_data)
+            if station_positions is not None:
+                rows.append(index)
+                positions.append(station_positions)
+        if not rows:
+            return grids
+
+        wind = use_wind and all('WindDirection_Mean' in sites_list[index].columns
+                                and 'WindSpeed_Mean' in sites_list[index].columns for index in rows)
+
+        def as_matrix(column):
+            matrix = np.full((len(rows), len(geometry.station_ids)), np.nan)
+            for row, (index, station_positions) in enumerate(zip(rows, positions)):
+                matrix[row, station_positions] = pd.to_numeric(sites_list[index][column],
+                                                               errors='coerce').to_numpy(dtype=float)
+            return matrix
+
+        with stage('batch'):
+            stack = self.interpolate_batch(as_matrix(value_col), geometry,
+                                           as_matrix('WindDirection_Mean') if wind else None,
+                                           as_matrix('WindSpeed_Mean') if wind else None,
+                                           max_chunk_mb=self.max_block_mb)
+        for row, index in enumerate(rows):
+            grids[index] = stack[row]
+        return grids
+
+    def iter_interpolate_batch(self, values, geometry, wind_dir=None, wind_speed=None, max_chunk_mb=256):
+        """依記憶體上限分段插值，逐段產出 (時間區段切片, (該段區段數, ny, nx) 陣列)"""
+        values = station_matrix(values, geometry)
+        if wind_dir is not None and wind_speed is not None:
+            wind_dir = station_matrix(wind_dir, geometry)
+            wind_speed = station_matrix(wind_speed, geometry)
+        else:
+            wind_dir = wind_speed = None
+
+        n_periods = values.shape[0]
+        if max_chunk_mb is None:
+            chunk = max(n_periods, 1)
+        else:
+            bytes_per_period = geometry.shape[0] * geometry.shape[1] * 8 * _BATCH_TEMPORARIES
+            chunk = max(1, int(max_chunk_mb * 1024 * 1024 // bytes_per_period))
+
+        for start in range(0, n_periods, chunk):
+            period_slice = slice(start, min(start + chunk, n_periods))
+            stack = self._interpolate_chunk(
+                geometry, values[period_slice],
+                None if wind_dir is None else wind_dir[period_slice],
+                None if wind_speed is None else wind_speed[period_slice],
+            )
+            yield period_slice, gaussian_filter(stack, sigma=(0, self.sigma, self.sigma))
+
+    def _interpolate_chunk(self, geometry, values, wind_dir, wind_speed):
+        """
+        以 geometry 的稀疏權重矩陣計算 (時間區段, ny, nx) 的未平滑網格。
+        風向修正 1 + t + t·cos(a - p) (t = wind_influence/2 · tanh(風速/5)) 展開為
+        weights·(1 + t) + weights_x·t·cos p + weights_y·t·sin p，
+        分子 (數值加權) 與分母 (權重總和) 合併為同一批係數欄一次相乘。
+        """
+        n_periods = values.shape[0]
+        valid = ~np.isnan(values)
+        mask = valid.astype(float)
+        station_values = np.where(valid, values, 0)
+
+        if wind_dir is not None:
+            has_wind = valid & ~np.isnan(wind_dir) & ~np.isnan(wind_speed)
+            t = np.where(has_wind, (self.wind_influence / 2) * np.tanh(np.where(has_wind, wind_speed, 0) / 5), 0)
+            pollution_direction = np.deg2rad((np.where(has_wind, wind_dir, 0) + 180) % 360)
+            t_cos = t * np.cos(pollution_direction)
+            t_sin = t * np.sin(pollution_direction)
+
+            sums = geometry.weighted_sums(
+                np.hstack([(station_values * (1 + t)).T, (mask * (1 + t)).T]),
+                np.hstack([(station_values * t_cos).T, (mask * t_cos).T]),
+                np.hstack([(station_values * t_sin).T, (mask * t_sin).T]),
+            )
+        else:
+            sums = geometry.weighted_sums(np.hstack([station_values.T, mask.T]))
+
+        grid_values = sums[:, :n_periods].T.reshape((n_periods,) + geometry.shape)
+        total_weights = sums[:, n_periods:].T.reshape((n_periods,) + geometry.shape)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_weights > 0, grid_values / total_weights, np.nan)
+
+    # ========================================
+    # 原始迴圈引擎
+    # ========================================
+    def _interpolate_loop(self, sites_data, grid_lon, grid_lat, value_col, use_wind):
+        grid_values = np.zeros_like(grid_lon)
+        total_weights = np.zeros_like(grid_lon)
+
+        for _, site in sites_data.iterrows():
+            if pd.isna(site[value_col]):
+                continue
+
+            dx = grid_lon - site['lon']
+            dy = grid_lat - site['lat']
+            distance = np.sqrt(dx**2 + dy**2)
+
+            weights = np.where(distance < self.radius,
+                               1 / (distance + 0.0001)**self.distance_decay,
+                               0)
+
+            if use_wind and 'WindDirection_Mean' in site and 'WindSpeed_Mean' in site:
+                if not np.isnan(site['WindDirection_Mean']) and not np.isnan(site['WindSpeed_Mean']):
+                    angle_to_grid = np.degrees(np.arctan2(dy, dx)) % 360
+                    pollution_direction = (site['WindDirection_Mean'] + 180) % 360
+                    angle_diff = np.abs(angle_to_grid - pollution_direction)
+                    angle_diff = np.minimum(angle_diff, 360 - angle_diff)
+
+                    wind_factor = np.cos(np.deg2rad(angle_diff))
+                    wind_factor = (wind_factor + 1) / 2
+                    speed_factor = np.tanh(site['WindSpeed_Mean'] / 5)
+                    wind_influence_matrix = 1 + self.wind_influence * wind_factor * speed_factor
+
+                    weights *= wind_influence_matrix
+
+            grid_values += site[value_col] * weights
+            total_weights += weights
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_weights > 0,
+                            grid_values / total_weights,
+                            np.nan)
+
+    # ========================================
+    # 向量化區塊引擎
+    # ========================================
+    def _interpolate_vectorized(self, sites_data, grid_lon, grid_lat, value_col, use_wind):
+        lon, lat, values, wind_dir, wind_speed = station_arrays(sites_data, value_col, use_wind)
+
+        flat_lon = np.asarray(grid_lon, dtype=float).ravel()
+        flat_lat = np.asarray(grid_lat, dtype=float).ravel()
+        grid_values = np.zeros(flat_lon.size)
+        total_weights = np.zeros(flat_lon.size)
+
+        block = min(self.block_size(flat_lon.size), max(len(values), 1))
+        # 區塊暫存陣列只配置一次，各區塊以 out= 原地運算重複使用
+        workspace = np.empty((_BLOCK_TEMPORARIES, block, flat_lon.size))
+
+        for start in range(0, len(values), block):
+            stop = min(start + block, len(values))
+            weights = self._block_weights(
+                workspace[:, :stop - start],
+                flat_lon, flat_lat, lon[start:stop], lat[start:stop],
+                None if wind_dir is None else wind_dir[start:stop],
+                None if wind_speed is None else wind_speed[start:stop],
+            )
+            grid_values += values[start:stop] @ weights
+            total_weights += weights.sum(axis=0)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            grid_values = np.where(total_weights > 0, grid_values / total_weights, np.nan)
+        return grid_values.reshape(np.shape(grid_lon))
+
+    def block_size(self, n_cells):
+        """依記憶體上限計算每個區塊可容納的測站數 (至少 1)"""
+        bytes_per_station = n_cells * 8 * _BLOCK_TEMPORARIES
+        return max(1, int(self.max_block_mb * 1024 * 1024 // bytes_per_station))
+
+    def _block_weights(self, workspace, flat_lon, flat_lat, lon, lat, wind_dir, wind_speed):
+        dx, dy, distance, weights, tmp, scratch = workspace
+
+        np.subtract(flat_lon[np.newaxis, :], lon[:, np.newaxis], out=dx)
+        np.subtract(flat_lat[np.newaxis, :], lat[:, np.newaxis], out=dy)
+        np.multiply(dx, dx, out=distance)
+        np.multiply(dy, dy, out=tmp)
+        np.add(distance, tmp, out=distance)
+        np.sqrt(distance, out=distance)
+
+        inverse_distance_weights(distance, self.radius, self.distance_decay, out=weights, tmp=tmp)
+
+        if wind_dir is not None:
+            has_wind = ~np.isnan(wind_dir) & ~np.isnan(wind_speed)
+            if has_wind.any():
+                # wind_term = 1 + wind_influence * (cos_diff + 1) / 2 * tanh(speed / 5)
+                pollution_direction = np.deg2rad((wind_dir + 180) % 360)
+                speed_factor = np.where(has_wind, np.tanh(wind_speed / 5), 0)[:, np.newaxis]
+                cos_p = np.where(has_wind, np.cos(pollution_direction), 0)[:, np.newaxis]
+                sin_p = np.where(has_wind, np.sin(pollution_direction), 0)[:, np.newaxis]
+
+                downwind_cosine(dx, dy, distance, cos_p, sin_p, out=tmp, scratch=scratch)
+                tmp += 1
+                tmp *= (self.wind_influence / 2) * speed_factor
+                tmp += 1
+                weights *= tmp
+
+        return weights
+
+
+    # ========================================
+    # 稀疏視窗引擎
+    # ========================================
+    def _interpolate_sparse(self, sites_data, lon_axis, lat_axis, value_col, use_wind):
+        lon, lat, values, wind_dir, wind_speed = station_arrays(sites_data, value_col, use_wind)
+
+        grid_values = np.zeros((lat_axis.size, lon_axis.size))
+        total_weights = np.zeros((lat_axis.size, lon_axis.size))
+
+        for i, (y_slice, x_slice) in enumerate(station_windows(lon_axis, lat_axis, lon, lat, self.radius)):
+            dx = lon_axis[x_slice][np.newaxis, :] - lon[i]
+            dy = lat_axis[y_slice][:, np.newaxis] - lat[i]
+            distance = np.sqrt(dy * dy + dx * dx)
+
+            weights = inverse_distance_weights(distance, self.radius, self.distance_decay)
+
+            if wind_dir is not None and not np.isnan(wind_dir[i]) and not np.isnan(wind_speed[i]):
+                pollution_direction = np.deg2rad((wind_dir[i] + 180) % 360)
+                cos_diff = downwind_cosine(dx, dy, distance,
+                                           np.cos(pollution_direction), np.sin(pollution_direction))
+                speed_factor = np.tanh(wind_speed[i] / 5)
+                weights *= 1 + self.wind_influence * ((cos_diff + 1) / 2) * speed_factor
+
+            grid_values[y_slice, x_slice] += values[i] * weights
+            total_weights[y_slice, x_slice] += weights
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(total_weights > 0, grid_values / total_weights, np.nan)
+
+    # ========================================
+    # 預先計算幾何 (GridGeometry)
+    # ========================================
+    def _interpolate_geometry(self, sites_data, geometry, value_col, use_wind):
+        positions = geometry.indexer(sites_data)
+        if positions is None:
+            return None
+
+        def as_row(column):
+            row = np.full((1, len(geometry.station_ids)), np.nan)
+            row[0, positions] = pd.to_numeric(sites_data[column], errors='coerce').to_numpy(dtype=float)
+            return row
+
+        wind_dir = wind_speed = None
+        if use_wind and 'WindDirection_Mean' in sites_data.columns and 'WindSpeed_Mean' in sites_data.columns:
+            wind_dir = as_row('WindDirection_Mean')
+            wind_speed = as_row('WindSpeed_Mean')
+
+        return self._interpolate_chunk(geometry, as_row(value_col), wind_dir, wind_speed)[0]
+
+def inverse_distance_weights(distance, radius, distance_decay, out=None, tmp=None):
+    """
+    半徑內 1 / (d + 0.0001)^decay，半徑外為 0。
+    整數衰減指數以連乘取代 pow；可傳入 out/tmp 暫存陣列以避免重新配置。
+    """
+    if out is None:
+        out = np.empty_like(distance)
+    if tmp is None:
+        tmp = np.empty_like(distance)
+
+    np.add(distance, 0.0001, out=tmp)
+    if float(distance_decay).is_integer() and 1 <= distance_decay <= 8:
+        out[...] = tmp
+        for _ in range(int(distance_decay) - 1):
+            out *= tmp
+    else:
+        np.power(tmp, distance_decay, out=out)
+    np.reciprocal(out, out=out)
+
+    np.copyto(out, 0, where=distance >= radius)
+    return out
+
+
+def downwind_cosine(dx, dy, distance, cos_p, sin_p, out=None, scratch=None):
+    """
+    網格方位角與污染物飄移方向 p (風向 + 180°) 夾角的餘弦值。
+    以 cos(a - p) = (dx·cos p + dy·sin p) / d 計算，省去 arctan2 與角度換算；
+    d = 0 時原始實作的方位角為 0°，結果為 cos p。
+    """
+    if out is None:
+        out = np.empty_like(distance)
+    if scratch is None:
+        scratch = np.empty_like(distance)
+
+    np.multiply(dx, cos_p, out=out)
+    np.multiply(dy, sin_p, out=scratch)
+    out += scratch
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(out, distance, out=out)
+
+    zero = distance == 0
+    if zero.any():
+        out[zero] = np.broadcast_to(cos_p, out.shape)[zero]
+    return out
+
+
+def regular_grid_axes(grid_lon, grid_lat):
+    """
+    若網格為 np.meshgrid(遞增經度軸, 遞增緯度軸) 產生的規則網格，回傳 (經度軸, 緯度軸)，否則回傳 None
+    """
+    grid_lon = np.asarray(grid_lon, dtype=float)
+    grid_lat = np.asarray(grid_lat, dtype=float)
+    if grid_lon.ndim != 2 or grid_lon.shape != grid_lat.shape or grid_lon.size == 0:
+        return None
+
+    lon_axis = grid_lon[0, :]
+    lat_axis = grid_lat[:, 0]
+    if np.any(np.diff(lon_axis) <= 0) or np.any(np.diff(lat_axis) <= 0):
+        return None
+    if not (np.array_equal(grid_lon, np.broadcast_to(lon_axis, grid_lon.shape))
+            and np.array_equal(grid_lat, np.broadcast_to(lat_axis[:, np.newaxis], grid_lat.shape))):
+        return None
+    return lon_axis, lat_axis
+
+
+def station_windows(lon_axis, lat_axis, lon, lat, radius):
+    """
+    每個測站擴散半徑外接方框對應的 (緯度切片, 經度切片)；半徑外的格點權重本來就是 0。
+    方框各邊多留一格，避免邊界上的浮點誤差漏掉半徑內的格點。
+    """
+    x0 = np.maximum(np.searchsorted(lon_axis, lon - radius, side='left') - 1, 0)
+    x1 = np.searchsorted(lon_axis, lon + radius, side='right') + 1
+    y0 = np.maximum(np.searchsorted(lat_axis, lat - radius, side='left') - 1, 0)
+    y1 = np.searchsorted(lat_axis, lat + radius, side='right') + 1
+    return [(slice(a, b), slice(c, d)) for a, b, c, d in zip(y0, y1, x0, x1)]
+
+
+def station_matrix(matrix, geometry):
+    """將 (時間區段 x 測站) 矩陣轉為欄位順序與 geometry.station_ids 一致的 float64 陣列"""
+    if isinstance(matrix, pd.DataFrame):
+        matrix = matrix.copy()
+        matrix.columns = matrix.columns.astype(str)
+        matrix = matrix.reindex(columns=geometry.station_ids)
+
+    matrix = np.asarray(matrix, dtype=float)
+    if matrix.ndim != 2 or matrix.shape[1] != len(geometry.station_ids):
+        raise ValueError(f"Expected a (periods, {len(geometry.station_ids)}) matrix, got {matrix.shape}")
+    return matrix
+
+
+def station_arrays(sites_data, value_col, use_wind):
+    """取出有效測站的座標、數值與風場欄位 (float64 陣列)；不使用風場時風場欄位為 None"""
+    values = pd.to_numeric(sites_data[value_col], errors='coerce').to_numpy(dtype=float)
+    valid = ~np.isnan(values)
+
+    lon = sites_data['lon'].to_numpy(dtype=float)[valid]
+    lat = sites_data['lat'].to_numpy(dtype=float)[valid]
+
+    wind_dir = wind_speed = None
+    if use_wind and 'WindDirection_Mean' in sites_data.columns and 'WindSpeed_Mean' in sites_data.columns:
+        wind_dir = sites_data['WindDirection_Mean'].to_numpy(dtype=float)[valid]
+        wind_speed = sites_data['WindSpeed_Mean'].to_numpy(dtype=float)[valid]
+
+    return lon, lat, values[valid], wind_dir, wind_speed
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+測站/網格幾何快取 (Grid Geometry)
+
+同一次分析中，網格與測站座標在所有時間區段、圖表類型與時段都相同，
+因此距離、基礎 IDW 權重與方位資料只需計算一次。GridGeometry 以
+(測站集合, 網格範圍, 解析度, 擴散半徑, 距離衰減) 為鍵，保存三個共用結構的
+(網格格點 x 測站) 稀疏矩陣，只含擴散半徑內的格點:
+- weights   : 基礎權重 w = 1 / (d + 0.0001)^decay
+- weights_x : w · dx/d
+- weights_y : w · dy/d     (dx/d, dy/d 為測站到格點的方位單位向量；d = 0 時取 (1, 0))
+
+風向修正 1 + k·(cos(a - p) + 1)/2·s 可展開為 (1 + t) + t·cos p·(dx/d) + t·sin p·(dy/d)，
+其中 t = k·s/2，因此每張圖 (或一批時間區段) 的加權總和只需三次稀疏矩陣乘法。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from kaohsiung_aq.diffusion import inverse_distance_weights, station_windows
+
+# 程序內保留的幾何物件數量 (不同參數組合)
+GEOMETRY_CACHE_SIZE = 2
+
+# 單一幾何物件的記憶體上限；超過時 get_geometry 回傳 None，改用逐圖計算的引擎
+MAX_GEOMETRY_MB = 1024
+
+# 每個非零元素的位元組數 (三組 float64 權重 + 共用的 int32 欄索引)
+_BYTES_PER_ENTRY = 3 * 8 + 4
+
+_geometry_cache = OrderedDict()
+_geometry_lock = threading.Lock()
+
+
+class GridGeometry:
+    def __init__(self, stations, lon_axis, lat_axis, radius, distance_decay):
+        stations = stations.drop_duplicates(subset='deviceId')
+        self.station_ids = pd.Index(stations['deviceId'].astype(str))
+        self.lon = stations['lon'].to_numpy(dtype=float)
+        self.lat = stations['lat'].to_numpy(dtype=float)
+        self.lon_axis = np.asarray(lon_axis, dtype=float)
+        self.lat_axis = np.asarray(lat_axis, dtype=float)
+        self.radius = radius
+        self.distance_decay = distance_decay
+        self.key = geometry_key(stations, self.lon_axis, self.lat_axis, radius, distance_decay)
+
+        self.weights, self.weights_x, self.weights_y = self._build_matrices()
+
+    def _build_matrices(self):
+        nx = self.lon_axis.size
+        cells = [np.empty(0, dtype=np.int64)]
+        columns = [np.empty(0, dtype=np.int32)]
+        base, unit_x, unit_y = [np.empty(0)], [np.empty(0)], [np.empty(0)]
+
+        windows = station_windows(self.lon_axis, self.lat_axis, self.lon, self.lat, self.radius)
+        for i, (y_slice, x_slice) in enumerate(windows):
+            dx = self.lon_axis[x_slice] - self.lon[i]
+            dy = self.lat_axis[y_slice] - self.lat[i]
+            distance = np.sqrt(dy[:, np.newaxis]**2 + dx[np.newaxis, :]**2)
+
+            iy, ix = np.nonzero(distance < self.radius)
+            d = distance[iy, ix]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                # 原始實作在 d = 0 時方位角為 arctan2(0, 0) = 0°
+                unit_x.append(np.where(d > 0, dx[ix] / d, 1.0))
+                unit_y.append(np.where(d > 0, dy[iy] / d, 0.0))
+
+            cells.append((iy + y_slice.start) * nx + (ix + x_slice.start))
+            columns.append(np.full(iy.size, i, dtype=np.int32))
+            base.append(inverse_distance_weights(d, self.radius, self.distance_decay))
+
+        # 依格點排序後組成 CSR，三個矩陣共用 indices/indptr；
+        # 串接結果已是按測站排列的遞增序列，穩定排序只需合併這些序列
+        cells = np.concatenate(cells)
+        columns = np.concatenate(columns)
+        order = np.argsort(cells, kind='stable')
+        indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=self.size), out=indptr[1:])
+        indices = columns[order]
+
+        base = np.concatenate(base)[order]
+        data = (base, base * np.concatenate(unit_x)[order], base * np.concatenate(unit_y)[order])
+        shape = (self.size, len(self.station_ids))
+        return [sparse.csr_matrix((values, indices, indptr), shape=shape, copy=False) for values in data]
+
+    @classmethod
+    def from_frame(cls, df, grid_lon, grid_lat, radius, distance_decay):
+        """由含 deviceId/lon/lat 的資料表與 meshgrid 網格建立 (每站取第一筆座標)"""
+        return cls(frame_stations(df), np.asarray(grid_lon)[0, :], np.asarray(grid_lat)[:, 0], radius, distance_decay)
+
+    @property
+    def shape(self):
+        return (self.lat_axis.size, self.lon_axis.size)
+
+    @property
+    def size(self):
+        return self.lat_axis.size * self.lon_axis.size
+
+    @property
+    def nbytes(self):
+        shared = self.weights.indices.nbytes + self.weights.indptr.nbytes
+        return shared + sum(m.data.nbytes for m in (self.weights, self.weights_x, self.weights_y))
+
+    def weighted_sums(self, coef, coef_x=None, coef_y=None):
+        """
+        weights·coef + weights_x·coef_x + weights_y·coef_y；係數為 (測站, k) 矩陣，回傳 (格點數, k)。
+        不含風向修正時只需傳入 coef。
+        """
+        sums = self.weights @ coef
+        if coef_x is not None:
+            sums += self.weights_x @ coef_x
+        if coef_y is not None:
+            sums += self.weights_y @ coef_y
+        return sums
+
+    def matches(self, grid_lon, grid_lat, radius, distance_decay):
+        """確認幾何物件與目前的網格、半徑、衰減參數一致"""
+        return (np.shape(grid_lon) == self.shape
+                and radius == self.radius
+                and distance_decay == self.distance_decay
+                and np.array_equal(np.asarray(grid_lon)[0, :], self.lon_axis)
+                and np.array_equal(np.asarray(grid_lat)[:, 0], self.lat_axis))
+
+    def indexer(self, sites_data):
+        """
+        回傳 sites_data 每列對應的測站索引；若有未知或重複的測站、或座標不同則回傳 None
+        (呼叫端應改用一般引擎)
+        """
+        positions = self.station_ids.get_indexer(sites_data['deviceId'].astype(str))
+        if (positions < 0).any() or len(np.unique(positions)) != len(positions):
+            return None
+        if not (np.array_equal(self.lon[positions], sites_data['lon'].to_numpy(dtype=float))
+                and np.array_equal(self.lat[positions], sites_data['lat'].to_numpy(dtype=float))):
+            return None
+        return positions
+
+
+def frame_stations(df):
+    return df.groupby('deviceId', sort=False)[['lon', 'lat']].first().reset_index()
+
+
+def geometry_key(stations, lon_axis, lat_axis, radius, distance_decay):
+    digest = hashlib.sha1()
+    ordered = stations.assign(deviceId=stations['deviceId'].astype(str)).sort_values('deviceId')
+    digest.update('\n'.join(ordered['deviceId']).encode('utf-8'))
+    digest.update(ordered[['lon', 'lat']].to_numpy(dtype=float).tobytes())
+    bbox = (lon_axis[0], lon_axis[-1], lat_axis[0], lat_axis[-1])
+    return (digest.hexdigest(), bbox, (lat_axis.size, lon_axis.size), radius, distance_decay)
+
+
+def estimate_geometry_mb(stations, lon_axis, lat_axis, radius):
+    """以擴散半徑的圓面積估計幾何物件的記憶體用量 (MB)"""
+    windows = station_windows(lon_axis, lat_axis, stations['lon'].to_numpy(dtype=float),
+                              stations['lat'].to_numpy(dtype=float), radius)
+    cells = sum(len(range(*ys.indices(lat_axis.size))) * len(range(*xs.indices(lon_axis.size)))
+                for ys, xs in windows)
+    return cells * np.pi / 4 * _BYTES_PER_ENTRY / (1024 * 1024)
+
+
+def get_geometry(df, grid_lon, grid_lat, radius, distance_decay, max_mb=MAX_GEOMETRY_MB):
+    """
+    取得 (或建立並快取) 對應的 GridGeometry；最多保留 GEOMETRY_CACHE_SIZE 組。
+    估計記憶體超過 max_mb 時回傳 None (呼叫端改用逐圖計算的引擎)。
+    建立在鎖內進行，同時分析的工作不會重複建立同一組幾何。
+    """
+    stations = frame_stations(df)
+    lon_axis = np.asarray(grid_lon, dtype=float)[0, :]
+    lat_axis = np.asarray(grid_lat, dtype=float)[:, 0]
+    key = geometry_key(stations, lon_axis, lat_axis, radius, distance_decay)
+
+    with _geometry_lock:
+        return _get_geometry(key, stations, lon_axis, lat_axis, radius, distance_decay, max_mb)
+
+
+def _get_geometry(key, stations, lon_axis, lat_axis, radius, distance_decay, max_mb):
+    geometry = _geometry_cache.get(key)
+    if geometry is not None:
+        _geometry_cache.move_to_end(key)
+        return geometry
+
+    if max_mb is not None and estimate_geometry_mb(stations, lon_axis, lat_axis, radius) > max_mb:
+        return None
+
+    geometry = GridGeometry(stations, lon_axis, lat_axis, radius, distance_decay)
+    _geometry_cache[key] = geometry
+    while len(_geometry_cache) > GEOMETRY_CACHE_SIZE:
+        _geometry_cache.popitem(last=False)
+    return geometry
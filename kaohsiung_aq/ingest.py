@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+增量匯入逐時資料
+
+將新的逐時差異檔 (欄位同年度 CSV) 經與主流程相同的規則驗證與清理後，
+直接附加到欄式分區快取 (ColumnarStore)，不需重新解析歷史資料:
+
+1. 必要欄位 deviceId、timestamp；timestamp 無法解析的列剔除
+2. PM2.5 超出 PM25_RANGE 的列剔除 (缺值保留)
+3. 測站檔中找不到、且本身沒有 lat/lon 的測站剔除 (與測站合併後的 dropna 相同)
+4. 差異檔內重複的 (deviceId, timestamp) 保留最後一筆
+
+同一差異檔 (sha1 相同) 重複匯入時略過。匯入後只有時間範圍包含增量月份的分析
+快取鍵會改變 (見 ColumnarStore.ingest_revision)。
+
+用法:
+    python -m kaohsiung_aq.ingest delta.csv [delta2.csv ...] [--data-dir data]
+    python -m kaohsiung_aq.ingest --list
+    python -m kaohsiung_aq.ingest --remove 3
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+from kaohsiung_aq.datastore import ColumnarStore, clean_hourly, file_sha1
+
+REQUIRED_COLS = ['deviceId', 'timestamp']
+
+
+def validate_delta(df, station_file=None):
+    """
+    驗證並清理差異資料，回傳 (清理後資料表, 統計 dict)。
+    缺少必要欄位時拋出 ValueError。station_file 為 None 時不檢查測站。
+    """
+    missing = [col for col in REQUIRED_COLS if col not in df.columns]
+    if missing:
+        raise ValueError(f"缺少必要欄位: {', '.join(missing)}")
+
+    report = {'rows': len(df)}
+    # 先轉換一次時間以計算無法解析的列數 (clean_hourly 對 datetime64 欄位不會重新解析)
+    df = df.assign(timestamp=pd.to_datetime(df['timestamp'], errors='coerce'))
+    report['bad_timestamp'] = int(df['timestamp'].isna().sum())
+    df = clean_hourly(df)
+    report['out_of_range'] = report['rows'] - report['bad_timestamp'] - len(df)
+
+    report['unknown_station'] = 0
+    if station_file is not None:
+        stations = set(pd.read_csv(station_file)['deviceId'].astype(str))
+        known = df['deviceId'].isin(stations)
+        if 'lat' in df.columns and 'lon' in df.columns:
+            known |= df['lat'].notna() & df['lon'].notna()
+        report['unknown_station'] = int((~known).sum())
+        df = df[known]
+
+    before = len(df)
+    df = df.drop_duplicates(['deviceId', 'timestamp'], keep='last').reset_index(drop=True)
+    report['duplicate'] = before - len(df)
+    report['accepted'] = len(df)
+    return df, report
+
+
+def ingest_delta(data_dir, delta_path, station_file=None, force=False, cache_dir=None):
+    """
+    匯入單一差異檔到 data_dir 的欄式快取。回傳統計 dict (含 'months' 觸及的 'YYYY-MM'
+    與 'seq' 匯入序號)；已匯入過的檔案且 force=False 時 'skipped' 為 True。
+    """
+    delta_path = Path(delta_path)
+    store = ColumnarStore(data_dir, cache_dir)
+    sha1 = file_sha1(delta_path)
+
+    def skipped():
+        previous = [entry for entry in store.ingested() if entry['sha1'] == sha1]
+        return {'name': delta_path.name, 'skipped': True, 'seq': previous[-1]['seq'] if previous else None,
+                'months': sorted(previous[-1]['partitions']) if previous else []}
+
+    # 先行檢查省去重複檔的解析；寫入前 store.ingest 會在鎖內再確認一次
+    if not force and any(entry['sha1'] == sha1 for entry in store.ingested()):
+        return skipped()
+
+    df, report = validate_delta(pd.read_csv(delta_path), station_file)
+    ingested = store.ingest(df, delta_path.name, sha1, force=force)
+    if ingested is None:
+        return skipped()
+    rows, months, seq = ingested
+    report.update(name=delta_path.name, skipped=False, seq=seq, months=months, written=rows)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='將逐時差異檔增量匯入資料快取')
+    parser.add_argument('deltas', nargs='*', help='差異 CSV 檔 (欄位同年度逐時資料)')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--station-file', default=None,
+                        help='預設為資料目錄下的 Kaohsiung_iot_station.csv；"none" 表示不檢查測站')
+    parser.add_argument('--force', action='store_true', help='已匯入過的檔案仍重新匯入')
+    parser.add_argument('--list', action='store_true', help='列出已匯入的增量')
+    parser.add_argument('--remove', type=int, nargs='+', metavar='SEQ', help='移除指定序號的增量')
+    args = parser.parse_args(argv)
+
+    store = ColumnarStore(args.data_dir)
+    if args.list:
+        for entry in store.ingested():
+            rows = sum(partition['rows'] for partition in entry['partitions'].values())
+            print(f"{entry['seq']:>5}  {entry['name']}  {rows} 筆  {', '.join(sorted(entry['partitions']))}")
+        return 0
+    if args.remove:
+        removed = store.remove_ingested(args.remove)
+        for entry in removed:
+            print(f"已移除 {entry['seq']}: {entry['name']}")
+        return 0 if len(removed) == len(set(args.remove)) else 1
+    if not args.deltas:
+        parser.error('請指定差異檔，或使用 --list / --remove')
+
+    station_file = args.station_file
+    if station_file is None:
+        station_file = Path(args.data_dir) / 'Kaohsiung_iot_station.csv'
+    elif station_file.lower() == 'none':
+        station_file = None
+
+    status = 0
+    for delta in args.deltas:
+        try:
+            report = ingest_delta(args.data_dir, delta, station_file, force=args.force)
+        except Exception as e:
+            print(f"{delta}: 匯入失敗 ({e})")
+            status = 1
+            continue
+        if report['skipped']:
+            print(f"{report['name']}: 已匯入 (序號 {report['seq']})，略過")
+            continue
+        print(f"{report['name']}: 匯入 {report['written']} / {report['rows']} 筆 "
+              f"(時間格式錯誤 {report['bad_timestamp']}、PM2.5 異常 {report['out_of_range']}、"
+              f"未知測站 {report['unknown_station']}、重複 {report['duplicate']})  "
+              f"月份: {', '.join(report['months']) or '-'}")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+背景分析工作 (Job Runner)
+
+「開始分析」原本在 Streamlit 的腳本執行中同步跑完整個分析流程: 分析期間該工作階段無法操作，
+重新整理頁面就會中斷。JobRunner 將工作交給背景執行緒，提交後立即回傳工作編號；
+進度、警告與結果存放在程序共用的 JobRunner 中，頁面只需輪詢狀態:
+
+    runner = get_job_runner()
+    job_id = runner.submit(func, params, label='monthly 2020')   # 在背景呼叫 func(job, params)
+    job = runner.get(job_id)
+    job.status()   # {'state', 'percent', 'message', 'warnings', 'position', 'seconds', 'error'}
+    runner.cancel(job_id)
+    job.result     # func 的回傳值 (state 為 'done' 時)，或執行中以 job.publish 先行提供的結果
+
+func 以 job.progress(百分比, 訊息) 回報進度 (可直接作為 run_pipeline 的 progress)，
+以 job.warn(訊息) 記錄警告 (可作為 run_pipeline 的 warn)。取消執行中的工作時，
+下一次呼叫 job.progress 會拋出 JobCancelled 中止 func；排隊中的工作直接移出佇列。
+func 可在結束前以 job.publish(結果) 先行提供部分結果 (例如漸進預覽)，之後的工作 (精細化) 仍佔用名額。
+
+同時執行的工作數上限為 MAX_JOBS (環境變數 AQ_MAX_JOBS，預設 2)，於程序啟動時讀取一次，
+所有工作階段共用、頁面上不可調整；超過時依提交順序排隊。
+工作在同一程序的執行緒中執行，與各工作階段共用 StageCache；出圖仍可交給 parallel 的子程序池。
+結束的工作保留最近 JOB_HISTORY 個，頁面重新整理後可依工作編號取回結果。
+"""
+
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque
+
+# 同時執行的工作數上限 (整個伺服器程序)
+MAX_JOBS = int(os.environ.get('AQ_MAX_JOBS') or 2)
+
+# 保留的已結束工作數量 (較舊的工作與其結果不再能取回)
+JOB_HISTORY = 20
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """工作被取消 (由 Job.progress 拋出)"""
+
+
+class Job:
+    def __init__(self, job_id, label=None):
+        self.id = job_id
+        self.label = label
+        self.result = None
+        # func 拋出的例外 (state 為 'failed' 時)，供呼叫端判斷錯誤類型
+        self.exception = None
+        self.traceback = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._state = {'state': 'queued', 'percent': 0, 'message': None, 'warnings': [], 'position': None,
+                       'error': None, 'created': time.time(), 'started': None, 'finished': None}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state['state']
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def progress(self, percent, message=None):
+        """回報進度 (message 為 None 時保留上一則訊息)；工作已被取消時拋出 JobCancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            self._state['percent'] = percent
+            if message:
+                self._state['message'] = message
+
+    def warn(self, message):
+        with self._lock:
+            self._state['warnings'].append(message)
+
+    def publish(self, result):
+        """執行中先行提供結果 (state 仍為 'running')；func 的回傳值在結束時取代之"""
+        self.result = result
+
+    def status(self):
+        with self._lock:
+            status = dict(self._state, warnings=list(self._state['warnings']))
+        if status['started'] is None:
+            status['seconds'] = 0.0
+        else:
+            status['seconds'] = (status['finished'] or time.time()) - status['started']
+        return status
+
+    def _update(self, **changes):
+        with self._lock:
+            self._state.update(changes)
+
+
+class JobRunner:
+    def __init__(self, max_jobs=MAX_JOBS, history=JOB_HISTORY):
+        self.max_jobs = max_jobs
+        self.history = history
+        self._jobs = OrderedDict()
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, label=None):
+        """排入工作並回傳工作編號；func(job, *args) 在背景執行緒執行"""
+        job = Job(uuid.uuid4().hex[:12], label)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append((job, func, args))
+            self._prune()
+        self._start_pending()
+        return job.id
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """所有保留中的工作，新的在前"""
+        with self._lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id):
+        """取消工作；排隊中的工作立即結束，執行中的工作在下一次回報進度時中止"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return
+        job._cancel.set()
+        with self._lock:
+            for i, (queued, _, _) in enumerate(self._queue):
+                if queued is job:
+                    del self._queue[i]
+                    job._update(state='cancelled', position=None, finished=time.time())
+                    break
+            self._update_positions()
+
+    def remove(self, job_id):
+        """取消 (若尚未結束) 並移除工作；結果已被清除的工作不應再被取回"""
+        self.cancel(job_id)
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _start_pending(self):
+        with self._lock:
+            while self._queue and self._running < self.max_jobs:
+                job, func, args = self._queue.popleft()
+                self._running += 1
+                job._update(state='running', position=None, started=time.time())
+                threading.Thread(target=self._run, args=(job, func, args), daemon=True,
+                                 name=f'aq-job-{job.id}').start()
+            self._update_positions()
+
+    def _run(self, job, func, args):
+        try:
+            result = func(job, *args)
+        except JobCancelled:
+            job._update(state='cancelled')
+        except Exception as e:
+            job.exception = e
+            job.traceback = traceback.format_exc()
+            job._update(state='failed', error=str(e))
+        else:
+            job.result = result
+            job._update(state='done', percent=100)
+        finally:
+            job._update(finished=time.time())
+            with self._lock:
+                self._running -= 1
+                self._prune()
+            self._start_pending()
+
+    def _update_positions(self):
+        for position, (job, _, _) in enumerate(self._queue, start=1):
+            job._update(position=position)
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self.history, 0)]:
+            del self._jobs[job_id]
+
+
+_job_runner = JobRunner()
+
+
+def get_job_runner():
+    """程序共用的 JobRunner (同時執行上限為 MAX_JOBS)"""
+    return _job_runner
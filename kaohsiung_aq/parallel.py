@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+平行繪圖
+
+插值在主程序完成後，將 (時間區段, 圖表類型, 時段) 的出圖工作分派到子程序池
+(Agg 後端) 執行。make_renderer(jobs) 在 jobs <= 1 時回傳在主程序依序出圖的
+SerialRenderer，兩者介面相同:
+
+    with make_renderer(jobs) as renderer:
+        renderer.submit(filename, site_avg=..., grid_values=..., ...)
+        for filename, png_bytes in renderer.completed():
+            ...
+        for filename, png_bytes in renderer.completed(wait=True):
+            ...
+
+completed() 依完成先後回傳結果 (子程序可能不按提交順序完成)，
+renderer.submitted 保留提交順序，供呼叫端依原順序整理結果。
+"""
+
+import multiprocessing
+import os
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+# 每個子程序最多同時排隊的工作數，限制主程序保留的待繪資料量
+_PENDING_PER_WORKER = 2
+
+
+def default_jobs():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def make_renderer(jobs=1):
+    if jobs is None or jobs <= 1:
+        return SerialRenderer()
+    return ProcessRenderer(jobs)
+
+
+class SerialRenderer:
+    def __init__(self):
+        self.submitted = []
+        self._done = []
+
+    def submit(self, filename, **render_kwargs):
+        self.submitted.append(filename)
+        self._done.append((filename, _render(render_kwargs)))
+
+    def completed(self, wait=False):
+        done, self._done = self._done, []
+        return done
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class ProcessRenderer:
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.submitted = []
+        self._pending = {}
+        self._done = []
+        # spawn: 不複製 Streamlit 主程序的執行緒與狀態，各平台行為一致
+        self._executor = ProcessPoolExecutor(max_workers=jobs,
+                                             mp_context=multiprocessing.get_context('spawn'),
+                                             initializer=_init_worker)
+
+    def submit(self, filename, **render_kwargs):
+        while len(self._pending) >= self.jobs * _PENDING_PER_WORKER:
+            self._collect(block=True)
+
+        # 網格座標以一維軸傳送，於子程序重建 meshgrid，減少序列化資料量
+        grid_lon_mesh = render_kwargs.pop('grid_lon_mesh')
+        grid_lat_mesh = render_kwargs.pop('grid_lat_mesh')
+        render_kwargs['grid_axes'] = (np.asarray(grid_lon_mesh)[0, :], np.asarray(grid_lat_mesh)[:, 0])
+
+        self.submitted.append(filename)
+        self._pending[self._executor.submit(_render, render_kwargs)] = filename
+
+    def completed(self, wait=False):
+        self._collect(block=False)
+        while wait and self._pending:
+            self._collect(block=True)
+        done, self._done = self._done, []
+        return done
+
+    def _collect(self, block):
+        if not self._pending:
+            return
+        finished, _ = wait(list(self._pending), timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in finished:
+            filename = self._pending.pop(future)
+            self._done.append((filename, future.result()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for future in self._pending:
+                future.cancel()
+        self._executor.shutdown(wait=exc_type is None)
+        return False
+
+
+def _init_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+    # 與主程式相同，忽略字型缺字等警告
+    warnings.filterwarnings('ignore')
+
+
+def _render(render_kwargs):
+    from kaohsiung_aq.plotting import render_plot
+
+    if 'grid_axes' in render_kwargs:
+        lon_axis, lat_axis = render_kwargs.pop('grid_axes')
+        render_kwargs['grid_lon_mesh'], render_kwargs['grid_lat_mesh'] = np.meshgrid(lon_axis, lat_axis)
+
+    return render_plot(**render_kwargs).getvalue()
+
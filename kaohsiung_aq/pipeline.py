@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""
+分析流程 (不依賴 Streamlit)
+
+讀取 -> 清理 -> 測站合併 -> 網格/幾何 -> 時間聚合 -> 測站統計 -> 插值 -> 出圖，
+參數與 app.py 側邊欄相同 (見 DEFAULT_PARAMS)。app.py 與命令列共用此流程:
+
+    from kaohsiung_aq.pipeline import make_params, run_pipeline
+    result = run_pipeline(make_params(years=[2020], plot_types=['pm25']))
+    result['images']  # {檔名: PNG bytes}，依提交順序
+
+命令列 (排程批次出圖，圖檔直接寫入輸出目錄；--cube 另外匯出插值網格資料立方體):
+
+    python -m kaohsiung_aq.pipeline --years 2020 --aggregation monthly --plots pm25 --out maps --jobs 4
+    python -m kaohsiung_aq.pipeline --years 2020 2021 --aggregation hourly --cube cubes
+
+各階段經由 StageCache (kaohsiung_aq/cache.py) 取得；cache 為 None 時不保留任何階段結果。
+"""
+
+import argparse
+import sys
+import time
+from contextlib import nullcontext
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kaohsiung_aq.aggregation import (PERIOD_COLUMNS, aggregate_by_time, build_site_table, calendar_features,
+                                      site_averages, table_columns)
+from kaohsiung_aq.basemap import PROVIDERS, has_tiles
+from kaohsiung_aq.cache import StageCache, file_signature, freeze
+from kaohsiung_aq.config import PLOT_CONFIGS, TIME_AGG_MAPPING, TIME_PERIODS
+from kaohsiung_aq.cube import CubeWriter
+from kaohsiung_aq.datastore import (ColumnarStore, filter_period, find_sources, frame_digest, frame_memory_mb,
+                                    has_pyarrow, load_hourly, required_columns, select_sources, to_store_schema)
+from kaohsiung_aq.diffusion import DenseDiffusionModel
+from kaohsiung_aq.geometry import get_geometry
+from kaohsiung_aq.parallel import make_renderer
+from kaohsiung_aq.plotting import interpolate_sites, plot_filename
+from kaohsiung_aq.profiling import Profiler, stage
+from kaohsiung_aq.results import DEFAULT_ZIP_MODE, ZIP_MODES, build_zip
+from kaohsiung_aq.rollup import ROLLUP_AGGREGATIONS, RollupStore
+from kaohsiung_aq.wind import DEFAULT_WIND_MODE, WIND_MODES
+
+# 與側邊欄預設值相同；years/months 與 start/end 擇一 (start/end 不為 None 時使用日期區間)
+DEFAULT_PARAMS = {
+    'data_dir': 'data',
+    'station_file': 'data/Kaohsiung_iot_station.csv',
+    'use_data_cache': True,
+    'compact_schema': False,
+    'use_rollups': True,
+    'years': [2020],
+    'months': list(range(1, 13)),
+    'start': None,
+    'end': None,
+    'time_aggregation': 'monthly',
+    'time_periods': ['all'],
+    'plot_types': ['pm25'],
+    'basemap_style': 'Standard',
+    'alpha': 0.6,
+    'grid_resolution': 300,
+    'radius': 0.05,
+    'wind_influence': 0.3,
+    'wind_mode': DEFAULT_WIND_MODE,
+    'dpi': 150,
+    'interp_memory_mb': 32,
+    'jobs': 1,
+}
+
+BASEMAP_STYLES = list(PROVIDERS) + ['None']
+
+
+class AnalysisError(Exception):
+    """分析條件無法產生結果 (找不到資料、篩選後為空等)，訊息可直接顯示給使用者"""
+
+
+def make_params(**overrides):
+    unknown = set(overrides) - set(DEFAULT_PARAMS)
+    if unknown:
+        raise TypeError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    params = dict(DEFAULT_PARAMS, **overrides)
+    if not params['plot_types']:
+        raise AnalysisError('請至少選擇一種圖表類型')
+    return params
+
+
+def filter_criteria(params):
+    """原流程的時間篩選條件 (依年份/月份 或 日期區間)"""
+    if params['start'] is not None or params['end'] is not None:
+        return {'mode': 'date_range', 'start': params['start'], 'end': params['end']}
+    return {'mode': 'year_month', 'years': params['years'], 'months': params['months']}
+
+
+def years_to_load(criteria):
+    if criteria['mode'] == 'year_month':
+        return criteria['years']
+    return list(range(criteria['start'].year, criteria['end'].year + 1))
+
+
+# ========================================
+# 各階段
+# ========================================
+def clean_stage(df, criteria, compact=False):
+    """
+    依時間條件篩選 (criteria 為 None 時不篩選) 並加入曆法欄位與時間區段代碼 (calendar_features)。
+    compact=True 時另轉為精簡型別 (deviceId 類別、量測欄位 float32)。
+    篩選結果為新的資料表，新增欄位不會改動快取中的資料表。
+    """
+    if criteria is None:
+        df = df.copy()
+    elif criteria['mode'] == 'year_month':
+        df = filter_period(df, years=criteria['years'], months=criteria['months'])
+    else:
+        df = filter_period(df, start=criteria['start'], end=criteria['end'])
+    if compact:
+        df = to_store_schema(df)
+
+    if len(df) == 0:
+        return df
+
+    with stage('calendar'):
+        for col, values in calendar_features(df['timestamp']).items():
+            df[col] = values
+    return df
+
+
+def merge_stage(df, station_file):
+    df_stations = pd.read_csv(station_file)
+    station_coords = df_stations[['deviceId', 'lat', 'lon']].copy()
+    station_coords['deviceId'] = station_coords['deviceId'].astype(str)
+    if isinstance(df['deviceId'].dtype, pd.CategoricalDtype):
+        # 精簡型別: 以相同的類別合併，deviceId 維持類別型別
+        station_coords['deviceId'] = station_coords['deviceId'].astype(df['deviceId'].dtype)
+    df = df.merge(station_coords, on='deviceId', how='left', suffixes=('', '_station'))
+
+    if 'lat_station' in df.columns:
+        df['lat'] = df['lat_station'].fillna(df.get('lat', np.nan))
+        df['lon'] = df['lon_station'].fillna(df.get('lon', np.nan))
+        df = df.drop(columns=['lat_station', 'lon_station'], errors='ignore')
+
+    return df.dropna(subset=['lat', 'lon'])
+
+
+def rollup_prepare(station_file):
+    """RollupStore 彙總每個月份前的處理: 與分析流程相同的曆法欄位與測站合併 (精簡型別)"""
+    return lambda df: merge_stage(clean_stage(df, None, compact=True), station_file)
+
+
+def grid_stage(df, grid_resolution, model):
+    # 建立網格
+    lat_min, lat_max = df['lat'].min() - 0.02, df['lat'].max() + 0.02
+    lon_min, lon_max = df['lon'].min() - 0.02, df['lon'].max() + 0.02
+
+    grid_lat = np.linspace(lat_min, lat_max, grid_resolution)
+    grid_lon = np.linspace(lon_min, lon_max, grid_resolution)
+    grid_lon_mesh, grid_lat_mesh = np.meshgrid(grid_lon, grid_lat)
+
+    # 測站與網格幾何在所有時間區段共用，只計算一次
+    geometry = get_geometry(df, grid_lon_mesh, grid_lat_mesh,
+                            model.radius, model.distance_decay)
+    return (lon_min, lon_max, lat_min, lat_max), grid_lon_mesh, grid_lat_mesh, geometry
+
+
+# ========================================
+# 主流程
+# ========================================
+def run_pipeline(params, cache=None, progress=None, warn=None, on_image=None, keep_images=True, lazy=None,
+                 cube_dir=None, render=True, profiler=None):
+    """
+    依 params (make_params) 執行完整分析並出圖。
+
+    - cache: StageCache；None 時各階段結果不保留
+    - progress(百分比, 訊息或 None)、warn(訊息): 進度與警告回呼
+    - on_image(檔名, PNG bytes): 每張圖完成時呼叫 (平行出圖時不依提交順序)
+    - keep_images: False 時結果不保留圖檔 (由 on_image 自行處理)，減少記憶體用量
+    - lazy: LazyResults (kaohsiung_aq/results.py)；指定時只插值並將出圖參數存入其中，不出圖
+    - cube_dir: 將插值網格逐時間區段寫入此目錄的資料立方體 (kaohsiung_aq/cube.py)
+    - render: False 時不出圖 (只匯出資料立方體)
+    - profiler: Profiler (kaohsiung_aq/profiling.py)；指定時記錄各階段耗時
+
+    回傳 dict: images ({檔名: PNG bytes}，依提交順序)、filenames (提交順序)、cache_stats、
+    cubes (資料立方體路徑)、memory (讀取與清理合併後資料表的記憶體用量 MB，及是否為精簡型別)。
+    無法產生結果時拋出 AnalysisError。
+    """
+    with profiler.activate() if profiler is not None else nullcontext():
+        return _run_pipeline(params, cache, progress, warn, on_image, keep_images, lazy, cube_dir, render)
+
+
+def _run_pipeline(params, cache, progress, warn, on_image, keep_images, lazy, cube_dir, render):
+    progress = progress or (lambda percent, message=None: None)
+    warn = warn or (lambda message: None)
+    cache = cache if cache is not None else StageCache(max_mb=0)
+    cache_stats = {}
+
+    def cached(name, key, compute):
+        # 快取階段名稱同時作為耗時量測的階段名稱 (命中時只計入查詢時間)
+        with stage(name):
+            return cache.get_or_compute(name, key, compute, cache_stats)
+
+    data_dir = params['data_dir']
+    station_file = params['station_file']
+    criteria = filter_criteria(params)
+    plot_types = params['plot_types']
+    time_periods = params['time_periods']
+    time_aggregation = params['time_aggregation']
+
+    # 步驟 1: 讀取資料
+    progress(10, "讀取資料中...")
+
+    # 讀取所有符合 kaohsiung_airbox_hourly_with_wind*.csv 的檔案
+    if not find_sources(data_dir):
+        raise AnalysisError('找不到符合 kaohsiung_airbox_hourly_with_wind*.csv 的資料檔案')
+
+    # 只讀取所選年份的檔案、所選時間範圍的資料與圖表需要的欄位；
+    # 使用快取時經由欄式分區快取 (只在來源檔變動時重新解析 CSV)
+    if criteria['mode'] == 'year_month':
+        load_range = dict(years=criteria['years'], months=criteria['months'])
+    else:
+        load_range = dict(start=criteria['start'], end=criteria['end'])
+
+    use_data_cache = params['use_data_cache']
+    load_columns = required_columns(plot_types)
+    source_files = select_sources(data_dir, years_to_load(criteria))
+    # 增量匯入的資料只影響時間範圍與增量月份重疊的分析 (見 kaohsiung_aq/ingest.py)
+    ingest_revision = ColumnarStore(data_dir).ingest_revision(**load_range) if use_data_cache else ()
+    compact = params['compact_schema']
+    source_key = tuple(file_signature(path) for path in source_files)
+    wind_mode = params['wind_mode']
+    selected_configs = [PLOT_CONFIGS[plot_type] for plot_type in plot_types]
+
+    # 每日以上的時間聚合由預先彙總的 (日期 x 時段 x 測站) 統計計算，不讀取逐時資料 (見 kaohsiung_aq/rollup.py)
+    rollup = None
+    if (params['use_rollups'] and use_data_cache and time_aggregation in ROLLUP_AGGREGATIONS
+            and has_pyarrow()):
+        data_key = ('rollup', freeze(load_range), source_key, ingest_revision, file_signature(station_file),
+                    tuple(time_periods), tuple(plot_types), wind_mode)
+
+        def load_rollup():
+            store = ColumnarStore(data_dir)
+            failed = store.sync(years=years_to_load(criteria),
+                                progress=lambda name: progress(10, f"建立資料快取: {name} ..."))['failed']
+            rollups = RollupStore(store, station_file, rollup_prepare(station_file))
+            rollups.refresh(progress=lambda key: progress(25, f"建立彙總: {key} ..."), **load_range)
+            return rollups.load(time_periods, selected_configs, wind_mode, **load_range), failed
+
+        rollup, failed_files = cached('rollup', data_key, load_rollup)
+    else:
+        data_key = (freeze(load_range), tuple(load_columns), use_data_cache, source_key, ingest_revision, compact)
+
+        def load():
+            return load_hourly(
+                data_dir, columns=load_columns, use_cache=use_data_cache,
+                progress=lambda name: progress(10, f"建立資料快取: {name} ..."),
+                compact=compact, **load_range)
+
+        df, failed_files = cached('load', data_key, load)
+
+    for name, e in failed_files:
+        warn(f"無法讀取檔案 {name}: {e}")
+
+    if failed_files and len(failed_files) == len(source_files):
+        raise AnalysisError('無法從檔案中讀取有效資料')
+
+    if rollup is not None:
+        if len(rollup.sums) == 0:
+            raise AnalysisError('篩選後的資料為空，請檢查時間條件')
+        # 彙總已含時間篩選與測站座標；網格範圍由各測站座標決定
+        df = rollup.stations
+        columns = rollup.columns
+        memory = {'compact': compact, 'source': 'rollup', 'loaded_mb': rollup.nbytes / (1024 * 1024)}
+        memory['working_mb'] = memory['loaded_mb']
+    else:
+        memory = {'compact': compact, 'loaded_mb': frame_memory_mb(df)}
+
+        # 步驟 2: 資料清理與篩選
+        progress(25, "資料清理與篩選...")
+
+        data_key = (data_key, freeze(criteria))
+        df = cached('clean', data_key, lambda: clean_stage(df, criteria, compact))
+
+        if len(df) == 0:
+            raise AnalysisError('篩選後的資料為空，請檢查時間條件')
+
+        # 步驟 3: 建立測站座標
+        progress(40, "建立空間座標系統...")
+
+        data_key = (data_key, file_signature(station_file))
+        df = cached('merge', data_key, lambda: merge_stage(df, station_file))
+        memory['working_mb'] = frame_memory_mb(df)
+        columns = list(df.columns)
+
+    # 步驟 4: 產生圖表
+    progress(50, "正在繪製圖表...")
+
+    basemap_style = params['basemap_style']
+    if basemap_style != 'None' and not has_tiles(basemap_style):
+        warn(f"找不到「{basemap_style}」離線底圖圖磚，將以無底圖方式出圖 "
+             f"(請先執行 python -m kaohsiung_aq.basemap --styles {basemap_style})")
+
+    # 建立模型
+    model = DenseDiffusionModel(
+        radius=params['radius'],
+        wind_influence=params['wind_influence'],
+        distance_decay=3.0,
+        sigma=0.5,
+        max_block_mb=params['interp_memory_mb']
+    )
+
+    grid_resolution = params['grid_resolution']
+    grid_key = (data_key, grid_resolution, model.radius, model.distance_decay)
+    bounds, grid_lon_mesh, grid_lat_mesh, geometry = cached(
+        'grid', grid_key, lambda: grid_stage(df, grid_resolution, model))
+    lon_min, lon_max, lat_min, lat_max = bounds
+
+    # 時間聚合 (時間區段代碼已於清理階段產生)
+    periods_key = (data_key, time_aggregation)
+    if rollup is not None:
+        time_periods_list, label_format = cached(
+            'periods', periods_key, lambda: rollup.periods(time_aggregation))
+
+        def compute_sites():
+            return rollup.site_table(time_aggregation, time_periods, selected_configs, wind_mode)
+    else:
+        groups, time_periods_list, label_format = cached(
+            'periods', periods_key, lambda: aggregate_by_time(df, time_aggregation))
+
+        def compute_sites():
+            return build_site_table(groups.obj, PERIOD_COLUMNS[time_aggregation],
+                                    time_periods, selected_configs, wind_mode)
+
+    # 一次計算所有 (時間區段, 時段, 測站) 的統計值，供各圖表類型共用
+    site_table = cached(
+        'sites', (periods_key, tuple(time_periods),
+                  freeze(table_columns(selected_configs, columns, wind_mode))),
+        compute_sites)
+
+    # 插值結果的鍵: 網格範圍、模型參數與該圖測站資料的內容摘要；出圖設定不影響插值。
+    # 以內容為鍵，增量匯入後只有測站統計值改變的 (時間區段, 時段) 需要重新插值
+    interp_key = (bounds, grid_resolution, model.radius, model.wind_influence,
+                  model.distance_decay, model.sigma)
+
+    # 插值網格匯出: 時間軸為全部時間區段 (沒有有效測站的區段寫入 NaN)
+    cube = None
+    if cube_dir is not None:
+        cube = CubeWriter(cube_dir, [label_format(period) for period in time_periods_list],
+                          grid_lon_mesh[0, :], grid_lat_mesh[:, 0],
+                          attrs=cube_attrs(params, model, criteria, bounds))
+
+    # 產生圖表
+    images = {}
+    total_tasks = len(time_periods_list) * len(plot_types) * len(time_periods)
+    done = [0]
+
+    def task_done(count=1):
+        done[0] += count
+        progress(min(50 + int((done[0] / max(total_tasks, 1)) * 50), 100), None)
+
+    def collect(finished):
+        for filename, png_bytes in finished:
+            if keep_images:
+                images[filename] = png_bytes
+            if on_image is not None:
+                on_image(filename, png_bytes)
+            task_done()
+
+    # 同一 (圖表, 時段) 的多個時間區段以 interpolate_periods 一次批次插值 (共用 geometry)；
+    # 每次處理 period_block 個時間區段，暫存的網格約在插值記憶體上限以內
+    series = [(plot_type, period_key) for plot_type in plot_types
+              if PLOT_CONFIGS[plot_type]['value_col'] in columns for period_key in time_periods]
+    grid_mb = grid_lon_mesh.size * 8 / (1024 * 1024)
+    period_block = max(1, int(params['interp_memory_mb'] // max(grid_mb * len(series), 1e-9)))
+
+    def interpolate_block(period_indices):
+        """{(時間區段索引, 圖表, 時段): (測站資料, 網格)}；沒有有效測站時為 (None, None)"""
+        block = {}
+        for plot_type, period_key in series:
+            plot_config = PLOT_CONFIGS[plot_type]
+            value_col = plot_config['value_col']
+            pending = []
+            for period_index in period_indices:
+                site_avg = site_averages(site_table, time_periods_list[period_index], period_key, plot_config)
+                grid_values = None
+                if site_avg is not None:
+                    key = (interp_key, value_col, plot_config['use_wind'], frame_digest(site_avg))
+                    with stage('interp'):
+                        grid_values = cache.get('interp', key, stats=cache_stats)
+                    if grid_values is None:
+                        pending.append((period_index, site_avg, key))
+                block[(period_index, plot_type, period_key)] = (site_avg, grid_values)
+            if not pending:
+                continue
+
+            with stage('interp'):
+                grids = model.interpolate_periods([site_avg for _, site_avg, _ in pending],
+                                                  grid_lon_mesh, grid_lat_mesh, value_col=value_col,
+                                                  use_wind=plot_config['use_wind'], geometry=geometry)
+                for (period_index, site_avg, key), grid_values in zip(pending, grids):
+                    if grid_values is None:
+                        grid_values = interpolate_sites(site_avg, plot_config, grid_lon_mesh, grid_lat_mesh,
+                                                        model=model, geometry=geometry)
+                    cache.put('interp', key, grid_values)
+                    block[(period_index, plot_type, period_key)] = (site_avg, grid_values)
+        return block
+
+    # 插值在主程序進行，出圖交給 renderer (平行模式下為子程序池，完成順序不固定)；
+    # 延遲出圖時由 LazyResults 接收出圖參數
+    renderer = lazy if lazy is not None else make_renderer(params['jobs'] if render else 1)
+    # 資料立方體在離開時寫入說明檔；中途失敗時保留已寫入的區段，complete 標記為 false
+    with renderer, cube if cube is not None else nullcontext():
+        for block_start in range(0, len(time_periods_list), period_block):
+            period_indices = range(block_start, min(block_start + period_block, len(time_periods_list)))
+            block = interpolate_block(period_indices)
+
+            for period_index in period_indices:
+                period_label = label_format(time_periods_list[period_index])
+
+                for plot_type in plot_types:
+                    plot_config = PLOT_CONFIGS[plot_type]
+
+                    if plot_config['value_col'] not in columns:
+                        task_done(len(time_periods))
+                        continue
+
+                    for period_key in time_periods:
+                        site_avg, grid_values = block.pop((period_index, plot_type, period_key))
+                        if site_avg is None:
+                            if cube is not None:
+                                cube.write(plot_type, period_key, period_index, None, plot_config)
+                            task_done()
+                            continue
+
+                        if cube is not None:
+                            cube.write(plot_type, period_key, period_index, grid_values, plot_config)
+
+                        if not render:
+                            task_done()
+                            continue
+
+                        with stage('render'):
+                            renderer.submit(
+                                plot_filename(plot_type, period_label, period_key),
+                                site_avg=site_avg, grid_values=grid_values,
+                                plot_type=plot_type, plot_config=plot_config,
+                                period_label=period_label,
+                                time_period_key=period_key,
+                                grid_lon_mesh=grid_lon_mesh,
+                                grid_lat_mesh=grid_lat_mesh,
+                                lon_min=lon_min, lon_max=lon_max,
+                                lat_min=lat_min, lat_max=lat_max,
+                                dpi=params['dpi'],
+                                basemap_style=basemap_style,
+                                alpha=params['alpha']
+                            )
+
+                        if lazy is not None:
+                            task_done()
+                        collect(renderer.completed())
+
+        with stage('render'):
+            finished = renderer.completed(wait=True)
+        collect(finished)
+
+    progress(100, None)
+
+    # 依提交順序排列結果
+    filenames = list(renderer.submitted)
+    images = {name: images[name] for name in filenames if name in images}
+    return {'images': images, 'filenames': filenames, 'cache_stats': cache_stats,
+            'cubes': cube.paths if cube is not None else [], 'memory': memory}
+
+
+def cube_attrs(params, model, criteria, bounds):
+    """資料立方體共用的屬性: 模型參數與分析條件"""
+    attrs = {
+        'radius': model.radius,
+        'wind_influence': model.wind_influence,
+        'sigma': model.sigma,
+        'distance_decay': model.distance_decay,
+        'grid_resolution': params['grid_resolution'],
+        'bounds': [float(value) for value in bounds],
+        'time_aggregation': params['time_aggregation'],
+        'wind_mode': params['wind_mode'],
+    }
+    attrs.update((key, value if isinstance(value, list) else str(value))
+                 for key, value in criteria.items())
+    return attrs
+
+
+def memory_summary(memory):
+    """run_pipeline 結果中 memory 的一行摘要"""
+    if memory.get('source') == 'rollup':
+        return f"資料表記憶體 (預先彙總): {memory['loaded_mb']:.1f} MB"
+    mode = '精簡型別' if memory['compact'] else '一般型別'
+    return f"資料表記憶體 ({mode}): 讀取 {memory['loaded_mb']:.1f} MB -> 清理合併後 {memory['working_mb']:.1f} MB"
+
+
+# ========================================
+# 命令列
+# ========================================
+def parse_date(text):
+    return date.fromisoformat(text)
+
+
+def build_parser():
+    defaults = DEFAULT_PARAMS
+    parser = argparse.ArgumentParser(description='批次執行空氣品質分析並輸出圖檔 (不需啟動 Streamlit)')
+    parser.add_argument('--out', help='圖檔輸出目錄 (未指定時不出圖，需指定 --cube)')
+    parser.add_argument('--cube', help='插值網格資料立方體 (.npy + .json) 輸出目錄')
+    parser.add_argument('--data-dir', default=defaults['data_dir'])
+    parser.add_argument('--station-file', default=defaults['station_file'])
+    parser.add_argument('--no-data-cache', action='store_true', help='不使用 Parquet 資料快取，直接讀取 CSV')
+    parser.add_argument('--compact', action='store_true',
+                        help='精簡資料型別 (deviceId 類別、float32、整數時間區段代碼)，減少記憶體用量')
+    parser.add_argument('--no-rollup', action='store_true',
+                        help='每日以上的時間聚合也由逐時資料計算，不使用預先彙總')
+    parser.add_argument('--years', type=int, nargs='+', default=defaults['years'])
+    parser.add_argument('--months', type=int, nargs='+', default=defaults['months'])
+    parser.add_argument('--start', type=parse_date, help='自訂日期區間 (YYYY-MM-DD)，與 --end 一起使用')
+    parser.add_argument('--end', type=parse_date)
+    parser.add_argument('--aggregation', choices=list(TIME_AGG_MAPPING), default=defaults['time_aggregation'])
+    parser.add_argument('--periods', choices=list(TIME_PERIODS), nargs='+', default=defaults['time_periods'],
+                        help='時段')
+    parser.add_argument('--plots', choices=list(PLOT_CONFIGS), nargs='+', default=defaults['plot_types'])
+    parser.add_argument('--basemap', choices=BASEMAP_STYLES, default=defaults['basemap_style'])
+    parser.add_argument('--alpha', type=float, default=defaults['alpha'])
+    parser.add_argument('--resolution', type=int, default=defaults['grid_resolution'])
+    parser.add_argument('--radius', type=float, default=defaults['radius'])
+    parser.add_argument('--wind-influence', type=float, default=defaults['wind_influence'])
+    parser.add_argument('--wind-mode', choices=list(WIND_MODES), default=defaults['wind_mode'])
+    parser.add_argument('--dpi', type=int, default=defaults['dpi'])
+    parser.add_argument('--interp-memory-mb', type=int, default=defaults['interp_memory_mb'])
+    parser.add_argument('--jobs', type=int, default=defaults['jobs'], help='出圖程序數 (1 為主程序依序出圖)')
+    parser.add_argument('--zip', help='另外將輸出的圖檔打包為此 ZIP 檔')
+    parser.add_argument('--zip-mode', choices=list(ZIP_MODES), default=DEFAULT_ZIP_MODE)
+    parser.add_argument('--profile', metavar='JSON', help='將各階段耗時寫入此 JSON 檔，並顯示統計表')
+    parser.add_argument('--profile-memory', action='store_true', help='另外記錄各階段記憶體峰值 (分析較慢)')
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if (args.start is None) != (args.end is None):
+        parser.error('--start 與 --end 需一起指定')
+    if args.start is not None and args.start > args.end:
+        parser.error('開始日期不能晚於結束日期')
+    if args.out is None and args.cube is None:
+        parser.error('請指定 --out 或 --cube')
+    if args.zip and args.out is None:
+        parser.error('--zip 需與 --out 一起使用')
+
+    params = make_params(
+        data_dir=args.data_dir, station_file=args.station_file, use_data_cache=not args.no_data_cache,
+        compact_schema=args.compact, use_rollups=not args.no_rollup, years=args.years, months=args.months, start=args.start, end=args.end,
+        time_aggregation=args.aggregation, time_periods=args.periods, plot_types=args.plots,
+        basemap_style=args.basemap, alpha=args.alpha, grid_resolution=args.resolution,
+        radius=args.radius, wind_influence=args.wind_influence, wind_mode=args.wind_mode,
+        dpi=args.dpi, interp_memory_mb=args.interp_memory_mb, jobs=args.jobs)
+
+    out_dir = Path(args.out) if args.out else None
+    if out_dir is not None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    def write_image(filename, png_bytes):
+        (out_dir / filename).write_bytes(png_bytes)
+
+    def report(percent, message=None):
+        if message:
+            print(message, file=sys.stderr)
+
+    profiler = Profiler(memory=args.profile_memory) if args.profile or args.profile_memory else None
+
+    t0 = time.perf_counter()
+    try:
+        result = run_pipeline(params, progress=report, warn=lambda message: print(message, file=sys.stderr),
+                              on_image=write_image, keep_images=False,
+                              cube_dir=args.cube, render=out_dir is not None, profiler=profiler)
+    except AnalysisError as e:
+        print(f"分析失敗: {e}", file=sys.stderr)
+        return 1
+
+    print(memory_summary(result['memory']), file=sys.stderr)
+    if profiler is not None:
+        print(profiler.format_table(), file=sys.stderr)
+        if args.profile:
+            profiler.write_json(args.profile, params)
+
+    if out_dir is not None:
+        print(f"已輸出 {len(result['filenames'])} 張圖至 {out_dir} ({time.perf_counter() - t0:.1f}s)")
+    if args.cube:
+        print(f"已匯出 {len(result['cubes'])} 個資料立方體至 {args.cube} ({time.perf_counter() - t0:.1f}s)")
+
+    if args.zip:
+        t0 = time.perf_counter()
+        size = build_zip([(name, out_dir / name) for name in result['filenames']], args.zip, args.zip_mode)
+        print(f"已打包 {args.zip} ({size / (1024 * 1024):.2f} MB, {time.perf_counter() - t0:.1f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
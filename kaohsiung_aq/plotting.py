@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+圖表繪製: 插值與 Matplotlib 出圖
+
+generate_plot 為完整流程；prepare_plot (聚合 + 插值) 與 render_plot (出圖)
+拆開，供平行繪圖時在主程序插值、在子程序出圖。render_plot 預設沿用
+RenderTemplate：圖框、色條與底圖只建立一次，之後只替換資料圖層與標題。
+"""
+
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import matplotlib.image as mpl_image
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg, RendererAgg
+from matplotlib.colors import BoundaryNorm, LinearSegmentedColormap
+from matplotlib.figure import Figure
+
+from kaohsiung_aq.aggregation import aggregate_sites
+from kaohsiung_aq.basemap import add_basemap
+from kaohsiung_aq.config import TIME_PERIODS
+from kaohsiung_aq.profiling import stage
+from kaohsiung_aq.wind import DEFAULT_WIND_MODE
+
+# 設定 Matplotlib 字型
+plt.rcParams['font.sans-serif'] = ['Microsoft JhengHei', 'Arial Unicode MS', 'sans-serif']
+plt.rcParams['axes.unicode_minus'] = False
+
+# 每個程序保留的出圖模板數量 (各圖表類型/底圖/DPI 組合)
+TEMPLATE_CACHE_SIZE = 8
+# 模板點陣化畫布高出圖框的比例
+TEMPLATE_TOP_MARGIN = 0.1
+
+_templates = OrderedDict()
+_templates_lock = threading.Lock()
+
+
+# ========================================
+# 產生圖表函數
+# ========================================
+def generate_plot(period_data, plot_type, plot_config, period_label, 
+                 time_period_key='all', grid_lon_mesh=None, grid_lat_mesh=None,
+                 lon_min=None, lon_max=None, lat_min=None, lat_max=None,
+                 model=None, dpi=150, basemap_style='Standard', alpha=0.6, geometry=None):
+    
+    with stage('prepare'):
+        prepared = prepare_plot(period_data, plot_config, grid_lon_mesh, grid_lat_mesh,
+                                model=model, geometry=geometry)
+    if prepared is None:
+        return None
+    
+    site_avg, grid_values = prepared
+    with stage('render'):
+        return render_plot(site_avg, grid_values, plot_type, plot_config, period_label,
+                           time_period_key=time_period_key,
+                           grid_lon_mesh=grid_lon_mesh, grid_lat_mesh=grid_lat_mesh,
+                           lon_min=lon_min, lon_max=lon_max, lat_min=lat_min, lat_max=lat_max,
+                           dpi=dpi, basemap_style=basemap_style, alpha=alpha)
+
+
+def prepare_plot(period_data, plot_config, grid_lon_mesh, grid_lat_mesh, model=None, geometry=None,
+                 wind_mode=DEFAULT_WIND_MODE):
+    """聚合測站並插值，回傳 (site_avg, grid_values)；無有效測站時回傳 None"""
+    site_avg = aggregate_sites(period_data, plot_config, wind_mode)
+    if site_avg is None:
+        return None
+    
+    return site_avg, interpolate_sites(site_avg, plot_config, grid_lon_mesh, grid_lat_mesh,
+                                       model=model, geometry=geometry)
+
+
+def interpolate_sites(site_avg, plot_config, grid_lon_mesh, grid_lat_mesh, model=None, geometry=None):
+    # 執行插值
+    return model.interpolate(site_avg, grid_lon_mesh, grid_lat_mesh, 
+                             value_col=plot_config['value_col'], 
+                             use_wind=plot_config['use_wind'],
+                             geometry=geometry)
+
+
+def render_plot(site_avg, grid_values, plot_type, plot_config, period_label,
+                time_period_key='all', grid_lon_mesh=None, grid_lat_mesh=None,
+                lon_min=None, lon_max=None, lat_min=None, lat_max=None,
+                dpi=150, basemap_style='Standard', alpha=0.6, reuse_template=True):
+    """
+    出圖並回傳 PNG (BytesIO)。reuse_template=True 時沿用同一 (圖表類型, 範圍, 底圖, DPI)
+    的 RenderTemplate，只替換資料圖層與標題 (模板忙碌時改為重建整張圖)；False 時每次重建整張圖。
+    """
+    if reuse_template:
+        template = get_template(plot_type, plot_config, grid_lon_mesh, grid_lat_mesh,
+                                (lon_min, lon_max, lat_min, lat_max), dpi, basemap_style, alpha)
+        buf = template.render(site_avg, grid_values, period_label, time_period_key)
+        if buf is not None:
+            return buf
+    
+    cmap, norm = build_colormap(plot_type, plot_config)
+    
+    # 繪圖
+    fig, ax = plt.subplots(figsize=(14, 12))
+    
+    with stage('draw'):
+        layers = draw_data_layers(ax, site_avg, grid_values, plot_type, plot_config, cmap, norm,
+                                  grid_lon_mesh, grid_lat_mesh, alpha)
+    add_colorbars(fig, ax, plot_type, plot_config, layers)
+    style_axes(ax, lon_min, lon_max, lat_min, lat_max, basemap_style, dpi)
+    
+    ax.set_title(title_text(site_avg, plot_type, plot_config, period_label, time_period_key),
+                 fontsize=14, fontweight='bold', pad=20)
+    
+    fig.tight_layout()
+    
+    # 儲存到記憶體
+    buf = BytesIO()
+    with stage('savefig'):
+        fig.savefig(buf, format='png', dpi=dpi, bbox_inches='tight', 
+                    facecolor='white', edgecolor='none')
+    buf.seek(0)
+    plt.close(fig)
+    
+    return buf
+
+
+# ========================================
+# 出圖元件
+# ========================================
+def build_colormap(plot_type, plot_config):
+    # 建立色階
+    cmap = LinearSegmentedColormap.from_list(plot_type, plot_config['colors'], N=256)
+    norm = BoundaryNorm(plot_config['levels'], cmap.N)
+    return cmap, norm
+
+
+def draw_data_layers(ax, site_avg, grid_values, plot_type, plot_config, cmap, norm,
+                     grid_lon_mesh, grid_lat_mesh, alpha):
+    """繪製隨時間區段變動的圖層，回傳 (等值面, 風場箭頭或測站散點)"""
+    contourf = ax.contourf(grid_lon_mesh, grid_lat_mesh, grid_values,
+                           levels=plot_config['levels'], cmap=cmap, norm=norm, 
+                           extend='both', alpha=alpha, zorder=2)
+    
+    # 處理風場向量圖
+    if plot_type == 'wind_field':
+        u = site_avg['WindSpeed_Mean'] * np.sin(np.deg2rad(site_avg['WindDirection_Mean']))
+        v = site_avg['WindSpeed_Mean'] * np.cos(np.deg2rad(site_avg['WindDirection_Mean']))
+        
+        quiver = ax.quiver(site_avg['lon'], site_avg['lat'], u, v,
+                           site_avg['WindSpeed_Mean'],
+                           cmap='cool',
+                           scale=50,
+                           width=0.003,
+                           headwidth=4,
+                           headlength=5,
+                           alpha=0.8,
+                           zorder=5)
+        return contourf, quiver
+    
+    scatter = ax.scatter(site_avg['lon'], site_avg['lat'],
+                         c=site_avg[plot_config['value_col']],
+                         s=80,
+                         cmap=cmap,
+                         norm=norm,
+                         marker='o',
+                         edgecolors='black',
+                         linewidth=0.8,
+                         alpha=0.9,
+                         zorder=5)
+    return contourf, scatter
+
+
+def add_colorbars(fig, ax, plot_type, plot_config, layers):
+    contourf, markers = layers
+    
+    if plot_type == 'wind_field':
+        cbar1 = fig.colorbar(contourf, ax=ax, fraction=0.046, pad=0.04, shrink=0.4, location='left')
+        cbar1.set_label('PM2.5 (μg/m³)', fontsize=10, fontweight='bold')
+        
+        cbar2 = fig.colorbar(markers, ax=ax, fraction=0.046, pad=0.04, shrink=0.4)
+        cbar2.set_label('風速 (m/s)', fontsize=10, fontweight='bold')
+        return [cbar1, cbar2]
+    
+    cbar = fig.colorbar(contourf, ax=ax, fraction=0.046, pad=0.04, shrink=0.8)
+    cbar.set_label(f'{plot_config["title"]} ({plot_config["unit"]})', 
+                   fontsize=12, fontweight='bold')
+    cbar.ax.tick_params(labelsize=10)
+    return [cbar]
+
+
+def style_axes(ax, lon_min, lon_max, lat_min, lat_max, basemap_style, dpi=150):
+    ax.set_xlim(lon_min, lon_max)
+    ax.set_ylim(lat_min, lat_max)
+    ax.set_aspect('equal', adjustable='box')
+    
+    # 底圖處理 (只使用本機圖磚庫；沒有圖磚時直接改用無底圖樣式，不連線)
+    with stage('basemap'):
+        has_basemap = basemap_style != 'None' and add_basemap(ax, (lon_min, lon_max, lat_min, lat_max),
+                                                              basemap_style, dpi, alpha=0.8, zorder=1)
+    if not has_basemap:
+        ax.set_facecolor('#f0f0f0')
+        ax.grid(True, alpha=0.3, linestyle='--', color='white', linewidth=1.5)
+    
+    # imshow 會調整座標範圍，重新設定
+    ax.set_xlim(lon_min, lon_max)
+    ax.set_ylim(lat_min, lat_max)
+    
+    ax.set_xlabel('經度 (°E)', fontsize=11, fontweight='bold')
+    ax.set_ylabel('緯度 (°N)', fontsize=11, fontweight='bold')
+
+
+def title_text(site_avg, plot_type, plot_config, period_label, time_period_key='all'):
+    value_col = plot_config['value_col']
+    
+    # 標題
+    avg_val = site_avg[value_col].mean()
+    time_period_name = TIME_PERIODS[time_period_key]['name']
+    
+    text = f'{plot_config["title"]}'
+    if time_period_key != 'all':
+        text += f' - {time_period_name}'
+    text += f'\n{period_label}\n'
+    
+    if plot_type == 'wind_field':
+        text += f'平均風速: {site_avg["WindSpeed_Mean"].mean():.1f} m/s'
+    else:
+        text += f'平均: {avg_val:.1f} {plot_config["unit"]} | 測站數: {len(site_avg)}'
+    
+    return text
+
+
+# ========================================
+# 出圖模板
+# ========================================
+class RenderTemplate:
+    """
+    同一 (圖表類型, 範圍, 底圖風格, DPI) 的圖框模板。第一次出圖時完整建立圖框、色階、
+    色條與底圖，之後每張圖只替換等值面/散點/箭頭圖層與標題文字。
+
+    靜態背景 (底圖、座標軸刻度與標籤、色條) 點陣化一次後快取，每張圖還原背景後只繪製
+    資料圖層、標題與座標軸框線 (風場圖另含風速色條)，再依 get_tightbbox 量測的範圍
+    直接裁切畫布編碼 PNG，不再經過 savefig 的完整繪製。標題、風速色條刻度等文字的寬度
+    隨時間區段變動，每張圖仍先還原建立時的 subplotpars 再 tight_layout；版面改變時才
+    重繪背景。輸出尺寸與每次重建整張圖 (reuse_template=False) 相同；裁切起點取整到
+    像素，反鋸齒邊緣可能有不到一個像素的差異。
+
+    模板正由其他工作階段使用時 render 回傳 None，由呼叫端改用每次重建整張圖的出圖，
+    不互相等待。
+    """
+
+    def __init__(self, plot_type, plot_config, grid_lon_mesh, grid_lat_mesh, bounds, dpi,
+                 basemap_style, alpha):
+        self.plot_type = plot_type
+        self.plot_config = plot_config
+        self.grid_lon_mesh = grid_lon_mesh
+        self.grid_lat_mesh = grid_lat_mesh
+        self.bounds = bounds
+        self.dpi = dpi
+        self.basemap_style = basemap_style
+        self.alpha = alpha
+        self.cmap, self.norm = build_colormap(plot_type, plot_config)
+        
+        # 不經 pyplot 建立，避免模板圖框累積在 pyplot 的全域圖框清單
+        self.fig = Figure(figsize=(14, 12))
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        # 排版以建立時的 DPI 量測 (與 plt.subplots 相同)，點陣化改用輸出 DPI (與 savefig 相同)
+        self.layout_dpi = self.fig.dpi
+        self.layers = None
+        self.colorbars = None
+        # tight_layout 之前的 subplotpars (每張圖由此重新排版)
+        self.subplotpars = None
+        self.renderer = None
+        # 快取的靜態背景與其對應的版面
+        self.background = None
+        self.background_key = None
+        self.lock = threading.Lock()
+    
+    def render(self, site_avg, grid_values, period_label, time_period_key='all'):
+        """出圖；模板正被其他出圖使用時回傳 None"""
+        if not self.lock.acquire(blocking=False):
+            return None
+        try:
+            return self._render(site_avg, grid_values, period_label, time_period_key)
+        finally:
+            self.lock.release()
+    
+    def _render(self, site_avg, grid_values, period_label, time_period_key):
+        fig, ax = self.fig, self.ax
+        if self.layers is not None:
+            for artist in self.layers:
+                remove_artist(artist)
+        fig.set_dpi(self.layout_dpi)
+        
+        with stage('draw'):
+            self.layers = draw_data_layers(ax, site_avg, grid_values, self.plot_type, self.plot_config,
+                                           self.cmap, self.norm, self.grid_lon_mesh, self.grid_lat_mesh,
+                                           self.alpha)
+        ax.set_title(title_text(site_avg, self.plot_type, self.plot_config, period_label, time_period_key),
+                     fontsize=14, fontweight='bold', pad=20)
+        
+        if self.colorbars is None:
+            self.colorbars = add_colorbars(fig, ax, self.plot_type, self.plot_config, self.layers)
+            style_axes(ax, *self.bounds, self.basemap_style, self.dpi)
+            pars = fig.subplotpars
+            self.subplotpars = {name: getattr(pars, name)
+                                for name in ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')}
+        else:
+            if self.plot_type == 'wind_field':
+                # 風速色條的範圍隨資料變動
+                self.colorbars[1].update_normal(self.layers[1])
+            # tight_layout 以目前版面為起點，先還原才與新建的圖框結果相同
+            fig.subplots_adjust(**self.subplotpars)
+        fig.tight_layout()
+        
+        with stage('savefig'):
+            fig.set_dpi(self.dpi)
+            renderer = self.get_renderer()
+            # 等同 bbox_inches='tight' 的裁切範圍；資料圖層都裁切在座標軸內，
+            # 只量測座標軸、刻度、標籤與標題 (bbox_extra_artists=[])
+            content_bbox = fig.get_tightbbox(renderer, bbox_extra_artists=[])
+            
+            dynamic = list(self.layers) + [ax.title] + list(ax.spines.values())
+            if self.plot_type == 'wind_field':
+                # 風速色條範圍隨資料變動，與資料圖層一起每張重繪
+                dynamic.append(self.colorbars[1].ax)
+            pars = fig.subplotpars
+            key = (pars.left, pars.right, pars.bottom, pars.top)
+            
+            if key != self.background_key:
+                # 標題隱藏時完整繪製會把標題位置移出圖框，沿用 get_tightbbox 量測時的位置
+                title_position = ax.title.get_position()
+                for artist in dynamic:
+                    artist.set_visible(False)
+                renderer.clear()
+                fig.draw(renderer)
+                for artist in dynamic:
+                    artist.set_visible(True)
+                ax.title.set_position(title_position)
+                self.background = renderer.copy_from_bbox(renderer.bbox)
+                self.background_key = key
+            else:
+                renderer.restore_region(self.background)
+            
+            for artist in sorted(dynamic, key=lambda a: a.get_zorder()):
+                artist.draw(renderer)
+            
+            return self._encode_png(content_bbox, plt.rcParams['savefig.pad_inches'])
+    
+    def get_renderer(self):
+        """
+        點陣化用的 RendererAgg。比圖框高出 TEMPLATE_TOP_MARGIN：Agg 以畫布高度翻轉 y 軸，
+        多出的列落在圖框上緣之外，容納 tight_layout 後仍略超出圖框的標題 (如風場圖)。
+        圖框底色 (白) 一併延伸到上方邊界。
+        """
+        if self.renderer is None:
+            width, height = self.canvas.get_width_height(physical=True)
+            self.renderer = RendererAgg(width, int(height * (1 + TEMPLATE_TOP_MARGIN)), self.dpi)
+            self.fig.patch.set_bounds(0, 0, 1, 1 + TEMPLATE_TOP_MARGIN)
+        return self.renderer
+    
+    def _encode_png(self, content_bbox, pad):
+        """依內容範圍 (英吋) 加上 pad 裁切畫布並編碼 PNG，尺寸取法與 savefig(bbox_inches=...) 相同"""
+        pixels = np.asarray(self.renderer.buffer_rgba())
+        rows, cols = pixels.shape[:2]
+        dpi = self.dpi
+        buf = BytesIO()
+        tight_bbox = content_bbox.padded(pad)
+        if content_bbox.x0 < 0 or content_bbox.y0 < 0 or content_bbox.x1 * dpi > cols or content_bbox.y1 * dpi > rows:
+            # 內容超出畫布，改由 savefig 完整繪製
+            self.fig.savefig(buf, format='png', dpi=dpi, bbox_inches=tight_bbox,
+                             facecolor='white', edgecolor='none')
+            buf.seek(0)
+            return buf
+        
+        # 與 FigureCanvasBase.get_width_height 相同：捨去小數，但容許浮點誤差
+        height = int(tight_bbox.height * dpi + 1e-8)
+        width = int(tight_bbox.width * dpi + 1e-8)
+        left = int(round(tight_bbox.x0 * dpi))
+        top = int(round(rows - height - tight_bbox.y0 * dpi))
+        
+        # pad 超出畫布的部分只有底色
+        image = np.full((height, width, 4), 255, dtype=np.uint8)
+        src = pixels[max(top, 0):max(top + height, 0), max(left, 0):max(left + width, 0)]
+        image[max(-top, 0):max(-top, 0) + src.shape[0], max(-left, 0):max(-left, 0) + src.shape[1]] = src
+        mpl_image.imsave(buf, image, format='png', dpi=dpi)
+        buf.seek(0)
+        return buf
+
+
+def remove_artist(artist):
+    try:
+        artist.remove()
+    except (AttributeError, NotImplementedError, ValueError):
+        # Matplotlib < 3.8 的 ContourSet 需逐一移除其 collections
+        for collection in getattr(artist, 'collections', []):
+            collection.remove()
+
+
+def get_template(plot_type, plot_config, grid_lon_mesh, grid_lat_mesh, bounds, dpi, basemap_style, alpha):
+    """取得 (或建立) 出圖模板；每個程序最多保留 TEMPLATE_CACHE_SIZE 個"""
+    with _templates_lock:
+        return _get_template(plot_type, plot_config, grid_lon_mesh, grid_lat_mesh, bounds, dpi,
+                             basemap_style, alpha)
+
+
+def _get_template(plot_type, plot_config, grid_lon_mesh, grid_lat_mesh, bounds, dpi, basemap_style, alpha):
+    key = (plot_type, tuple(bounds), np.shape(grid_lon_mesh), dpi, basemap_style, alpha)
+    template = _templates.get(key)
+    if template is None or not (np.array_equal(template.grid_lon_mesh, grid_lon_mesh)
+                                and np.array_equal(template.grid_lat_mesh, grid_lat_mesh)):
+        template = RenderTemplate(plot_type, plot_config, grid_lon_mesh, grid_lat_mesh, bounds, dpi,
+                                  basemap_style, alpha)
+        _templates[key] = template
+        while len(_templates) > TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    else:
+        _templates.move_to_end(key)
+    return template
+
+
+def plot_filename(plot_type, period_label, time_period_key='all'):
+    time_period_suffix = '' if time_period_key == 'all' else f'_{time_period_key}'
+    return f"kaohsiung_{plot_type}_{period_label.replace(':', '-').replace(' ', '_')}{time_period_suffix}.png"
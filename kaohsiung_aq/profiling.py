@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+分析流程各階段的耗時量測
+
+Profiler 記錄各階段的呼叫次數、經過時間 (wall)、CPU 時間 (該執行緒) 與
+選擇性的記憶體峰值 (tracemalloc，會使分析變慢)。程式各處以 stage(name) 標記階段，
+未啟用 Profiler 時 stage 不做任何事；巢狀的階段以 '/' 連接名稱 (例如 interp/gaussian_filter):
+
+    profiler = Profiler(memory=False)
+    run_pipeline(params, profiler=profiler)
+    profiler.rows()            # [{'stage', 'calls', 'wall_s', 'cpu_s', 'peak_mb'}, ...]
+    profiler.write_json('profile.json')
+
+Profiler 只記錄啟用它的執行緒；平行出圖時子程序內的出圖細項不會計入，
+render 為主程序提交與等待出圖的時間。
+
+tracemalloc 是整個程序共用的：同時有多個記錄記憶體的 Profiler 啟用時 (例如多個
+Streamlit 工作階段同時分析)，各自的峰值會混入彼此的配置，reset_peak 也會互相干擾，
+因此重疊的 Profiler 都停止記錄記憶體，peak_mb 一律為 None (memory_shared 為 True)。
+"""
+
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+_active = threading.local()
+
+# 目前啟用中、記錄記憶體的 Profiler；tracemalloc 在第一個啟用時開始、最後一個結束時停止
+_memory_lock = threading.Lock()
+_memory_profilers = []
+_memory_started = False
+
+
+def stage(name):
+    """標記一個階段；目前執行緒沒有啟用的 Profiler 時回傳空的 context manager"""
+    profiler = getattr(_active, 'profiler', None)
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name)
+
+
+class Profiler:
+    def __init__(self, memory=False):
+        # tracemalloc.reset_peak 需要 Python 3.9 以上
+        self.memory = memory and hasattr(tracemalloc, 'reset_peak')
+        # 曾與其他記錄記憶體的 Profiler 同時啟用 (記憶體欄位不可信，不再記錄)
+        self.memory_shared = False
+        self.started = None
+        self.wall_s = 0.0
+        self._stats = {}
+        self._stack = []
+
+    @contextmanager
+    def activate(self):
+        """在目前執行緒啟用 (stage() 開始記錄)"""
+        previous = getattr(_active, 'profiler', None)
+        _active.profiler = self
+        if self.memory:
+            self._start_memory()
+        self.started = self.started or datetime.now()
+        t0 = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.wall_s += time.perf_counter() - t0
+            if self.memory:
+                self._stop_memory()
+            _active.profiler = previous
+
+    def _start_memory(self):
+        global _memory_started
+        with _memory_lock:
+            _memory_profilers.append(self)
+            if len(set(_memory_profilers)) > 1:
+                for profiler in _memory_profilers:
+                    profiler.memory_shared = True
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _memory_started = True
+
+    def _stop_memory(self):
+        global _memory_started
+        with _memory_lock:
+            _memory_profilers.remove(self)
+            # 只停止由 Profiler 開始的追蹤 (外部已先啟用的 tracemalloc 保持原狀)
+            if not _memory_profilers and _memory_started:
+                tracemalloc.stop()
+                _memory_started = False
+
+    @contextmanager
+    def stage(self, name):
+        if self._stack:
+            name = f"{self._stack[-1]['name']}/{name}"
+        # 依進入順序登記，外層階段排在其內層之前
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_mb': None}
+        frame = {'name': name, 'peak': 0}
+        if self.memory and not self.memory_shared:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['base'] = current
+        self._stack.append(frame)
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall0
+            cpu = time.thread_time() - cpu0
+            self._stack.pop()
+            stats['calls'] += 1
+            stats['wall_s'] += wall
+            stats['cpu_s'] += cpu
+            if self.memory and not self.memory_shared:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+                # 峰值為此階段期間高於開始時的記憶體用量
+                peak_mb = max(peak - frame['base'], 0) / (1024 * 1024)
+                stats['peak_mb'] = max(stats['peak_mb'] or 0.0, peak_mb)
+
+    def rows(self):
+        """依首次進入順序回傳各階段統計 (memory_shared 時 peak_mb 為 None)"""
+        rows = [dict(stage=name, **stats) for name, stats in self._stats.items()]
+        if self.memory_shared:
+            for row in rows:
+                row['peak_mb'] = None
+        return rows
+
+    def to_dict(self, params=None):
+        result = {
+            'created': (self.started or datetime.now()).isoformat(timespec='seconds'),
+            'wall_s': self.wall_s,
+            'memory': self.memory,
+            'memory_shared': self.memory_shared,
+            'stages': self.rows(),
+        }
+        if params is not None:
+            result['params'] = {key: value if isinstance(value, (bool, int, float, list, type(None))) else str(value)
+                                for key, value in params.items()}
+        return result
+
+    def write_json(self, path, params=None):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(params), f, ensure_ascii=False, indent=1)
+
+    def format_table(self):
+        lines = [f"{'stage':<32} {'calls':>6} {'wall(s)':>9} {'cpu(s)':>9} {'peak(MB)':>9}"]
+        for row in self.rows():
+            peak = '-' if row['peak_mb'] is None else f"{row['peak_mb']:.1f}"
+            lines.append(f"{row['stage']:<32} {row['calls']:>6} {row['wall_s']:>9.3f} {row['cpu_s']:>9.3f} {peak:>9}")
+        lines.append(f"{'total':<32} {'':>6} {self.wall_s:>9.3f}")
+        return '\n'.join(lines)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+漸進預覽 (Progressive Preview)
+
+網格解析度與 DPI 越高，網格幾何、插值與出圖越慢，使用者要等全部完成才看到結果。
+ProgressiveRun 先以較粗的網格 (PREVIEW_RESOLUTION) 與預覽 DPI 執行一次分析並寫入 ResultStore，
+頁面即可顯示預覽；接著以原本的參數重跑，每張圖完成即以同一檔名覆寫 (原地替換)，
+全部完成後才打包 ZIP:
+
+    run = ProgressiveRun(params, store, cache=cache)
+    result = run.run_preview(progress=..., warn=...)   # 預覽圖已寫入 store
+    run.start(background=False, progress=job.progress)
+    run.status()   # {'state': 'refining'/'done'/'failed'/'cancelled', 'done', 'total', 'seconds', 'error'}
+    run.is_refined(name)
+
+精細化與預覽共用同一個 StageCache，讀取、時間聚合與測站統計等階段直接命中，
+只重新計算完整解析度的網格幾何、插值與出圖；完成的網格也留在快取中，
+之後以相同參數執行 (不論是否漸進) 時插值階段直接命中。精細化的結果與一般執行完全相同。
+
+頁面的分析工作 (jobs.py) 以 background=False 在工作中精細化，精細化佔用工作名額直到完成；
+progress 拋出例外 (例如工作被取消的 JobCancelled) 時精細化中止、不打包，例外向外拋出。
+
+粗網格不用來推估細網格: 擴散半徑內的 IDW (距離衰減 3 次方) 在測站附近與各測站半徑邊界
+都有陡峭的變化，以 100 格預覽上採樣後需要局部重算的區域超過八成，不比直接計算快。
+"""
+
+import threading
+import time
+
+from kaohsiung_aq.pipeline import run_pipeline
+from kaohsiung_aq.results import PREVIEW_DPI
+
+# 預覽的網格解析度 (網格幾何與插值成本約與解析度平方成正比)
+PREVIEW_RESOLUTION = 100
+
+
+class RefineCancelled(Exception):
+    """精細化被 cancel() 中止"""
+
+
+class ProgressiveRun:
+    def __init__(self, params, store, cache=None, preview_resolution=PREVIEW_RESOLUTION,
+                 preview_dpi=PREVIEW_DPI):
+        self.params = params
+        self.store = store
+        self.cache = cache
+        self.preview_params = dict(params, grid_resolution=min(params['grid_resolution'], preview_resolution),
+                                   dpi=min(params['dpi'], preview_dpi))
+        self.order = None
+        self._refined = set()
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._state = {'state': 'pending', 'done': 0, 'total': 0, 'seconds': 0.0, 'error': None}
+        self._thread = None
+        self._finished = threading.Event()
+
+    @property
+    def needs_refine(self):
+        return (self.preview_params['grid_resolution'] != self.params['grid_resolution']
+                or self.preview_params['dpi'] != self.params['dpi'])
+
+    def run_preview(self, progress=None, warn=None, profiler=None):
+        """以預覽參數執行分析，圖檔寫入 store；回傳 run_pipeline 的結果"""
+        result = run_pipeline(self.preview_params, cache=self.cache, progress=progress, warn=warn,
+                              on_image=self.store.add, keep_images=False, profiler=profiler)
+        self.order = result['filenames']
+        return result
+
+    def start(self, background=True, progress=None):
+        """
+        開始精細化 (需先 run_preview)；完成或失敗後依預覽的順序打包 ZIP
+        (失敗時包含尚未替換的預覽圖，中止時不打包)。background=False 時在目前執行緒完成才返回。
+        progress(百分比, 訊息) 回報精細化進度，拋出例外時中止精細化並向外拋出該例外。
+        """
+        with self._lock:
+            self._state.update(state='refining', total=len(self.order), started=time.perf_counter())
+
+        if background:
+            self._thread = threading.Thread(target=self._refine, args=(progress,), daemon=True)
+            self._thread.start()
+        else:
+            self._refine(progress)
+
+    def _refine(self, progress=None):
+        aborted = []
+
+        def refine_progress(percent, message=None):
+            if self._cancel.is_set():
+                raise RefineCancelled()
+            if progress is not None:
+                try:
+                    progress(percent, f"精細化: {message}" if message else None)
+                except Exception as e:
+                    aborted.append(e)
+                    raise RefineCancelled()
+
+        def replace(filename, png_bytes):
+            self.store.add(filename, png_bytes)
+            with self._lock:
+                self._refined.add(filename)
+                self._state['done'] = len(self._refined)
+
+        state, error = 'done', None
+        try:
+            if self.needs_refine:
+                # 背景執行緒無法呼叫 Streamlit，警告已在預覽時顯示過
+                run_pipeline(self.params, cache=self.cache, progress=refine_progress, on_image=replace,
+                             keep_images=False)
+        except RefineCancelled:
+            state = 'cancelled'
+        except Exception as e:
+            state, error = 'failed', str(e)
+
+        # 先開始打包再更新狀態，頁面看到精細化結束時 ZIP 已在打包中
+        if state != 'cancelled':
+            self.store.finish(order=self.order)
+        with self._lock:
+            self._state.update(state=state, error=error,
+                               seconds=time.perf_counter() - self._state['started'])
+        self._finished.set()
+        if aborted:
+            raise aborted[0]
+
+    def status(self):
+        with self._lock:
+            status = dict(self._state)
+        if status['state'] == 'refining':
+            status['seconds'] = time.perf_counter() - status['started']
+        status.pop('started', None)
+        return status
+
+    def is_refined(self, filename):
+        with self._lock:
+            return filename in self._refined
+
+    def wait(self, timeout=None):
+        """等待精細化結束 (不論在背景執行緒或呼叫 start 的執行緒中進行)"""
+        if self.status()['state'] == 'refining':
+            self._finished.wait(timeout)
+        return self.status()
+
+    def cancel(self, wait=True):
+        """中止精細化 (在下一張圖完成時生效)；wait=True 時等待精細化結束"""
+        self._cancel.set()
+        if wait:
+            self.wait()
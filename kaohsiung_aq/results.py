@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+分析結果的磁碟暫存 (Result Store) 與 ZIP 打包
+
+每張完成的圖立即寫入暫存目錄，記憶體中只保留檔名與大小的索引，預覽與下載時再從磁碟讀取。
+finish() 後在背景執行緒由磁碟上的圖檔建立 ZIP (依提交順序)，頁面可先顯示預覽:
+
+    store = ResultStore(zip_mode='auto')
+    run_pipeline(params, on_image=store.add, keep_images=False)
+    store.finish(order=result['filenames'])
+    store.filenames, store.read(name)
+    store.zip_status()  # {'state': 'building'/'done'/'failed', 'done', 'total', 'bytes', 'seconds', ...}
+
+打包方式 (ZIP_MODES):
+- 'auto':    已壓縮的格式 (PNG 等) 不壓縮，其他副檔名的檔案壓縮 (目前分析只輸出 PNG，等同 'stored')
+- 'stored':  全部不壓縮
+- 'deflate': 全部壓縮 (舊版行為)
+
+暫存目錄在 cleanup()、物件被回收或程序結束時刪除。
+
+延遲出圖 (LazyResults): 分析時只保留插值網格 (float32)，預覽時才以 PREVIEW_DPI 出圖、
+下載時才以完整 DPI 出圖，出過的圖在 memo_mb 上限內保留:
+
+    lazy = LazyResults(dpi=150)
+    run_pipeline(params, lazy=lazy)
+    lazy.preview(name), lazy.read(name)
+    lazy.export(store.add)  # 全部以完整 DPI 出圖 (例如寫入 ResultStore 後打包 ZIP)
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from kaohsiung_aq.parallel import make_renderer
+
+# 暫存根目錄；未設定時使用系統暫存目錄
+RESULT_ROOT = os.environ.get('AQ_RESULT_DIR') or None
+
+ZIP_NAME = 'kaohsiung_air_quality.zip'
+
+ZIP_MODES = {
+    'auto': '自動 (PNG 不壓縮)',
+    'stored': '不壓縮',
+    'deflate': '壓縮',
+}
+DEFAULT_ZIP_MODE = 'auto'
+
+# 本身已壓縮的格式，再以 deflate 壓縮幾乎不會變小
+COMPRESSED_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.zip', '.gz', '.parquet', '.npz'}
+
+ZIP_LEVEL = 6
+
+# 延遲出圖的預覽解析度 (14x12 吋圖約 1000 像素寬) 與已出圖 PNG 的保留上限
+PREVIEW_DPI = 72
+LAZY_MEMO_MB = 64
+
+
+def should_compress(name, mode):
+    if mode == 'stored':
+        return False
+    if mode == 'auto':
+        return Path(name).suffix.lower() not in COMPRESSED_SUFFIXES
+    return True
+
+
+def build_zip(files, zip_path, mode=DEFAULT_ZIP_MODE, progress=None):
+    """
+    將 files [(封存內檔名, 檔案路徑)] 依序寫入 zip_path (逐檔由磁碟串流寫入，不整個讀入記憶體)。
+    progress(完成數, 總數) 於每個檔案寫入後呼叫。回傳 ZIP 檔大小 (bytes)。
+    """
+    if mode not in ZIP_MODES:
+        raise ValueError(f"Unknown zip mode: {mode}")
+    files = list(files)
+    tmp_path = Path(zip_path).with_name(Path(zip_path).name + '.tmp')
+
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as zf:
+        for i, (name, path) in enumerate(files):
+            compress_type = zipfile.ZIP_DEFLATED if should_compress(name, mode) else zipfile.ZIP_STORED
+            zf.write(path, name, compress_type=compress_type, compresslevel=ZIP_LEVEL)
+            if progress is not None:
+                progress(i + 1, len(files))
+
+    os.replace(tmp_path, zip_path)
+    return Path(zip_path).stat().st_size
+
+
+class ResultStore:
+    def __init__(self, root=RESULT_ROOT, zip_mode=DEFAULT_ZIP_MODE):
+        if zip_mode not in ZIP_MODES:
+            raise ValueError(f"Unknown zip mode: {zip_mode}")
+        if root is not None:
+            Path(root).mkdir(parents=True, exist_ok=True)
+        self.dir = Path(tempfile.mkdtemp(prefix='aq_results_', dir=root))
+        self.image_dir = self.dir / 'images'
+        self.image_dir.mkdir()
+        self.zip_path = self.dir / ZIP_NAME
+        self.zip_mode = zip_mode
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._zip_state = {'state': 'pending', 'done': 0, 'total': 0, 'bytes': 0, 'seconds': 0.0, 'error': None}
+        self._zip_thread = None
+        self._cleanup = weakref.finalize(self, shutil.rmtree, str(self.dir), True)
+
+    @property
+    def filenames(self):
+        return list(self._sizes)
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def __contains__(self, filename):
+        return filename in self._sizes
+
+    def add(self, filename, png_bytes):
+        """寫入單張圖 (可作為 run_pipeline 的 on_image)"""
+        target = self.path(filename)
+        tmp_path = target.with_name(target.name + '.tmp')
+        tmp_path.write_bytes(png_bytes)
+        os.replace(tmp_path, target)
+        with self._lock:
+            self._sizes[filename] = len(png_bytes)
+
+    def finish(self, order=None, background=True):
+        """
+        依 order (例如 run_pipeline 的 filenames) 排列結果並開始打包 ZIP；
+        background=False 時在目前執行緒打包完成才返回。
+        """
+        with self._lock:
+            if order is not None:
+                ordered = {name: self._sizes[name] for name in order if name in self._sizes}
+                ordered.update((name, size) for name, size in self._sizes.items() if name not in ordered)
+                self._sizes = ordered
+            files = [(name, self.path(name)) for name in self._sizes]
+            self._zip_state.update(state='building', total=len(files), started=time.perf_counter())
+
+        if background:
+            self._zip_thread = threading.Thread(target=self._build_zip, args=(files,), daemon=True)
+            self._zip_thread.start()
+        else:
+            self._build_zip(files)
+
+    def _build_zip(self, files):
+        def progress(done, total):
+            with self._lock:
+                self._zip_state['done'] = done
+
+        try:
+            size = build_zip(files, self.zip_path, self.zip_mode, progress)
+        except Exception as e:
+            with self._lock:
+                self._zip_state.update(state='failed', error=str(e))
+            return
+        with self._lock:
+            self._zip_state.update(state='done', bytes=size,
+                                   seconds=time.perf_counter() - self._zip_state['started'])
+
+    def zip_status(self):
+        with self._lock:
+            status = dict(self._zip_state)
+        if status['state'] == 'building':
+            status['seconds'] = time.perf_counter() - status['started']
+        status.pop('started', None)
+        return status
+
+    def wait_zip(self, timeout=None):
+        if self._zip_thread is not None:
+            self._zip_thread.join(timeout)
+        return self.zip_status()
+
+    def path(self, filename):
+        # 檔名由 plot_filename 產生，不含目錄；仍只取最後一段避免寫出暫存目錄
+        return self.image_dir / Path(filename).name
+
+    def read(self, filename):
+        return self.path(filename).read_bytes()
+
+    def cleanup(self):
+        # 背景打包中的檔案被刪除時，打包會失敗並結束
+        self._cleanup()
+
+
+class LazyResults:
+    """
+    延遲出圖的分析結果，介面同 parallel 的 renderer (submit/completed/submitted)，
+    可直接取代 run_pipeline 中的 renderer；submit 時只保存出圖參數，不出圖。
+    """
+
+    def __init__(self, dpi=150, memo_mb=LAZY_MEMO_MB, preview_dpi=PREVIEW_DPI):
+        self.dpi = dpi
+        self.preview_dpi = min(preview_dpi, dpi)
+        self.memo_bytes = int(memo_mb * 1024 * 1024)
+        self.submitted = []
+        self._items = {}
+        self._memo = OrderedDict()
+        self._memo_size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def filenames(self):
+        return list(self._items)
+
+    @property
+    def grid_bytes(self):
+        return sum(item['grid_values'].nbytes for item in self._items.values())
+
+    @property
+    def memo_size(self):
+        return self._memo_size
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, filename):
+        return filename in self._items
+
+    def submit(self, filename, **render_kwargs):
+        # 插值快取中的網格為 float64 且唯讀，另存一份 float32 (色階級距遠大於精度差異)
+        render_kwargs['grid_values'] = np.asarray(render_kwargs['grid_values'], dtype=np.float32)
+        render_kwargs.pop('dpi', None)
+        if filename not in self._items:
+            self.submitted.append(filename)
+        self._items[filename] = render_kwargs
+
+    def completed(self, wait=False):
+        return []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def render(self, filename, dpi=None):
+        """以 dpi (預設完整 DPI) 出圖並回傳 PNG bytes；結果在 memo 上限內保留"""
+        dpi = dpi or self.dpi
+        key = (filename, dpi)
+        with self._lock:
+            png_bytes = self._memo.get(key)
+            if png_bytes is not None:
+                self._memo.move_to_end(key)
+                return png_bytes
+
+        from kaohsiung_aq.plotting import render_plot
+        png_bytes = render_plot(dpi=dpi, **self._items[filename]).getvalue()
+
+        with self._lock:
+            if len(png_bytes) <= self.memo_bytes and key not in self._memo:
+                self._memo[key] = png_bytes
+                self._memo_size += len(png_bytes)
+                while self._memo_size > self.memo_bytes:
+                    _, evicted = self._memo.popitem(last=False)
+                    self._memo_size -= len(evicted)
+        return png_bytes
+
+    def preview(self, filename):
+        return self.render(filename, self.preview_dpi)
+
+    def read(self, filename):
+        return self.render(filename, self.dpi)
+
+    def export(self, on_image, jobs=1, progress=None):
+        """
+        全部以完整 DPI 出圖，每張完成時呼叫 on_image(檔名, PNG bytes) (平行時不依順序)；
+        已保留的圖直接沿用。progress(完成數, 總數)。
+        """
+        total = len(self._items)
+        done = 0
+        with make_renderer(jobs) as renderer:
+            for filename, item in self._items.items():
+                with self._lock:
+                    png_bytes = self._memo.get((filename, self.dpi))
+                if png_bytes is not None:
+                    finished = [(filename, png_bytes)]
+                else:
+                    renderer.submit(filename, dpi=self.dpi, **item)
+                    finished = renderer.completed()
+                for name, data in finished:
+                    on_image(name, data)
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+            for name, data in renderer.completed(wait=True):
+                on_image(name, data)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+
+    def cleanup(self):
+        with self._lock:
+            self._memo.clear()
+            self._memo_size = 0
+        self._items.clear()
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""
+預先彙總的 (日期 x 時段 x 測站) 統計 (Rollup)
+
+每日以上的時間聚合 (daily/weekly/monthly/seasonal/yearly) 原本每次都由逐時資料重新分組。
+RollupStore 將欄式分區快取 (ColumnarStore) 的每個月份彙總一次，存放於快取目錄的 rollup/:
+
+    rollup/manifest.json
+    rollup/2020-01.parquet        各 (date, slot, deviceId) 的可加總統計
+    rollup/2020-01.wind.parquet   各 (date, slot, deviceId, 風向值) 的出現次數 (風向眾數用)
+
+統計欄位皆可直接加總:
+- <欄位>__sum / <欄位>__count: 各量測欄位的總和與有效筆數 (pm25_cv、pm25_exceeds_35_pct 等
+  衍生欄位同樣是逐時值的平均，與直接聚合逐時資料相同)
+- wind_*__sum / wind__count: 風速加權的風向分量 (kaohsiung_aq/wind.py 的 vector_sums)
+- lon / lat: 該日該時段第一筆的座標
+
+TIME_PERIODS 的每個時段各自彙總，任一時段與週、月、季、年都只需加總這些列，不需讀取逐時資料。
+風向眾數不能由總和求得，以風向值的出現次數加總 (風向值重複越多，此表相對逐時資料越小)。
+
+每個月份的版本為其分區 (來源 CSV 與增量) 的內容摘要、測站檔與時段定義；來源變動或增量匯入後，
+下次 refresh 只重新彙總有變動的月份。refresh 可能同時在 Streamlit 與命令列的不同程序中執行，
+manifest 的讀取-修改-寫入在 rollup/.lock 的檔案鎖內進行，檔案以不重複的暫存檔原子替換 (同 datastore)。
+彙總前的處理 (曆法欄位、測站合併) 由呼叫端以 prepare
+傳入，與分析流程相同 (見 kaohsiung_aq/pipeline.py 的 rollup_prepare)。
+
+用法 (預先建立彙總):
+    python -m kaohsiung_aq.rollup [--data-dir data] [--years 2020 2021]
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from kaohsiung_aq.aggregation import (PERIOD_COLUMNS, PERIOD_LABELS, concat_site_tables, period_codes,
+                                      sum_site_table, table_columns)
+from kaohsiung_aq.config import NUMERIC_COLS, TIME_PERIODS
+from kaohsiung_aq.datastore import ColumnarStore, atomic_write, file_sha1, store_lock, write_json
+from kaohsiung_aq.profiling import stage
+from kaohsiung_aq.wind import DEFAULT_WIND_MODE, SUM_COLS, direction_counts, vector_sums
+
+# 彙總格式版本；統計欄位或彙總規則改變時遞增，舊彙總會全部重建
+ROLLUP_VERSION = 2
+
+ROLLUP_DIRNAME = 'rollup'
+
+# 可由彙總回答的時間聚合方式 (逐時仍讀取逐時資料)
+ROLLUP_AGGREGATIONS = ('daily', 'weekly', 'monthly', 'seasonal', 'yearly')
+
+# Streamlit 各工作階段共用同一程序，同一時間只允許一個 refresh；其他程序另以檔案鎖互斥
+_rollup_lock = threading.Lock()
+
+
+def rollup_frame(df):
+    """
+    單一月份的逐時資料 (需含 date、hour、deviceId、lon、lat) -> (統計表, 風向出現次數表或 None)。
+    統計表每列為一個 (date, slot, deviceId)，依時段、日期與測站排序。
+    """
+    value_cols = [col for col in NUMERIC_COLS if col in df.columns and col != 'WindDirection_Mean']
+    work = df[['date', 'hour', 'deviceId', 'lon', 'lat']].copy()
+    for col in value_cols:
+        values = df[col].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        work[f'{col}__sum'] = np.where(valid, values, 0.0)
+        work[f'{col}__count'] = valid.astype(np.int32)
+    if 'WindDirection_Mean' in df.columns and 'WindSpeed_Mean' in df.columns:
+        sums = vector_sums(df['WindDirection_Mean'], df['WindSpeed_Mean'])
+        for col in sums.columns:
+            work[col] = sums[col].to_numpy()
+    has_direction = 'WindDirection_Mean' in df.columns
+    if has_direction:
+        work['WindDirection_Mean'] = df['WindDirection_Mean'].to_numpy()
+
+    stat_cols = [col for col in work.columns if '__' in col]
+    tables, counts = [], []
+    for slot_key, slot in TIME_PERIODS.items():
+        part = work if slot_key == 'all' else work[work['hour'].isin(slot['hours'])]
+        grouped = part.groupby(['date', 'deviceId'], sort=True, observed=True)
+        table = grouped[stat_cols].sum()
+        table[['lon', 'lat']] = grouped[['lon', 'lat']].first()
+        table.insert(0, 'slot', slot_key)
+        tables.append(table.reset_index())
+        if has_direction:
+            slot_counts = direction_counts(part, ['date', 'deviceId'])
+            slot_counts.insert(0, 'slot', slot_key)
+            counts.append(slot_counts)
+
+    sums = pd.concat(tables, ignore_index=True)
+    wind_counts = None
+    if has_direction:
+        wind_counts = pd.concat(counts, ignore_index=True)
+        wind_counts['_count'] = wind_counts['_count'].astype(np.int32)
+    return sums, wind_counts
+
+
+def slot_signature():
+    return sorted((key, slot['hours']) for key, slot in TIME_PERIODS.items())
+
+
+class Rollup:
+    """
+    讀入記憶體的彙總 (RollupStore.load 的結果)。stations 為 'all' 時段中各測站第一筆的座標，
+    columns 為可用的資料欄位 (同逐時資料表的欄位名稱，供 table_columns 判斷)
+    """
+
+    def __init__(self, sums, wind_counts, columns):
+        self.sums = sums
+        self.wind_counts = wind_counts
+        self.columns = list(columns)
+
+    @property
+    def nbytes(self):
+        nbytes = int(self.sums.memory_usage(deep=True).sum())
+        if self.wind_counts is not None:
+            nbytes += int(self.wind_counts.memory_usage(deep=True).sum())
+        return nbytes
+
+    @property
+    def stations(self):
+        rows = self.sums[(self.sums['slot'] == 'all').to_numpy()]
+        return rows.groupby('deviceId', sort=False, observed=True)[['lon', 'lat']].first().reset_index()
+
+    def periods(self, aggregation):
+        """所有時間區段代碼 (排序) 與 label_format，同 aggregate_by_time"""
+        dates = self.sums.loc[(self.sums['slot'] == 'all').to_numpy(), 'date']
+        return np.unique(period_codes(dates, aggregation)).tolist(), PERIOD_LABELS[aggregation]
+
+    def site_table(self, aggregation, slot_keys, plot_configs, wind_mode=DEFAULT_WIND_MODE):
+        """加總彙總列得到與 build_site_table 相同格式的測站統計表"""
+        period_col = PERIOD_COLUMNS[aggregation]
+        group_keys = [period_col, 'deviceId']
+        mean_cols, direction_mode = table_columns(plot_configs, self.columns, wind_mode)
+        stat_cols = [f'{col}__{kind}' for col in mean_cols for kind in ('sum', 'count')]
+        if direction_mode == 'vector':
+            stat_cols += SUM_COLS
+
+        tables = []
+        for slot_key in slot_keys:
+            mask = (self.sums['slot'] == slot_key).to_numpy()
+            if not mask.any():
+                continue
+            rows = self.sums[mask]
+            part = rows[['deviceId', 'lon', 'lat'] + stat_cols].copy()
+            part[period_col] = period_codes(rows['date'], aggregation)
+            # 列已依日期排序，列位置最早者即時段內最早的座標
+            part['_pos'] = np.arange(len(part))
+
+            counts = None
+            if direction_mode == 'mode' and self.wind_counts is not None:
+                slot_counts = self.wind_counts[(self.wind_counts['slot'] == slot_key).to_numpy()]
+                counts = pd.DataFrame({
+                    period_col: period_codes(slot_counts['date'], aggregation),
+                    'deviceId': slot_counts['deviceId'].to_numpy(),
+                    'WindDirection_Mean': slot_counts['WindDirection_Mean'].to_numpy(),
+                    '_count': slot_counts['_count'].to_numpy(),
+                })
+            table = sum_site_table(part, group_keys, mean_cols, direction_mode, counts)
+            table['slot'] = slot_key
+            tables.append(table.reset_index())
+
+        return concat_site_tables(tables, period_col, mean_cols, direction_mode)
+
+
+class RollupStore:
+    def __init__(self, store, station_file, prepare):
+        self.store = store
+        self.station_file = Path(station_file)
+        self.prepare = prepare
+        self.rollup_dir = store.cache_dir / ROLLUP_DIRNAME
+        self.manifest_path = self.rollup_dir / 'manifest.json'
+        self.lock_path = self.rollup_dir / '.lock'
+
+    # ========================================
+    # manifest
+    # ========================================
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+
+        if manifest is None or manifest.get('version') != ROLLUP_VERSION:
+            return {'version': ROLLUP_VERSION, 'months': {}}
+        return manifest
+
+    def write_manifest(self, manifest):
+        """寫入 manifest；呼叫端應持有 lock() 並在鎖內讀取 manifest"""
+        write_json(self.manifest_path, manifest)
+
+    def lock(self):
+        """manifest 讀取-修改-寫入的鎖 (與 ColumnarStore.lock 分開，refresh 期間仍可 sync)"""
+        return store_lock(self.lock_path, _rollup_lock)
+
+    # ========================================
+    # 彙總
+    # ========================================
+    def refresh(self, years=None, months=None, start=None, end=None, progress=None):
+        """
+        重新彙總所選範圍內版本改變的月份，並移除分區已不存在的月份 (需先 ColumnarStore.sync)。
+        progress('YYYY-MM') 在每個需要重新彙總的月份開始前呼叫。
+        回傳摘要 dict: built/kept/removed 為月份清單。
+        """
+        with self.lock():
+            return self._refresh(years, months, start, end, progress)
+
+    def _refresh(self, years, months, start, end, progress):
+        manifest = self.read_manifest()
+        if not manifest['months'] and self.rollup_dir.exists():
+            # 無 manifest (或版本不符) 的舊彙總一律清除
+            for child in self.rollup_dir.glob('*.parquet'):
+                child.unlink()
+
+        summary = {'built': [], 'kept': [], 'removed': []}
+        existing = self.store.month_partitions()
+        for key in sorted(set(manifest['months']) - set(existing)):
+            self._remove(manifest['months'].pop(key))
+            summary['removed'].append(key)
+        if summary['removed']:
+            self.write_manifest(manifest)
+
+        station_sha1 = file_sha1(self.station_file)
+        for key, partitions in sorted(self.store.month_partitions(years, months, start, end).items()):
+            revision = self.revision(partitions, station_sha1)
+            entry = manifest['months'].get(key)
+            if (entry is not None and entry['revision'] == revision
+                    and all((self.rollup_dir / path).exists() for path in entry_paths(entry))):
+                summary['kept'].append(key)
+                continue
+
+            if progress is not None:
+                progress(key)
+            with stage('build'):
+                manifest['months'][key] = self._build(key, revision)
+            summary['built'].append(key)
+            # 每個月份完成後即寫入 manifest，中斷時已完成的月份不需重做
+            self.write_manifest(manifest)
+        return summary
+
+    def revision(self, partitions, station_sha1):
+        digest = hashlib.sha1()
+        digest.update(json.dumps([ROLLUP_VERSION, slot_signature(), station_sha1, partitions]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _build(self, key, revision):
+        year, month = int(key[:4]), int(key[5:])
+        df = self.prepare(self.store.load(years=[year], months=[month], compact=True))
+        entry = {'revision': revision, 'source_rows': len(df), 'rows': 0, 'columns': [],
+                 'path': None, 'wind_path': None}
+        if len(df) == 0:
+            return entry
+
+        sums, wind_counts = rollup_frame(df)
+        entry.update(rows=len(sums), path=f'{key}.parquet',
+                     columns=[col for col in NUMERIC_COLS if col in df.columns])
+        self._write(sums, entry['path'])
+        if wind_counts is not None:
+            entry['wind_path'] = f'{key}.wind.parquet'
+            self._write(wind_counts, entry['wind_path'])
+        return entry
+
+    def _write(self, df, relpath):
+        atomic_write(self.rollup_dir / relpath, lambda tmp_path: df.to_parquet(tmp_path, index=False))
+
+    def _remove(self, entry):
+        for path in entry_paths(entry):
+            target = self.rollup_dir / path
+            if target.exists():
+                target.unlink()
+
+    # ========================================
+    # 讀取
+    # ========================================
+    def columns(self, years=None, months=None, start=None, end=None):
+        """所選範圍內彙總涵蓋的資料欄位 (refresh 之後)"""
+        manifest = self.read_manifest()
+        columns = {'deviceId', 'lon', 'lat'}
+        for key in self.store.month_partitions(years, months, start, end):
+            entry = manifest['months'].get(key)
+            if entry is not None:
+                columns.update(entry['columns'])
+        return [col for col in ['deviceId', 'lon', 'lat'] + NUMERIC_COLS if col in columns]
+
+    def load(self, slot_keys, plot_configs, wind_mode=DEFAULT_WIND_MODE,
+             years=None, months=None, start=None, end=None):
+        """
+        讀取所選範圍的彙總 (refresh 之後)，只包含 slot_keys (與 'all'，供測站座標與時間區段) 時段、
+        所選圖表需要的統計欄位與風向資料；再依年份/月份或日期區間 (date，含端點) 篩選日期。回傳 Rollup。
+        """
+        import pyarrow.parquet as pq
+
+        columns = self.columns(years, months, start, end)
+        mean_cols, direction_mode = table_columns(plot_configs, columns, wind_mode)
+        read_columns = ['slot', 'date', 'deviceId', 'lon', 'lat']
+        read_columns += [f'{col}__{kind}' for col in mean_cols for kind in ('sum', 'count')]
+        if direction_mode == 'vector':
+            read_columns += SUM_COLS
+        slots = sorted(set(slot_keys) | {'all'})
+
+        manifest = self.read_manifest()
+        frames, wind_frames = [], []
+        for key in sorted(self.store.month_partitions(years, months, start, end)):
+            entry = manifest['months'].get(key)
+            if entry is None or entry['path'] is None:
+                continue
+            path = self.rollup_dir / entry['path']
+            names = pq.read_schema(path).names
+            frames.append(pq.read_table(path, columns=[col for col in read_columns if col in names],
+                                        filters=[('slot', 'in', slots)]).to_pandas())
+            if direction_mode == 'mode' and entry['wind_path'] is not None:
+                wind_frames.append(pq.read_table(self.rollup_dir / entry['wind_path'],
+                                                 filters=[('slot', 'in', slots)]).to_pandas())
+
+        sums = select_dates(concat_rollups(frames, read_columns), years, months, start, end)
+        wind_counts = None
+        if wind_frames:
+            wind_counts = select_dates(concat_rollups(wind_frames), years, months, start, end)
+        return Rollup(sums, wind_counts, columns)
+
+
+def entry_paths(entry):
+    return [path for path in (entry['path'], entry['wind_path']) if path is not None]
+
+
+def concat_rollups(frames, columns=None):
+    """串接各月份的彙總；slot 與 deviceId 統一為類別 (各月份的類別不同)"""
+    if not frames:
+        return pd.DataFrame(columns=columns or ['slot', 'date', 'deviceId'])
+    for col in ('slot', 'deviceId'):
+        categories = set()
+        for frame in frames:
+            categories.update(frame[col].astype('category').cat.categories)
+        dtype = pd.CategoricalDtype(sorted(categories))
+        for frame in frames:
+            frame[col] = frame[col].astype(dtype)
+    return pd.concat(frames, ignore_index=True)
+
+
+def select_dates(df, years=None, months=None, start=None, end=None):
+    """依 YYYYMMDD 日期代碼篩選年份、月份與日期區間 (含端點)"""
+    if len(df) == 0:
+        return df
+    dates = df['date'].to_numpy()
+    mask = np.ones(len(df), dtype=bool)
+    if years is not None:
+        mask &= np.isin(dates // 10000, list(years))
+    if months is not None:
+        mask &= np.isin(dates // 100 % 100, list(months))
+    if start is not None:
+        mask &= dates >= start.year * 10000 + start.month * 100 + start.day
+    if end is not None:
+        mask &= dates <= end.year * 10000 + end.month * 100 + end.day
+    return df[mask].reset_index(drop=True)
+
+
+# ========================================
+# 命令列
+# ========================================
+def main(argv=None):
+    from kaohsiung_aq.pipeline import rollup_prepare
+
+    parser = argparse.ArgumentParser(description='預先建立每日以上時間聚合所用的彙總 (需要 pyarrow)')
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--station-file', default='data/Kaohsiung_iot_station.csv')
+    parser.add_argument('--years', type=int, nargs='+', help='只彙總這些年份 (預設全部)')
+    args = parser.parse_args(argv)
+
+    store = ColumnarStore(args.data_dir)
+    t0 = time.perf_counter()
+    failed = store.sync(years=args.years, progress=lambda name: print(f"建立資料快取: {name} ...",
+                                                                        file=sys.stderr))['failed']
+    for name, e in failed:
+        print(f"無法讀取檔案 {name}: {e}", file=sys.stderr)
+
+    rollups = RollupStore(store, args.station_file, rollup_prepare(args.station_file))
+    summary = rollups.refresh(years=args.years, progress=lambda key: print(f"彙總 {key} ...", file=sys.stderr))
+    print(f"彙總完成: 重建 {len(summary['built'])} 個月份、沿用 {len(summary['kept'])} 個、"
+          f"移除 {len(summary['removed'])} 個 ({time.perf_counter() - t0:.1f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+風向/風速的向量化分組統計
+
+測站聚合時 WindDirection_Mean 有兩種統計方式 (WIND_MODES):
+- 'mode':   最常出現的風向 (同次數取最小值)，與原本 x.mode()[0] 相同
+- 'vector': 風速加權的圓形平均風向；另輸出平均 u/v 分量與合成向量長度
+
+兩者都先轉為可加總的量 (出現次數 / 分量總和)，因此可以在任意層級先加總再合併，
+不需要對每個分組呼叫 Python 函式。
+
+u/v 分量沿用出圖的風場箭頭慣例: u = 風速·sin(風向)，v = 風速·cos(風向)。
+"""
+
+import numpy as np
+import pandas as pd
+
+WIND_MODES = {
+    'mode': '最常出現風向',
+    'vector': '風速加權向量平均',
+}
+DEFAULT_WIND_MODE = 'mode'
+
+# 'vector' 模式輸出的欄位 (WindDirection_Mean 之外)
+VECTOR_COLS = ['wind_u', 'wind_v', 'wind_resultant']
+
+# 可加總的分量欄位: 風速加權 sin/cos 總和、單位向量 sin/cos 總和、風速總和、有效筆數
+SUM_COLS = ['wind_su__sum', 'wind_cu__sum', 'wind_sn__sum', 'wind_cn__sum', 'wind_s__sum', 'wind__count']
+
+
+def wind_components(direction, speed):
+    """風向 (度) 與風速 -> (u, v)"""
+    rad = np.deg2rad(direction)
+    return speed * np.sin(rad), speed * np.cos(rad)
+
+
+def vector_sums(direction, speed):
+    """
+    每列的可加總分量 (DataFrame，欄位為 SUM_COLS)。
+    風向或風速為缺值的列各分量為 0，不計入有效筆數。
+    """
+    direction = np.asarray(direction, dtype=np.float64)
+    speed = np.asarray(speed, dtype=np.float64)
+    valid = ~(np.isnan(direction) | np.isnan(speed))
+    rad = np.deg2rad(np.where(valid, direction, 0.0))
+    sin, cos = np.where(valid, np.sin(rad), 0.0), np.where(valid, np.cos(rad), 0.0)
+    speed = np.where(valid, speed, 0.0)
+    return pd.DataFrame({
+        'wind_su__sum': speed * sin,
+        'wind_cu__sum': speed * cos,
+        'wind_sn__sum': sin,
+        'wind_cn__sum': cos,
+        'wind_s__sum': speed,
+        'wind__count': valid.astype(np.int64),
+    })
+
+
+def finalize_vector(sums):
+    """
+    由加總後的分量計算 WindDirection_Mean 與 VECTOR_COLS (index 與 sums 相同)。
+    - 風向: 風速加權合成向量的方向；整組風速皆為 0 時改用單位向量平均
+    - wind_u / wind_v: 平均分量 (m/s)
+    - wind_resultant: 合成向量長度 / 平均風速 (0~1，1 表示風向完全一致)
+    無有效資料的分組皆為 NaN。
+    """
+    count = sums['wind__count'].to_numpy(dtype=np.float64)
+    weight = sums['wind_s__sum'].to_numpy(dtype=np.float64)
+    su, cu = sums['wind_su__sum'].to_numpy(dtype=np.float64), sums['wind_cu__sum'].to_numpy(dtype=np.float64)
+    sn, cn = sums['wind_sn__sum'].to_numpy(dtype=np.float64), sums['wind_cn__sum'].to_numpy(dtype=np.float64)
+
+    calm = weight <= 0
+    x = np.where(calm, sn, su)
+    y = np.where(calm, cn, cu)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        direction = np.rad2deg(np.arctan2(x, y)) % 360
+        resultant = np.hypot(x, y) / np.where(calm, count, weight)
+        mean_u = su / count
+        mean_v = cu / count
+
+    empty = count == 0
+    return pd.DataFrame({
+        'WindDirection_Mean': np.where(empty, np.nan, direction),
+        'wind_u': np.where(empty, np.nan, mean_u),
+        'wind_v': np.where(empty, np.nan, mean_v),
+        'wind_resultant': np.where(empty, np.nan, resultant),
+    }, index=sums.index)
+
+
+def direction_counts(df, keys):
+    """各 (keys, 風向值) 的出現次數 (欄位 '_count')，供 counts_to_mode 取眾數"""
+    return (df.groupby(keys + ['WindDirection_Mean'], sort=False, observed=True)
+            .size().rename('_count').reset_index())
+
+
+def counts_to_mode(counts, keys):
+    """
+    由 direction_counts (可先過濾/加總) 取各組眾數，回傳以 keys 為 index 的 Series。
+    同次數取最小風向，與 Series.mode()[0] 相同；沒有任何有效風向的組不會出現。
+    """
+    counts = counts.groupby(keys + ['WindDirection_Mean'], sort=False, observed=True)['_count'].sum()
+    counts = counts.reset_index().sort_values(['_count', 'WindDirection_Mean'], ascending=[False, True],
+                                              kind='stable')
+    return counts.drop_duplicates(keys).set_index(keys)['WindDirection_Mean']
+
+
+def wind_stats(df, keys, mode=DEFAULT_WIND_MODE):
+    """
+    依 keys 分組計算風向統計 (一次 groupby，不呼叫逐組 Python 函式)。
+    'mode' 回傳 WindDirection_Mean；'vector' 另含 VECTOR_COLS。
+    """
+    if mode == 'mode':
+        index = df.groupby(keys, sort=True, observed=True).size().index
+        modes = counts_to_mode(direction_counts(df, keys), keys)
+        return pd.DataFrame({'WindDirection_Mean': modes.reindex(index).to_numpy(dtype=np.float64)}, index=index)
+    if mode == 'vector':
+        sums = vector_sums(df['WindDirection_Mean'], df['WindSpeed_Mean'])
+        for key in keys:
+            sums[key] = df[key].to_numpy()
+        return finalize_vector(sums.groupby(keys, sort=True, observed=True)[SUM_COLS].sum())
+    raise ValueError(f"Unknown wind mode: {mode}")
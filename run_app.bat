@@ -125,7 +125,7 @@ echo [2/3] 檢查必要套件...
 if errorlevel 1 (
     echo [安裝] 找不到必要套件，正在安裝...
     echo.
-    echo 正在安裝: streamlit pandas numpy matplotlib scipy contextily pillow
+    echo 正在安裝: streamlit pandas numpy matplotlib scipy pillow pyarrow
     echo 請稍候，這可能需要幾分鐘...
     echo.
     
@@ -133,14 +133,14 @@ if errorlevel 1 (
     !PYTHON_CMD! -m pip install --upgrade pip
     
     REM 安裝套件
-    !PYTHON_CMD! -m pip install streamlit pandas numpy matplotlib scipy contextily pillow
+    !PYTHON_CMD! -m pip install streamlit pandas numpy matplotlib scipy pillow pyarrow
     
     if errorlevel 1 (
         echo.
         echo [錯誤] 套件安裝失敗
         echo.
         echo 請嘗試手動安裝：
-        echo !PYTHON_CMD! -m pip install streamlit pandas numpy matplotlib scipy contextily pillow
+        echo !PYTHON_CMD! -m pip install streamlit pandas numpy matplotlib scipy pillow pyarrow
         echo.
         echo 或檢查：
         echo 1. 網路連線是否正常
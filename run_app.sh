@@ -148,13 +148,13 @@ if ! $PYTHON_EXE -c "import streamlit, pandas, numpy, matplotlib, scipy" &> /dev
     if [[ -f "requirements.txt" ]]; then
         $PYTHON_EXE -m pip install -r requirements.txt
     else
-        $PYTHON_EXE -m pip install streamlit pandas numpy matplotlib scipy contextily pillow
+        $PYTHON_EXE -m pip install streamlit pandas numpy matplotlib scipy pillow pyarrow
     fi
     
     if [[ $? -ne 0 ]]; then
         echo -e "${RED}[錯誤]${NC} 套件安裝失敗"
         echo "請檢查網路連線或手動執行："
-        echo "  $PYTHON_EXE -m pip install streamlit pandas numpy matplotlib scipy contextily pillow"
+        echo "  $PYTHON_EXE -m pip install streamlit pandas numpy matplotlib scipy pillow pyarrow"
         exit 1
     fi
 fi
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""測試共用的合成資料 (測站座標取自 data/Kaohsiung_iot_station.csv)"""
+
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+STATION_FILE = ROOT / 'data' / 'Kaohsiung_iot_station.csv'
+
+
+def make_sites(seed=0):
+    """所有測站的單一時間區段統計值，含少量缺值"""
+    rng = np.random.default_rng(seed)
+    sites = pd.read_csv(STATION_FILE)[['deviceId', 'lat', 'lon']]
+    sites['deviceId'] = sites['deviceId'].astype(str)
+    n = len(sites)
+    sites['pm25_mean'] = rng.gamma(4.0, 5.0, n)
+    sites['WindDirection_Mean'] = rng.uniform(0, 360, n)
+    sites['WindSpeed_Mean'] = rng.gamma(2.0, 1.2, n)
+    sites.loc[rng.choice(n, n // 20, replace=False), 'pm25_mean'] = np.nan
+    sites.loc[rng.choice(n, n // 20, replace=False), 'WindSpeed_Mean'] = np.nan
+    return sites
+
+
+def make_grid(sites, resolution):
+    grid_lat = np.linspace(sites['lat'].min() - 0.02, sites['lat'].max() + 0.02, resolution)
+    grid_lon = np.linspace(sites['lon'].min() - 0.02, sites['lon'].max() + 0.02, resolution)
+    return np.meshgrid(grid_lon, grid_lat)
+
+
+def make_hourly(start, hours, n_stations=20, seed=0):
+    """前 n_stations 個測站的逐時資料 (欄位同 kaohsiung_airbox_hourly_with_wind*.csv)"""
+    rng = np.random.default_rng(seed)
+    stations = pd.read_csv(STATION_FILE)['deviceId'].astype(str).head(n_stations)
+    index = pd.MultiIndex.from_product([pd.date_range(start, periods=hours, freq='h'), stations],
+                                       names=['timestamp', 'deviceId'])
+    df = index.to_frame(index=False)[['deviceId', 'timestamp']]
+    n = len(df)
+    df['pm25_mean'] = rng.gamma(4.0, 5.0, n).round(2)
+    df['pm25_std'] = rng.gamma(2.0, 2.0, n).round(3)
+    df['pm25_cv'] = (df['pm25_std'] / df['pm25_mean'] * 100).round(2)
+    df['pm25_exceeds_35_pct'] = np.where(df['pm25_mean'] > 35, 100.0, 0.0)
+    df['temperature_mean'] = rng.normal(22, 4, n).round(2)
+    df['humidity_mean'] = rng.uniform(50, 95, n).round(1)
+    df['discomfort_index_mean'] = (df['temperature_mean'] - 0.55 * (1 - df['humidity_mean'] / 100)
+                                   * (df['temperature_mean'] - 14.5)).round(2)
+    df['WindSpeed_Mean'] = rng.gamma(2.0, 1.2, n).round(2)
+    # 風向取整數度，眾數才有重複值
+    df['WindDirection_Mean'] = rng.integers(0, 36, n) * 10.0
+    for col in ('pm25_mean', 'temperature_mean', 'WindSpeed_Mean'):
+        df.loc[rng.random(n) < 0.03, col] = np.nan
+    return df
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """含 2020 年 1-2 月逐時資料與測站檔的資料目錄"""
+    directory = tmp_path / 'data'
+    directory.mkdir()
+    shutil.copy(STATION_FILE, directory / STATION_FILE.name)
+    make_hourly('2020-01-01', 24 * 60).to_csv(directory / 'kaohsiung_airbox_hourly_with_wind_2020.csv',
+                                              index=False)
+    return directory
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""欄式分區快取: 與直接解析 CSV 相同，增量匯入覆蓋同一 (deviceId, timestamp) 並可移除"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_hourly
+from kaohsiung_aq.datastore import ColumnarStore, clean_hourly, load_hourly
+from kaohsiung_aq.ingest import ingest_delta
+
+pytest.importorskip('pyarrow')
+
+KEY = ['deviceId', 'timestamp']
+
+
+def sorted_frame(df):
+    return df.sort_values(KEY).reset_index(drop=True)
+
+
+def assert_frames_close(actual, expected):
+    actual, expected = sorted_frame(actual), sorted_frame(expected)
+    assert list(actual.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(actual[KEY], expected[KEY])
+    # 分區以 float32 保存
+    for col in actual.columns.difference(KEY):
+        np.testing.assert_allclose(actual[col], expected[col], rtol=1e-6, err_msg=col)
+
+
+def test_round_trip_matches_csv(data_dir):
+    csv_df, failed = load_hourly(data_dir, use_cache=False)
+    assert not failed
+    store = ColumnarStore(data_dir)
+    assert store.sync()['failed'] == []
+
+    cached = store.load()
+    assert_frames_close(cached, csv_df)
+    assert dict(cached.dtypes) == dict(csv_df.dtypes)
+
+    february = store.load(years=[2020], months=[2], columns=['pm25_mean'])
+    assert list(february.columns) == ['pm25_mean']
+    assert len(february) == (csv_df['timestamp'].dt.month == 2).sum()
+
+
+def test_ingest_overrides_and_remove_restores(data_dir, tmp_path):
+    store = ColumnarStore(data_dir)
+    store.sync()
+    before = store.load()
+
+    # 改寫 2 月的部分列並新增 3 月的資料
+    original = pd.read_csv(next(data_dir.glob('kaohsiung_airbox_hourly_with_wind_*.csv')))
+    changed = original[original['timestamp'].str.startswith('2020-02-1')].head(50).copy()
+    changed['pm25_mean'] = 123.0
+    delta = pd.concat([changed, make_hourly('2020-03-01', 24, seed=1)], ignore_index=True)
+    delta_path = tmp_path / 'delta.csv'
+    delta.to_csv(delta_path, index=False)
+
+    report = ingest_delta(data_dir, delta_path)
+    assert not report['skipped']
+    assert report['months'] == ['2020-02', '2020-03']
+    assert ingest_delta(data_dir, delta_path)['skipped']
+    assert len(store.ingested()) == 1
+    assert [key for key, _, _ in store.ingest_revision(years=[2020], months=[1])] == []
+
+    after = store.load()
+    assert len(after) == len(before) + 24 * 20
+    expected = before.set_index(KEY)
+    expected.loc[clean_hourly(changed).set_index(KEY).index, 'pm25_mean'] = 123.0
+    expected = pd.concat([expected.reset_index(), clean_hourly(make_hourly('2020-03-01', 24, seed=1))])
+    assert_frames_close(after, expected[after.columns])
+
+    store.remove_ingested([report['seq']])
+    assert store.ingested() == []
+    assert_frames_close(store.load(), before)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""插值引擎一致性: loop / vectorized / sparse / 幾何快取，以及批次與逐張插值"""
+
+import numpy as np
+import pytest
+
+from conftest import make_grid, make_sites
+from kaohsiung_aq.diffusion import ENGINES, DenseDiffusionModel
+from kaohsiung_aq.geometry import get_geometry
+
+# 各引擎只差在浮點運算順序 (實測約 5e-14)
+ATOL = 1e-12
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('use_wind', [False, True])
+def test_engines_agree(seed, use_wind):
+    sites = make_sites(seed)
+    grid_lon, grid_lat = make_grid(sites, 60)
+    reference = DenseDiffusionModel(engine='loop').interpolate(sites, grid_lon, grid_lat, use_wind=use_wind)
+
+    for engine in ENGINES[1:]:
+        result = DenseDiffusionModel(engine=engine).interpolate(sites, grid_lon, grid_lat, use_wind=use_wind)
+        np.testing.assert_allclose(result, reference, rtol=0, atol=ATOL, err_msg=engine)
+
+    model = DenseDiffusionModel()
+    geometry = get_geometry(sites, grid_lon, grid_lat, model.radius, model.distance_decay)
+    result = model.interpolate(sites, grid_lon, grid_lat, use_wind=use_wind, geometry=geometry)
+    np.testing.assert_allclose(result, reference, rtol=0, atol=ATOL, err_msg='geometry')
+
+
+@pytest.mark.parametrize('use_wind', [False, True])
+def test_batch_matches_per_period(use_wind):
+    periods = [make_sites(seed) for seed in range(5)]
+    # 缺少部分測站的時間區段
+    periods[2] = periods[2].iloc[::2].reset_index(drop=True)
+    grid_lon, grid_lat = make_grid(periods[0], 50)
+    # 每段只容納約兩個時間區段，確認分段結果相同
+    model = DenseDiffusionModel(max_block_mb=50 * 50 * 8 * 6 * 2 / (1024 * 1024))
+    geometry = get_geometry(periods[0], grid_lon, grid_lat, model.radius, model.distance_decay)
+
+    expected = [model.interpolate(sites, grid_lon, grid_lat, use_wind=use_wind, geometry=geometry)
+                for sites in periods]
+    grids = model.interpolate_periods(periods, grid_lon, grid_lat, use_wind=use_wind, geometry=geometry)
+    assert all(grid is not None for grid in grids)
+    np.testing.assert_allclose(np.stack(grids), np.stack(expected), rtol=0, atol=ATOL)
+
+    values = np.full((len(periods), len(geometry.station_ids)), np.nan)
+    for row, sites in enumerate(periods):
+        values[row, geometry.indexer(sites)] = sites['pm25_mean']
+    wind = {}
+    if use_wind:
+        for name in ('WindDirection_Mean', 'WindSpeed_Mean'):
+            matrix = np.full_like(values, np.nan)
+            for row, sites in enumerate(periods):
+                matrix[row, geometry.indexer(sites)] = sites[name]
+            wind[name] = matrix
+    stack = model.interpolate_batch(values, geometry, wind.get('WindDirection_Mean'), wind.get('WindSpeed_Mean'),
+                                    max_chunk_mb=model.max_block_mb)
+    np.testing.assert_allclose(stack, np.stack(expected), rtol=0, atol=ATOL)
+
+
+def test_periods_without_geometry_fall_back():
+    sites = make_sites(0)
+    grid_lon, grid_lat = make_grid(sites, 30)
+    model = DenseDiffusionModel()
+    assert model.interpolate_periods([sites], grid_lon, grid_lat, geometry=None) == [None]
+
+    geometry = get_geometry(sites.iloc[1:], grid_lon, grid_lat, model.radius, model.distance_decay)
+    # 第一個測站不在幾何物件內
+    assert model.interpolate_periods([sites], grid_lon, grid_lat, geometry=geometry) == [None]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""每日以上的時間聚合: 由彙總 (RollupStore) 計算與直接聚合逐時資料的插值結果相同"""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+from kaohsiung_aq.config import PLOT_CONFIGS
+from kaohsiung_aq.cube import open_cube
+from kaohsiung_aq.pipeline import make_params, run_pipeline
+
+pytest.importorskip('pyarrow')
+
+
+def run_cubes(data_dir, cube_dir, **overrides):
+    params = make_params(data_dir=str(data_dir), station_file=str(data_dir / 'Kaohsiung_iot_station.csv'),
+                         plot_types=list(PLOT_CONFIGS), time_periods=['all', 'night'], grid_resolution=30,
+                         **overrides)
+    result = run_pipeline(params, cube_dir=cube_dir, render=False)
+    cubes = {}
+    for path in result['cubes']:
+        values, meta = open_cube(path)
+        cubes[path.name] = (np.array(values), meta['time'])
+    return cubes, result['memory']
+
+
+@pytest.mark.parametrize('aggregation', ['daily', 'weekly', 'monthly'])
+@pytest.mark.parametrize('wind_mode', ['mode', 'vector'])
+@pytest.mark.parametrize('period', [dict(years=[2020], months=[1, 2]),
+                                    dict(start=date(2020, 1, 20), end=date(2020, 2, 10))])
+def test_rollup_matches_raw(data_dir, tmp_path, aggregation, wind_mode, period):
+    raw, raw_memory = run_cubes(data_dir, tmp_path / 'raw', time_aggregation=aggregation, wind_mode=wind_mode,
+                                use_rollups=False, **period)
+    rolled, memory = run_cubes(data_dir, tmp_path / 'rollup', time_aggregation=aggregation,
+                               wind_mode=wind_mode, use_rollups=True, **period)
+    assert raw_memory.get('source') != 'rollup'
+    assert memory['source'] == 'rollup'
+
+    assert raw.keys() == rolled.keys()
+    for name, (values, times) in raw.items():
+        assert rolled[name][1] == times, name
+        # 兩條路徑讀取相同的分區，只差在加總順序
+        np.testing.assert_allclose(rolled[name][0], values, rtol=1e-4, atol=1e-4, equal_nan=True, err_msg=name)